@@ -4,7 +4,8 @@ from django.contrib import messages
 from .models import (
     CustomUser, Account, Deposit, ShareTransaction, LoginActivity,
     Borrower, Loan, Payment, RepaymentSchedule, Report, NationalIDVerification,
-    University, Course, PushSubscription, PushNotification
+    University, Course, PushSubscription, PushNotification, MemberSummary, BackgroundJob,
+    LedgerTransaction, LedgerEntry, WebhookEvent, ReportRun, ReportDeletion
 )
 
 # Register your models here.
@@ -86,7 +87,6 @@ class CustomUserAdmin(UserAdmin):
         ('Preferences', {'fields': ('email_notifications', 'sms_notifications', 'transaction_alerts', 'loan_reminders', 'marketing_emails', 'push_notifications_enabled', 'language', 'currency', 'two_factor_auth')}),
     )
 
-admin.site.register(Account)
 admin.site.register(Deposit)
 admin.site.register(ShareTransaction)
 admin.site.register(LoginActivity)
@@ -95,9 +95,51 @@ admin.site.register(Loan)
 admin.site.register(Payment)
 admin.site.register(RepaymentSchedule)
 admin.site.register(Report)
+admin.site.register(ReportRun)
+admin.site.register(ReportDeletion)
 admin.site.register(NationalIDVerification)
 
 
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    list_display = ['account_number', 'user', 'account_type', 'balance', 'date_created']
+    search_fields = ['account_number', 'user__username', 'user__email']
+    # Balances only change through ledger postings (api/ledger.py)
+    readonly_fields = ['balance']
+
+
+class LedgerEntryInline(admin.TabularInline):
+    model = LedgerEntry
+    extra = 0
+    can_delete = False
+    readonly_fields = ['account', 'book', 'amount', 'balance_after', 'created_at']
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LedgerTransaction)
+class LedgerTransactionAdmin(admin.ModelAdmin):
+    list_display = ['reference', 'kind', 'description', 'created_at']
+    search_fields = ['reference', 'description']
+    list_filter = ['kind', 'created_at']
+    readonly_fields = ['reference', 'kind', 'description', 'created_at']
+    inlines = [LedgerEntryInline]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MemberSummary)
+class MemberSummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_savings', 'active_loans_count', 'active_loans_amount', 'dividends_ytd', 'deposits_30d', 'updated_at']
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['updated_at']
+
+
 @admin.register(PushSubscription)
 class PushSubscriptionAdmin(admin.ModelAdmin):
     list_display = ['user', 'endpoint_preview', 'is_active', 'created_at']
@@ -135,3 +177,45 @@ class PushNotificationAdmin(admin.ModelAdmin):
         return f'<span style="background-color: {color}; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">{obj.status}</span>'
     status_badge.short_description = 'Status'
     status_badge.allow_tags = True
+
+
+def retry_jobs(modeladmin, request, queryset):
+    """Admin action to requeue failed background jobs"""
+    from django.utils import timezone
+    updated = queryset.exclude(status='RUNNING').update(
+        status='PENDING', attempts=0, run_at=timezone.now(), locked_until=None, finished_at=None
+    )
+    messages.success(request, f"✅ Requeued {updated} job(s)")
+
+retry_jobs.short_description = "Retry selected jobs"
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'finished_at']
+    search_fields = ['name', 'last_error']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'updated_at', 'finished_at', 'locked_until', 'locked_by', 'last_error']
+    list_per_page = 50
+    actions = [retry_jobs]
+
+
+
+def replay_webhook_events(modeladmin, request, queryset):
+    """Admin action to reprocess stored webhook events"""
+    from .webhooks import replay
+    replayed = replay(event_ids=list(queryset.values_list('pk', flat=True)))
+    messages.success(request, f"✅ Replayed {replayed} event(s)")
+
+replay_webhook_events.short_description = "Replay selected events"
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'provider', 'reference', 'status', 'deliveries', 'attempts', 'received_at', 'processed_at']
+    search_fields = ['reference', 'event_key']
+    list_filter = ['provider', 'status', 'received_at']
+    readonly_fields = ['provider', 'event_key', 'reference', 'payload', 'signature_timestamp', 'deliveries',
+                       'attempts', 'last_error', 'received_at', 'processed_at']
+    list_per_page = 50
+    actions = [replay_webhook_events]
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import tasks  # noqa: F401  (registers background job handlers)
+        from .utils import email_templates
+
+        email_templates.load()
@@ -0,0 +1,428 @@
+"""
+Deposit settlement and reconciliation
+
+Relworx reports the outcome of a mobile money deposit through the webhook.
+Deposits that are still PENDING are reconciled by a background poller
+(`python manage.py poll_pending_deposits`) on an exponential schedule: each
+pass resolves a batch of due deposits against a single transaction history
+call, and only falls back to per-reference status checks for the few the
+history does not cover. VerifyDepositView reads the local row and only asks
+Relworx itself once a deposit has been pending for a while.
+
+complete_deposit() and fail_deposit() (fail_deposits() in bulk) are the only
+places a deposit changes state, so the webhook, the poller and member polls
+can race safely. Credits are posted through api.ledger.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .utils import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUCCESS_STATUSES = ('success', 'successful', 'completed')
+FAILED_STATUSES = ('failed', 'cancelled', 'canceled', 'declined', 'expired')
+# Span of get_transaction_history(); older deposits cannot be found in it
+HISTORY_WINDOW = timedelta(days=30)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def first_check_at(now=None):
+    """When a newly initiated deposit should first be reconciled"""
+    return (now or timezone.now()) + timedelta(seconds=_setting('DEPOSIT_POLL_BASE_DELAY', 15))
+
+
+def next_check_delay(attempts):
+    """Seconds until the next reconciliation of a deposit checked `attempts` times"""
+    base = _setting('DEPOSIT_POLL_BASE_DELAY', 15)
+    cap = _setting('DEPOSIT_POLL_MAX_DELAY', 30 * 60)
+    return min(cap, base * 2 ** attempts)
+
+
+def normalize_status(provider_status):
+    """Map a Relworx status string to 'success', 'failed' or None (still pending)"""
+    provider_status = (provider_status or '').lower()
+    if provider_status in SUCCESS_STATUSES:
+        return 'success'
+    if provider_status in FAILED_STATUSES:
+        return 'failed'
+    return None
+
+
+def index_history(history_data):
+    """
+    Index a get_transaction_history() payload by customer reference (our tx_ref).
+
+    Returns:
+        dict: tx_ref -> transaction dict
+    """
+    if isinstance(history_data, dict):
+        transactions = history_data.get('transactions') or history_data.get('data') or []
+    else:
+        transactions = history_data or []
+
+    return {
+        txn['customer_reference']: txn
+        for txn in transactions
+        if isinstance(txn, dict) and txn.get('customer_reference')
+    }
+
+
+def complete_deposit(deposit, transaction_id=None, notify=True):
+    """
+    Mark a pending deposit COMPLETED and credit the member's savings account.
+
+    The deposit row is locked first, so concurrent callers (webhook, poller,
+    member poll) credit it at most once.
+
+    Returns:
+        tuple: (account, completed) where completed is False if the deposit
+        had already left PENDING
+    """
+    from .models import Deposit, Account
+    from .jobs import enqueue
+    from .ledger import post_deposit
+    from .utils.dashboard_cache import invalidate_dashboard
+
+    with transaction.atomic():
+        locked = Deposit.objects.select_for_update().get(pk=deposit.pk)
+
+        if locked.status != 'PENDING':
+            deposit.status = locked.status
+            return Account.objects.filter(user_id=locked.user_id, account_type='SAVINGS').first(), False
+
+        locked.status = 'COMPLETED'
+        locked.transaction_id = transaction_id or locked.transaction_id
+        locked.next_check_at = None
+        locked.save()
+        transaction.on_commit(lambda: metrics.DEPOSIT_TRANSITIONS.inc(source='PENDING', target='COMPLETED'))
+
+        # Get or create user's savings account
+        account, created = Account.objects.get_or_create(
+            user_id=locked.user_id,
+            account_type='SAVINGS',
+            defaults={
+                'account_number': f"SAV{locked.user_id:06d}",
+                'balance': Decimal('0.00')
+            }
+        )
+
+        # Credit through the ledger (locks the account, idempotent on tx_ref)
+        post_deposit(locked, account)
+        invalidate_dashboard(locked.user_id)
+
+        if notify:
+            enqueue('send_user_push', {
+                'user_id': locked.user_id,
+                'title': 'Deposit Confirmed! 🎉',
+                'body': f'Your deposit of UGX {locked.amount:,.0f} has been credited to your account',
+                'url': '/member-portal/transactions',
+                'icon': '/icon-192x192.png',
+            })
+            enqueue('send_deposit_confirmation_email', {
+                'deposit_id': locked.pk,
+                'balance': str(account.balance),
+            })
+
+    deposit.status = locked.status
+    deposit.transaction_id = locked.transaction_id
+    deposit.next_check_at = None
+    logger.info(f"Deposit completed: {locked.tx_ref}, amount: {locked.amount}, new balance: {account.balance}")
+    return account, True
+
+
+def fail_deposit(deposit):
+    """
+    Mark a pending deposit FAILED.
+
+    Returns:
+        bool: False if the deposit had already left PENDING
+    """
+    from .models import Deposit
+    from .utils.dashboard_cache import invalidate_dashboard
+
+    updated = Deposit.objects.filter(pk=deposit.pk, status='PENDING').update(status='FAILED', next_check_at=None)
+    if updated:
+        metrics.DEPOSIT_TRANSITIONS.inc(source='PENDING', target='FAILED')
+        invalidate_dashboard(deposit.user_id)
+        deposit.status = 'FAILED'
+        deposit.next_check_at = None
+        logger.info(f"Deposit failed: {deposit.tx_ref}")
+    return bool(updated)
+
+
+def fail_deposits(deposit_ids):
+    """
+    Mark many pending deposits FAILED with one update (bulk fail_deposit).
+
+    Returns:
+        list: tx_refs of the deposits that were still PENDING, sorted
+    """
+    from .models import Deposit
+    from .utils.dashboard_cache import invalidate_dashboard
+
+    with transaction.atomic():
+        rows = list(
+            Deposit.objects.select_for_update().filter(pk__in=deposit_ids, status='PENDING')
+            .values_list('pk', 'tx_ref', 'user_id')
+        )
+        if rows:
+            Deposit.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(status='FAILED', next_check_at=None)
+        for user_id in {user_id for _, _, user_id in rows}:
+            invalidate_dashboard(user_id)
+
+    if rows:
+        metrics.DEPOSIT_TRANSITIONS.inc(len(rows), source='PENDING', target='FAILED')
+        logger.info(f"Deposits failed: {len(rows)}")
+    return sorted(tx_ref for _, tx_ref, _ in rows)
+
+
+def schedule_next_check(deposit, now=None):
+    """Push a still-pending deposit's next reconciliation back exponentially, or stop polling it"""
+    from .models import Deposit
+
+    now = now or timezone.now()
+    attempts = deposit.check_attempts + 1
+    max_age = timedelta(seconds=_setting('DEPOSIT_POLL_MAX_AGE', 24 * 60 * 60))
+
+    if now - deposit.created_at > max_age:
+        # Give up polling; the webhook or a full reconciliation can still settle it
+        next_check_at = None
+        logger.warning(f"Deposit {deposit.tx_ref} still pending after {attempts} checks, no longer polling")
+    else:
+        next_check_at = now + timedelta(seconds=next_check_delay(attempts))
+
+    Deposit.objects.filter(pk=deposit.pk).update(check_attempts=attempts, next_check_at=next_check_at)
+    deposit.check_attempts = attempts
+    deposit.next_check_at = next_check_at
+
+
+def apply_provider_status(deposit, provider_status, transaction_id=None, now=None):
+    """
+    Settle a deposit from a provider status, or schedule its next check.
+
+    Returns:
+        str: 'COMPLETED', 'FAILED' or 'PENDING'
+    """
+    outcome = normalize_status(provider_status)
+
+    if outcome == 'success':
+        complete_deposit(deposit, transaction_id=transaction_id)
+    elif outcome == 'failed':
+        fail_deposit(deposit)
+    else:
+        schedule_next_check(deposit, now=now)
+
+    return deposit.status
+
+
+def check_deposit(deposit, now=None):
+    """
+    Ask Relworx for one deposit's status and apply it.
+
+    Returns:
+        dict: Gateway payment data, or None if the status call failed
+    """
+    from .relworx import get_gateway
+
+    result = get_gateway().check_request_status(customer_reference=deposit.tx_ref)
+    if not result['success']:
+        schedule_next_check(deposit, now=now)
+        return None
+
+    payment_data = result['data']
+    apply_provider_status(
+        deposit,
+        payment_data.get('request_status') or payment_data.get('status'),
+        transaction_id=payment_data.get('provider_transaction_id'),
+        now=now
+    )
+    return payment_data
+
+
+def due_deposits(now=None):
+    from .models import Deposit
+
+    now = now or timezone.now()
+    return Deposit.objects.filter(status='PENDING', next_check_at__lte=now).order_by('next_check_at')
+
+
+def poll_pending_deposits(batch_size=None, max_status_checks=None, now=None):
+    """
+    Reconcile one batch of due pending deposits.
+
+    One transaction history call resolves every deposit it covers; at most
+    `max_status_checks` of the rest get an individual status call, and the
+    others are rescheduled.
+
+    Returns:
+        dict: Counts of completed, failed, still pending and remote calls made
+    """
+    from .relworx import get_gateway
+
+    now = now or timezone.now()
+    batch_size = batch_size or _setting('DEPOSIT_POLL_BATCH_SIZE', 200)
+    if max_status_checks is None:
+        max_status_checks = _setting('DEPOSIT_POLL_MAX_STATUS_CHECKS', 20)
+
+    deposits = list(due_deposits(now)[:batch_size])
+    stats = {'checked': len(deposits), 'COMPLETED': 0, 'FAILED': 0, 'PENDING': 0, 'remote_calls': 0}
+    if not deposits:
+        return stats
+
+    gateway = get_gateway()
+    history = gateway.get_transaction_history()
+    stats['remote_calls'] += 1
+    indexed = index_history(history['data']) if history['success'] else {}
+
+    status_checks = 0
+    for deposit in deposits:
+        txn = indexed.get(deposit.tx_ref)
+
+        if txn is not None and normalize_status(txn.get('status')):
+            outcome = apply_provider_status(
+                deposit,
+                txn.get('status'),
+                transaction_id=txn.get('provider_transaction_id') or txn.get('internal_reference'),
+                now=now
+            )
+        elif status_checks < max_status_checks:
+            status_checks += 1
+            check_deposit(deposit, now=now)
+            outcome = deposit.status
+        else:
+            schedule_next_check(deposit, now=now)
+            outcome = 'PENDING'
+
+        stats[outcome] += 1
+
+    stats['remote_calls'] += status_checks
+    logger.info(
+        f"Deposit poll: {stats['checked']} checked, {stats['COMPLETED']} completed, "
+        f"{stats['FAILED']} failed, {stats['remote_calls']} Relworx calls"
+    )
+    return stats
+
+
+def needs_remote_check(deposit, now=None):
+    """Whether a member's verify request should ask Relworx instead of reading the local row"""
+    now = now or timezone.now()
+    pending_for = now - deposit.created_at
+    threshold = timedelta(seconds=_setting('DEPOSIT_VERIFY_REMOTE_AFTER', 120))
+    return (
+        deposit.status == 'PENDING'
+        and pending_for > threshold
+        and deposit.next_check_at is not None
+        and deposit.next_check_at <= now
+    )
+
+
+def _history_amount(txn):
+    try:
+        return Decimal(str(txn.get('amount')))
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+
+
+def reconcile_deposits(history_data, apply=True, chunk_size=500):
+    """
+    Diff a Relworx transaction history export against our deposits.
+
+    Matching deposits are loaded with one query per `chunk_size` references.
+    Pending deposits the provider settled are completed (credited through the
+    ledger) or failed in bulk; anything that cannot be fixed safely is
+    reported instead: amount mismatches, provider transactions with no deposit
+    (orphans), pending deposits from the history window that Relworx has no
+    record of (local_orphans) and deposits whose final status disagrees with
+    the provider. When applied, 'completed' and 'failed' list only deposits
+    this call settled, not ones another process settled first.
+
+    Args:
+        history_data: get_transaction_history()['data']
+        apply: False to only report what would change
+
+    Returns:
+        dict: Counts and the affected references per category
+    """
+    from .models import Deposit
+
+    indexed = index_history(history_data)
+    report = {
+        'history': len(indexed),
+        'matched': 0,
+        'unchanged': 0,
+        'completed': [],
+        'failed': [],
+        'amount_mismatches': [],
+        'conflicts': [],
+        'orphans': [],
+        'local_orphans': [],
+    }
+
+    references = list(indexed)
+    to_complete = {}
+    to_fail = []
+    found = set()
+
+    for start in range(0, len(references), chunk_size):
+        rows = Deposit.objects.filter(tx_ref__in=references[start:start + chunk_size]).values_list(
+            'pk', 'tx_ref', 'amount', 'status'
+        )
+        for pk, tx_ref, amount, status in rows:
+            found.add(tx_ref)
+            txn = indexed[tx_ref]
+            outcome = normalize_status(txn.get('status'))
+            provider_amount = _history_amount(txn)
+
+            if provider_amount is not None and provider_amount != amount:
+                report['amount_mismatches'].append({
+                    'tx_ref': tx_ref, 'amount': str(amount), 'provider_amount': str(provider_amount)
+                })
+                continue
+
+            if status == 'PENDING' and outcome == 'success':
+                to_complete[pk] = txn.get('provider_transaction_id') or txn.get('internal_reference')
+                report['completed'].append(tx_ref)
+            elif status == 'PENDING' and outcome == 'failed':
+                to_fail.append(pk)
+                report['failed'].append(tx_ref)
+            elif (status == 'COMPLETED' and outcome == 'failed') or (status == 'FAILED' and outcome == 'success'):
+                report['conflicts'].append({
+                    'tx_ref': tx_ref, 'status': status, 'provider_status': txn.get('status')
+                })
+            else:
+                report['unchanged'] += 1
+
+    report['matched'] = len(found)
+    report['orphans'] = sorted(set(references) - found)
+
+    # Pending deposits Relworx has no record of; the newest may simply not be listed yet
+    now = timezone.now()
+    pending = Deposit.objects.filter(
+        status='PENDING',
+        created_at__gte=now - HISTORY_WINDOW,
+        created_at__lte=now - timedelta(seconds=_setting('DEPOSIT_VERIFY_REMOTE_AFTER', 120)),
+    ).values_list('tx_ref', flat=True)
+    report['local_orphans'] = sorted(tx_ref for tx_ref in pending if tx_ref not in indexed)
+
+    if apply:
+        report['failed'] = fail_deposits(to_fail) if to_fail else []
+        report['completed'] = sorted(
+            deposit.tx_ref
+            for deposit in Deposit.objects.filter(pk__in=list(to_complete), status='PENDING')
+            if complete_deposit(deposit, transaction_id=to_complete[deposit.pk])[1]
+        )
+
+    logger.info(
+        f"Deposit reconciliation: {report['history']} provider transactions, {report['matched']} matched, "
+        f"{len(report['completed'])} completed, {len(report['failed'])} failed, "
+        f"{len(report['amount_mismatches'])} amount mismatches, {len(report['conflicts'])} conflicts, "
+        f"{len(report['orphans'])} orphans, {len(report['local_orphans'])} local orphans"
+    )
+    return report
@@ -0,0 +1,300 @@
+"""
+Database-backed background job queue
+
+Side effects that talk to slow third parties (email, web push, ...) are
+written to the BackgroundJob table instead of running inside the request.
+Because the job row is inserted with the same connection, a job enqueued
+inside transaction.atomic() only becomes visible if that transaction commits.
+
+Workers (`python manage.py run_worker`) claim due jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of worker threads and
+processes can poll the same table without handing out a job twice. A claimed
+job is leased until `locked_until`; if the worker dies mid-job the lease
+expires and another worker picks it up. Failed jobs are retried with
+exponential backoff and jitter until `max_attempts` is reached.
+
+Delivery is at-least-once, so handlers must be safe to run twice. Handlers
+that work through a list can call save_progress() before raising, so the
+retry skips the items that were already done.
+
+Usage:
+    from api.jobs import job, enqueue
+
+    @job(max_attempts=3)
+    def send_receipt(deposit_id):
+        ...
+
+    enqueue('send_receipt', {'deposit_id': deposit.id})
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+from .utils import metrics
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_local = threading.local()
+
+
+def job(name=None, max_attempts=None):
+    """
+    Register a function as a background job handler.
+
+    Args:
+        name: Name used to enqueue the job (defaults to the function name)
+        max_attempts: Attempts before the job is marked FAILED
+    """
+    def decorator(func):
+        _registry[name or func.__name__] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=None, run_at=None, max_attempts=None):
+    """
+    Queue a job for a worker to run.
+
+    Args:
+        name: Registered job name
+        payload: JSON-serializable dict passed to the handler as keyword arguments
+        delay: Seconds to wait before the job becomes due
+        run_at: Datetime the job becomes due (overrides delay)
+        max_attempts: Override the handler's attempt limit
+
+    Returns:
+        BackgroundJob: The queued job
+    """
+    from .models import BackgroundJob
+
+    if name not in _registry:
+        raise ValueError(f"Unknown background job: {name}")
+
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+
+    default_attempts = _registry[name][1] or getattr(settings, 'JOBS_MAX_ATTEMPTS', 5)
+    queued = BackgroundJob.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=run_at,
+        max_attempts=max_attempts or default_attempts
+    )
+
+    if getattr(settings, 'JOBS_EAGER', False):
+        # Development convenience: run right after the surrounding transaction commits
+        transaction.on_commit(lambda: run_pending(job_ids=[queued.pk]))
+
+    return queued
+
+
+def current_job():
+    """The BackgroundJob being run by this thread, or None outside a job"""
+    return getattr(_local, 'job', None)
+
+
+def save_progress(payload):
+    """
+    Replace the running job's payload, so a retry only redoes unfinished work.
+
+    Returns:
+        bool: False outside a job or if the job was re-claimed meanwhile
+    """
+    from .models import BackgroundJob
+
+    running = current_job()
+    if running is None:
+        return False
+    running.payload = payload
+    return bool(BackgroundJob.objects.filter(pk=running.pk, attempts=running.attempts).update(payload=payload))
+
+
+def backoff(attempt):
+    """Seconds to wait before retry number `attempt` (exponential, capped, half jitter)"""
+    base = getattr(settings, 'JOBS_RETRY_BASE_DELAY', 10)
+    cap = getattr(settings, 'JOBS_RETRY_MAX_DELAY', 60 * 60)
+    delay = min(cap, base * 2 ** max(attempt - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claim(worker_id, limit=1, job_ids=None):
+    """
+    Lease up to `limit` due jobs to a worker.
+
+    Jobs that are PENDING and due, or RUNNING with an expired lease, are
+    eligible. Rows locked by another worker's claim are skipped.
+
+    Returns:
+        list[BackgroundJob]: The claimed jobs, with attempts already counted
+    """
+    from .models import BackgroundJob
+
+    now = timezone.now()
+    visibility = getattr(settings, 'JOBS_VISIBILITY_TIMEOUT', 5 * 60)
+
+    with transaction.atomic():
+        due = BackgroundJob.objects.filter(
+            Q(status='PENDING', run_at__lte=now) | Q(status='RUNNING', locked_until__lt=now)
+        )
+        if job_ids is not None:
+            due = due.filter(pk__in=job_ids)
+
+        jobs = list(due.select_for_update(skip_locked=True).order_by('run_at')[:limit])
+        if not jobs:
+            return []
+
+        locked_until = now + timedelta(seconds=visibility)
+        BackgroundJob.objects.filter(pk__in=[j.pk for j in jobs]).update(
+            status='RUNNING',
+            attempts=F('attempts') + 1,
+            locked_until=locked_until,
+            locked_by=worker_id
+        )
+
+    for claimed in jobs:
+        claimed.status = 'RUNNING'
+        claimed.attempts += 1
+        claimed.locked_until = locked_until
+        claimed.locked_by = worker_id
+    return jobs
+
+
+def execute(claimed):
+    """
+    Run a claimed job and record the outcome.
+
+    Returns:
+        bool: True if the handler succeeded
+    """
+    from .models import BackgroundJob
+
+    # Only touch the row if no other worker has re-claimed it since
+    current = BackgroundJob.objects.filter(pk=claimed.pk, attempts=claimed.attempts)
+
+    if claimed.attempts > claimed.max_attempts:
+        # Lease expired on the final attempt (worker crashed or timed out)
+        current.update(status='FAILED', locked_until=None, finished_at=timezone.now())
+        logger.error(f"Job {claimed} abandoned after {claimed.max_attempts} attempts")
+        return False
+
+    try:
+        handler = _registry.get(claimed.name)
+        if handler is None:
+            raise LookupError(f"No handler registered for job '{claimed.name}'")
+        _local.job = claimed
+        try:
+            handler[0](**claimed.payload)
+        finally:
+            _local.job = None
+
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+
+        if claimed.attempts >= claimed.max_attempts:
+            current.update(status='FAILED', locked_until=None, last_error=error, finished_at=timezone.now())
+            logger.error(f"Job {claimed} failed permanently: {e}")
+        else:
+            retry_in = backoff(claimed.attempts)
+            current.update(
+                status='PENDING',
+                locked_until=None,
+                last_error=error,
+                run_at=timezone.now() + timedelta(seconds=retry_in)
+            )
+            logger.warning(f"Job {claimed} failed (attempt {claimed.attempts}), retrying in {retry_in:.0f}s: {e}")
+        return False
+
+    current.update(status='SUCCEEDED', locked_until=None, last_error='', finished_at=timezone.now())
+    logger.info(f"Job {claimed.name} #{claimed.pk} succeeded")
+    return True
+
+
+def run_pending(limit=None, worker_id=None, job_ids=None):
+    """
+    Run due jobs in the current thread until none are left.
+
+    Returns:
+        int: Number of jobs executed
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:inline"
+    executed = 0
+
+    while limit is None or executed < limit:
+        jobs = claim(worker_id, job_ids=job_ids)
+        if not jobs:
+            break
+        for claimed in jobs:
+            execute(claimed)
+            executed += 1
+
+    return executed
+
+
+class Worker:
+    """
+    Poll the job table from a pool of threads until stopped.
+
+    Each thread keeps its own database connection and claims one job at a
+    time, so a slow job never holds up the others.
+    """
+
+    def __init__(self, threads=1, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _loop(self, index):
+        worker_id = f"{self.prefix}:{index}"
+        logger.info(f"Worker thread {worker_id} started")
+
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    jobs = claim(worker_id)
+                except Exception as e:
+                    logger.error(f"Worker {worker_id} could not claim jobs: {e}", exc_info=True)
+                    jobs = []
+
+                if not jobs:
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+
+                for claimed in jobs:
+                    execute(claimed)
+                
+                # Job processes serve no scrapes; publish their email/push metrics for the web workers
+                metrics.maybe_flush()
+        finally:
+            connection.close()
+            logger.info(f"Worker thread {worker_id} stopped")
+
+    def run(self):
+        """Start the worker threads and block until stop() is called"""
+        threads = [
+            threading.Thread(target=self._loop, args=(index,), name=f'job-worker-{index}', daemon=True)
+            for index in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
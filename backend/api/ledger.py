@@ -0,0 +1,133 @@
+"""
+Double-entry ledger for member balances
+
+Every change to a member account balance is posted here as a balanced
+LedgerTransaction (its entries sum to zero) with one append-only LedgerEntry
+per leg. Account.balance remains the O(1) balance snapshot every read path
+uses, but only post() writes it: the member accounts in a posting are locked
+in primary key order and moved with F() updates in the same transaction as
+the entries, so concurrent webhooks, poller passes and member polls cannot
+lose a credit.
+
+Postings are idempotent on `reference` (a deposit's tx_ref): the unique
+constraint on LedgerTransaction makes a second post with the same reference
+a no-op, even when two processes race.
+
+Internal books such as mobile money clearing are plain names on the entry.
+They carry no running balance, so they never become a row every posting has
+to lock; their balance is summed from the entries when needed.
+
+Usage:
+    from api import ledger
+    posting, created = ledger.post_deposit(deposit, account)
+"""
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLEARING_BOOK = 'MOBILE_MONEY_CLEARING'
+
+ZERO = Decimal('0.00')
+
+
+class UnbalancedPosting(ValueError):
+    """The legs of a posting do not sum to zero"""
+
+
+def post(reference, kind, legs, description=''):
+    """
+    Post a balanced transaction, once per reference.
+
+    Args:
+        reference: Idempotency key, e.g. a deposit tx_ref
+        kind: Posting type ('DEPOSIT', ...)
+        legs: Iterable of (Account instance or internal book name, signed amount)
+        description: Short human readable note
+
+    Returns:
+        tuple: (LedgerTransaction, created) where created is False if the
+        reference had already been posted
+
+    Raises:
+        UnbalancedPosting: If the amounts do not sum to zero
+    """
+    from .models import Account, LedgerTransaction, LedgerEntry
+    from .utils.member_summary import apply_deltas, snapshot
+
+    legs = [(target, Decimal(str(amount))) for target, amount in legs]
+    if sum(amount for _, amount in legs) != ZERO:
+        raise UnbalancedPosting(f"Posting {reference} does not balance: {legs}")
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                posting = LedgerTransaction.objects.create(reference=reference, kind=kind, description=description)
+        except IntegrityError:
+            logger.info(f"Ledger posting {reference} already recorded")
+            return LedgerTransaction.objects.get(reference=reference), False
+
+        account_ids = sorted({target.pk for target, _ in legs if isinstance(target, Account)})
+        # Lock in a fixed order so postings touching the same accounts cannot deadlock
+        balances = dict(
+            Account.objects.select_for_update().filter(pk__in=account_ids).order_by('pk').values_list('pk', 'balance')
+        )
+
+        entries = []
+        for target, amount in legs:
+            if isinstance(target, Account):
+                Account.objects.filter(pk=target.pk).update(balance=F('balance') + amount)
+                balances[target.pk] += amount
+                target.balance = balances[target.pk]
+                # F() updates skip post_save, so keep the member summary in step here
+                apply_deltas(target.user_id, total_savings=amount)
+                target._summary_state = snapshot(target)
+                entries.append(LedgerEntry(
+                    transaction=posting, account=target, book=target.account_type,
+                    amount=amount, balance_after=balances[target.pk]
+                ))
+            else:
+                entries.append(LedgerEntry(transaction=posting, book=target, amount=amount))
+
+        LedgerEntry.objects.bulk_create(entries)
+
+    return posting, True
+
+
+def post_deposit(deposit, account):
+    """Credit a completed mobile money deposit to a member account"""
+    return post(
+        reference=deposit.tx_ref,
+        kind='DEPOSIT',
+        legs=[(account, deposit.amount), (CLEARING_BOOK, -Decimal(str(deposit.amount)))],
+        description=f'Mobile money deposit {deposit.transaction_id or deposit.tx_ref}'[:255],
+    )
+
+
+def book_balance(book):
+    """Balance of an internal book, summed from its entries"""
+    from .models import LedgerEntry
+
+    return LedgerEntry.objects.filter(account__isnull=True, book=book).aggregate(total=Sum('amount'))['total'] or ZERO
+
+
+def find_drift(account_ids=None):
+    """
+    Accounts whose balance snapshot disagrees with the sum of their entries.
+
+    Returns:
+        list[dict]: account_id, balance, ledger_total for each mismatch
+    """
+    from .models import Account
+
+    accounts = Account.objects.annotate(ledger_total=Sum('ledger_entries__amount'))
+    if account_ids is not None:
+        accounts = accounts.filter(pk__in=account_ids)
+
+    return [
+        {'account_id': account.pk, 'balance': account.balance, 'ledger_total': account.ledger_total or ZERO}
+        for account in accounts.only('id', 'balance')
+        if account.balance != (account.ledger_total or ZERO)
+    ]
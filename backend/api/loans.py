@@ -0,0 +1,205 @@
+"""
+Loan repayment schedules
+
+Installments are computed by api.utils.amortization from the loan's amount,
+interest_rate (yearly %), interest_method, repayment_frequency, start_date
+and due_date, and written with bulk_create. A loan gets its schedule when it
+is approved; `python manage.py generate_repayment_schedules` regenerates
+schedules for many loans in one transaction: one SELECT and one DELETE per
+batch of loans plus multi-row INSERTs, so the cost per loan does not grow
+with the batch.
+
+Loans with a PAID installment are never regenerated: their schedule is
+history, not a projection.
+
+`python manage.py sweep_loans` (cron) keeps statuses current with a few
+set-based UPDATEs: an installment is PAID once the loan's completed payments
+cover it and every installment before it, unpaid installments past their
+due date become OVERDUE, and active loans whose installments are all paid
+become COMPLETED.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
+from django.utils import timezone
+from .utils import metrics
+from .utils.amortization import ZERO, build_schedule
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+# Installment rows per INSERT statement
+INSERT_BATCH_SIZE = 2000
+ACTIVE_LOAN_STATUSES = ('APPROVED', 'DISBURSED')
+SCHEDULE_FIELDS = (
+    'id', 'amount', 'interest_rate', 'interest_method', 'repayment_frequency', 'start_date', 'due_date',
+)
+
+
+def schedule_rows(loan):
+    """Unsaved RepaymentSchedule rows for a loan"""
+    from .models import RepaymentSchedule
+
+    installments = build_schedule(
+        loan.amount,
+        loan.interest_rate,
+        loan.start_date,
+        loan.due_date,
+        frequency=loan.repayment_frequency,
+        method=loan.interest_method,
+    )
+    return [
+        RepaymentSchedule(
+            loan_id=loan.pk,
+            installment_number=installment.number,
+            due_date=installment.due_date,
+            amount=installment.amount,
+        )
+        for installment in installments
+    ]
+
+
+def create_schedule(loan):
+    """
+    Generate a loan's schedule unless it already has one.
+
+    Returns:
+        int: Number of installments created
+    """
+    from .models import RepaymentSchedule
+
+    if RepaymentSchedule.objects.filter(loan_id=loan.pk).exists():
+        return 0
+    rows = schedule_rows(loan)
+    RepaymentSchedule.objects.bulk_create(rows)
+    return len(rows)
+
+
+def regenerate_schedules(loans, batch_size=DEFAULT_BATCH_SIZE, missing_only=False):
+    """
+    Replace the unpaid schedules of many loans in a single transaction.
+
+    Args:
+        loans: Loan queryset
+        batch_size: Loans handled per DELETE/INSERT round trip
+        missing_only: Only generate schedules for loans that have none
+
+    Returns:
+        dict: loans, installments, skipped_paid (loans left alone because
+              an installment is already paid), errors (loan id -> message)
+    """
+    from .models import RepaymentSchedule
+
+    report = {'loans': 0, 'installments': 0, 'skipped_paid': 0, 'errors': {}}
+
+    with transaction.atomic():
+        loan_ids = list(loans.order_by('pk').values_list('pk', flat=True))
+        existing = RepaymentSchedule.objects.filter(loan_id__in=loans.values('pk'))
+        if missing_only:
+            excluded = set(existing.values_list('loan_id', flat=True).distinct())
+        else:
+            excluded = set(existing.filter(status='PAID').values_list('loan_id', flat=True).distinct())
+            report['skipped_paid'] = len(excluded)
+
+        loan_ids = [loan_id for loan_id in loan_ids if loan_id not in excluded]
+
+        for start in range(0, len(loan_ids), batch_size):
+            chunk = loan_ids[start:start + batch_size]
+            rows = []
+            generated = []
+            for loan in loans.model.objects.filter(pk__in=chunk).only(*SCHEDULE_FIELDS):
+                try:
+                    loan_rows = schedule_rows(loan)
+                except ValueError as e:
+                    report['errors'][loan.pk] = str(e)
+                    continue
+                rows.extend(loan_rows)
+                generated.append(loan.pk)
+
+            if not missing_only:
+                RepaymentSchedule.objects.filter(loan_id__in=generated).delete()
+            RepaymentSchedule.objects.bulk_create(rows, batch_size=INSERT_BATCH_SIZE)
+            report['loans'] += len(generated)
+            report['installments'] += len(rows)
+
+    if report['errors']:
+        logger.warning(f"Repayment schedules not generated for {len(report['errors'])} loans")
+    return report
+
+
+def sweep_loans(today=None):
+    """
+    Mark installments paid or overdue and complete fully paid loans.
+
+    Args:
+        today: Date installments are compared against (default: local today)
+
+    Returns:
+        dict: Rows changed - paid, overdue, completed
+    """
+    from .models import Loan, Payment, RepaymentSchedule
+    from .utils.dashboard_cache import invalidate_dashboard
+    from .utils.member_summary import rebuild_summaries
+
+    today = today or timezone.localdate()
+
+    def paid_total(loan_ref):
+        return Subquery(
+            Payment.objects.filter(loan_id=OuterRef(loan_ref), payment_status='COMPLETED')
+            .values('loan_id').annotate(total=Sum('amount')).values('total')
+        )
+
+    allocated_total = (
+        RepaymentSchedule.objects.filter(loan_id=OuterRef('pk'), status='PAID')
+        .values('loan_id').annotate(total=Sum('amount')).values('total')
+    )
+    due_through = (
+        RepaymentSchedule.objects.filter(loan_id=OuterRef('loan_id'), installment_number__lte=OuterRef('installment_number'))
+        .values('loan_id').annotate(total=Sum('amount')).values('total')
+    )
+    schedule_rows = RepaymentSchedule.objects.filter(loan_id=OuterRef('pk'))
+
+    # Installments are paid in order, so only loans with payments not yet
+    # allocated to a PAID installment can have more installments to mark
+    unallocated = Loan.objects.filter(loan_status__in=ACTIVE_LOAN_STATUSES).filter(
+        GreaterThan(Coalesce(paid_total('pk'), ZERO),
+                    Coalesce(Subquery(allocated_total), ZERO))
+    )
+
+    with transaction.atomic():
+        paid_rows = RepaymentSchedule.objects.filter(
+            status__in=('PENDING', 'OVERDUE'),
+            loan_id__in=unallocated.values('pk'),
+        ).filter(
+            GreaterThanOrEqual(Coalesce(paid_total('loan_id'), ZERO), Subquery(due_through))
+        )
+        overdue_rows = RepaymentSchedule.objects.filter(status='PENDING', due_date__lt=today)
+        # Bulk updates skip the dashboard signals, so note whose installments change
+        touched = set(paid_rows.values_list('loan__borrower__user_id', flat=True))
+
+        paid = paid_rows.update(status='PAID')
+        touched.update(overdue_rows.values_list('loan__borrower__user_id', flat=True))
+        overdue = overdue_rows.update(status='OVERDUE')
+
+        completable = (
+            Loan.objects.filter(loan_status__in=ACTIVE_LOAN_STATUSES)
+            .filter(Exists(schedule_rows))
+            .exclude(Exists(schedule_rows.exclude(status='PAID')))
+        )
+        user_ids = set(completable.values_list('borrower__user_id', flat=True))
+        completed = completable.update(loan_status='COMPLETED', updated_at=timezone.now()) if user_ids else 0
+
+        # Bulk updates skip the summary signals
+        if user_ids:
+            rebuild_summaries(user_ids)
+        for user_id in touched | user_ids:
+            invalidate_dashboard(user_id)
+
+    counts = {'paid': paid, 'overdue': overdue, 'completed': completed}
+    for change, count in counts.items():
+        if count:
+            metrics.LOAN_SWEEP_CHANGES.inc(count, change=change)
+    logger.info(f"Loan sweep: {paid} installments paid, {overdue} overdue, {completed} loans completed")
+    return counts
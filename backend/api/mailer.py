@@ -0,0 +1,259 @@
+"""
+Outbound email delivery for background jobs
+
+Request handlers never send mail; they enqueue a job (send_otp_email,
+send_password_reset_email, send_deposit_confirmation_email, send_emails) and
+the job worker delivers it here. Bodies come from api.utils.email_templates.
+Each worker thread keeps its transport warm between jobs:
+
+- SMTP: one open, authenticated connection per thread, reused until it has
+  been idle for EMAIL_CONNECTION_IDLE_TIMEOUT seconds or the server drops it
+  (reconnected once, transparently)
+- Resend: one keep-alive HTTPS session per thread, and the batch endpoint
+  for lists of messages
+
+SMTP sends one message per transaction over that connection; Resend sends
+chunks of EMAIL_BATCH_SIZE per batch call. Failures that may succeed later
+(network errors, 4xx SMTP replies, Resend 5xx/429) raise TransientEmailError
+so the job is retried with backoff. The error records how many leading
+messages were already handled, so a retry can skip them instead of sending
+them twice. Messages the provider rejects outright are logged and dropped.
+
+Usage:
+    from api import mailer
+    mailer.send([mailer.build_message('member@example.com', 'Subject', 'Text', html='<p>Html</p>')])
+"""
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from .utils.profiling import external_call
+from .utils import metrics
+import logging
+import smtplib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Resend accepts at most 100 messages per batch call
+RESEND_BATCH_LIMIT = 100
+
+_local = threading.local()
+
+
+class TransientEmailError(Exception):
+    """
+    Delivery failed in a way that is worth retrying.
+
+    `processed` is the number of leading messages that were delivered (or
+    permanently rejected) before the failure and must not be sent again.
+    """
+
+    def __init__(self, message, processed=0):
+        super().__init__(message)
+        self.processed = processed
+
+
+def transport():
+    """'resend' when a Resend API key is configured (Railway blocks SMTP), 'smtp' otherwise"""
+    use_resend = getattr(settings, 'USE_RESEND', False)
+    resend_api_key = getattr(settings, 'RESEND_API_KEY', None)
+
+    if resend_api_key and not use_resend:
+        logger.warning("⚠️ RESEND_API_KEY found but USE_RESEND=False, forcing Resend API")
+        use_resend = True
+
+    if use_resend and not resend_api_key:
+        raise RuntimeError("Resend API key not configured. Set RESEND_API_KEY in Railway environment.")
+    return 'resend' if use_resend else 'smtp'
+
+
+def build_message(to, subject, text, html=None, from_email=None):
+    """An EmailMultiAlternatives for one recipient, with an optional HTML part"""
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=text,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=[to] if isinstance(to, str) else list(to),
+    )
+    if html:
+        message.attach_alternative(html, 'text/html')
+    return message
+
+
+def _html_part(message):
+    for content, mimetype in getattr(message, 'alternatives', []):
+        if mimetype == 'text/html':
+            return content
+    return None
+
+
+# ---------------------------------------------------------------------------
+# SMTP
+# ---------------------------------------------------------------------------
+
+def _smtp_connection():
+    """This thread's open SMTP connection, (re)opened when missing or idle too long"""
+    idle_timeout = getattr(settings, 'EMAIL_CONNECTION_IDLE_TIMEOUT', 60)
+    key = (settings.EMAIL_BACKEND, settings.EMAIL_HOST, settings.EMAIL_PORT, settings.EMAIL_HOST_USER)
+    connection = getattr(_local, 'smtp', None)
+
+    if connection is not None and (time.monotonic() - _local.smtp_used_at > idle_timeout or _local.smtp_key != key):
+        close()
+        connection = None
+
+    if connection is None:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        _local.smtp, _local.smtp_key = connection, key
+        metrics.EMAIL_CONNECTIONS.inc(transport='smtp')
+
+    _local.smtp_used_at = time.monotonic()
+    return connection
+
+
+def _is_permanent_smtp_error(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def _send_smtp(messages):
+    sent = 0
+    for processed, message in enumerate(messages):
+        # One message per attempt: a failure never re-sends messages already accepted
+        for attempt in (1, 2):
+            started = time.perf_counter()
+            try:
+                with external_call('smtp'):
+                    sent += _smtp_connection().send_messages([message]) or 0
+                metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='smtp', outcome='success')
+                break
+            except smtplib.SMTPServerDisconnected as e:
+                # The server closed an idle connection: reconnect once
+                close()
+                if attempt == 2:
+                    metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='smtp', outcome='error')
+                    raise TransientEmailError(f"SMTP server disconnected: {e}", processed=processed) from e
+            except (smtplib.SMTPException, OSError) as e:
+                close()
+                if _is_permanent_smtp_error(e):
+                    metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='smtp', outcome='rejected')
+                    logger.error(f"SMTP rejected message to {message.to}: {e}")
+                    break
+                metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='smtp', outcome='error')
+                raise TransientEmailError(f"SMTP delivery failed: {e}", processed=processed) from e
+    return sent
+
+
+# ---------------------------------------------------------------------------
+# Resend
+# ---------------------------------------------------------------------------
+
+def _resend_client():
+    """Install a keep-alive HTTP client for the Resend SDK (once per process)"""
+    import resend
+
+    if not isinstance(resend.default_http_client, _KeepAliveClient):
+        resend.default_http_client = _KeepAliveClient(timeout=getattr(settings, 'EMAIL_TIMEOUT', 30))
+    resend.api_key = settings.RESEND_API_KEY
+    return resend
+
+
+class _KeepAliveClient:
+    """Resend HTTP client reusing one requests.Session (and its TLS connection) per thread"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def request(self, method, url, headers, json=None):
+        import requests
+
+        session = getattr(_local, 'resend_session', None)
+        if session is None:
+            session = _local.resend_session = requests.Session()
+            metrics.EMAIL_CONNECTIONS.inc(transport='resend')
+        try:
+            response = session.request(method=method, url=url, headers=headers, json=json, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise RuntimeError(f"Request failed: {e}") from e
+        return response.content, response.status_code, response.headers
+
+
+def _is_permanent_resend_error(error):
+    code = str(getattr(error, 'code', ''))
+    return code.startswith('4') and code != '429'
+
+
+def _send_resend(messages):
+    resend = _resend_client()
+    sent = 0
+    size = min(getattr(settings, 'EMAIL_BATCH_SIZE', 50), RESEND_BATCH_LIMIT)
+
+    for start in range(0, len(messages), size):
+        chunk = messages[start:start + size]
+        params = [
+            {
+                'from': message.from_email,
+                'to': message.to,
+                'subject': message.subject,
+                'text': message.body,
+                **({'html': _html_part(message)} if _html_part(message) else {}),
+            }
+            for message in chunk
+        ]
+        started = time.perf_counter()
+        try:
+            with external_call('resend'):
+                if len(params) == 1:
+                    resend.Emails.send(params[0])
+                else:
+                    resend.Batch.send(params)
+        except resend.exceptions.ResendError as e:
+            if _is_permanent_resend_error(e):
+                metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='resend', outcome='rejected')
+                logger.error(f"Resend rejected {len(chunk)} message(s) to {[m.to for m in chunk]}: {e}")
+                continue
+            metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='resend', outcome='error')
+            raise TransientEmailError(f"Resend delivery failed: {e}", processed=start) from e
+        except RuntimeError as e:
+            metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='resend', outcome='error')
+            raise TransientEmailError(f"Resend delivery failed: {e}", processed=start) from e
+
+        metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, transport='resend', outcome='success')
+        sent += len(chunk)
+    return sent
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def send(messages):
+    """
+    Deliver EmailMessage objects over this thread's warm transport.
+
+    Returns:
+        int: Number of messages accepted by the provider
+
+    Raises:
+        TransientEmailError: Delivery should be retried later
+    """
+    messages = list(messages)
+    if not messages:
+        return 0
+    if transport() == 'resend':
+        return _send_resend(messages)
+    return _send_smtp(messages)
+
+
+def close():
+    """Close this thread's SMTP connection (worker shutdown, idle timeout, errors)"""
+    connection = getattr(_local, 'smtp', None)
+    _local.smtp = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,509 @@
+"""
+Management command to benchmark every API endpoint against a synthetic SACCO
+
+Seeds a throwaway test database (SQLite or PostgreSQL, whichever DATABASES
+points at) with members, deposits, loans, repayment schedules and payments,
+then drives each route in api/urls.py through the Django test client and
+records p50/p95 latency, query count and peak Python memory per endpoint.
+
+Outbound calls (Relworx, SMTP, web push) are replaced with in-process fakes
+so the numbers measure our code and database only.
+
+Examples:
+    python manage.py benchmark_api --members 1000 --output bench.json
+    python manage.py benchmark_api --members 50000 --deposits 500000 --loans 20000
+    python manage.py benchmark_api --compare bench.json --threshold 20
+"""
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+
+BATCH_SIZE = 5000
+PASSWORD = 'BenchPass123'
+WEBHOOK_URL = 'https://testserver/api/payment-requests/relworx-webhook/'
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def _api_route_names():
+    """Collect the names of every named route under api/"""
+    names = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                names.add(pattern.name)
+
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver) and str(pattern.pattern).startswith('api/'):
+            walk(pattern.url_patterns)
+    return names
+
+
+class FakeRelworxGateway:
+    """Stands in for RelworxPaymentGateway; every request succeeds instantly"""
+
+    def __init__(self, *args, **kwargs):
+        self.webhook_key = settings.RELWORX_WEBHOOK_KEY
+
+    def request_payment(self, reference, msisdn, currency, amount, description=None):
+        return {'success': True, 'data': {'internal_reference': f'INT_{reference}', 'message': 'Request accepted'}}
+
+    def check_request_status(self, internal_reference=None, customer_reference=None):
+        return {'success': True, 'data': {'request_status': 'success', 'provider_transaction_id': f'PRV_{customer_reference}'}}
+
+    def get_transaction_history(self):
+        return {'success': True, 'data': {'transactions': []}}
+
+    def verify_webhook_signature(self, webhook_url, timestamp, signature, params):
+        return True
+
+
+class Command(BaseCommand):
+    help = 'Benchmark latency, query count and memory of every API endpoint on a synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=1000, help='Number of members to seed')
+        parser.add_argument('--deposits', type=int, default=None, help='Number of deposits (default: 10 per member)')
+        parser.add_argument('--loans', type=int, default=None, help='Number of loans (default: 1 per 2.5 members)')
+        parser.add_argument('--installments', type=int, default=6, help='Repayment schedule rows per loan')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint before timing')
+        parser.add_argument('--only', type=str, default=None, help='Comma-separated route names to run')
+        parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this path')
+        parser.add_argument('--compare', type=str, default=None, help='Baseline JSON from a previous run')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Percent p95 slowdown tolerated before a route counts as a regression'
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Keep the benchmark database between runs')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic data')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        members = options['members']
+        deposits = options['deposits'] if options['deposits'] is not None else members * 10
+        loans = options['loans'] if options['loans'] is not None else max(1, int(members / 2.5))
+
+        self.stdout.write(self.style.WARNING('⏱️  API Benchmark'))
+        self.stdout.write(self.style.WARNING('=' * 70))
+        self.stdout.write(f"Database: {connection.vendor}")
+        self.stdout.write(f"Dataset: {members} members, {deposits} deposits, {loans} loans")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'], serialize=False)
+        try:
+            with ExitStack() as stack:
+                self._install_fakes(stack)
+                started = time.monotonic()
+                ctx = self._seed(members, deposits, loans, options['installments'])
+                self.stdout.write(f"Seeded in {time.monotonic() - started:.1f}s")
+                results = self._run(ctx, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'revision': _git_revision(),
+                'database': connection.vendor,
+                'members': members,
+                'deposits': deposits,
+                'loans': loans,
+                'iterations': options['iterations'],
+                'timestamp': timezone.now().isoformat(),
+            },
+            'results': results,
+        }
+
+        self._print_results(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"\n💾 Results written to {options['output']}"))
+
+        if options['compare']:
+            self._compare(report, options['compare'], options['threshold'])
+
+    # ------------------------------------------------------------------
+    # Environment
+    # ------------------------------------------------------------------
+
+    def _vapid_private_key(self):
+        # Pushes are mocked, but VAPID headers are still signed for real
+        from py_vapid import Vapid, b64urlencode
+        vapid = Vapid()
+        vapid.generate_keys()
+        return b64urlencode(vapid.private_key.private_numbers().private_value.to_bytes(32, 'big'))
+
+    def _install_fakes(self, stack):
+        stack.enter_context(override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            USE_RESEND=False,
+            RESEND_API_KEY=None,
+            EMAIL_HOST_PASSWORD='benchmark',
+            VAPID_PUBLIC_KEY='benchmark',
+            VAPID_PRIVATE_KEY=self._vapid_private_key(),
+        ))
+        stack.enter_context(mock.patch('api.relworx.get_gateway', return_value=FakeRelworxGateway()))
+        stack.enter_context(mock.patch('api.utils.push_notifications.webpush', return_value=None))
+        stack.enter_context(mock.patch('cloudinary.uploader.upload', return_value={'secure_url': 'https://res.cloudinary.com/benchmark.jpg'}))
+
+    # ------------------------------------------------------------------
+    # Seeding
+    # ------------------------------------------------------------------
+
+    def _seed(self, members, deposits, loans, installments):
+        from api.models import (
+            CustomUser, Account, Deposit, ShareTransaction, LoginActivity, Borrower, Loan,
+            Payment, RepaymentSchedule, Report, University, Course, PushNotification,
+            PushSubscription, NationalIDVerification
+        )
+        from api.utils.member_summary import rebuild_summaries
+        from api.utils import sequences
+
+        now = timezone.now()
+        password = make_password(PASSWORD)
+
+        university = University.objects.create(name='Benchmark University', code='BENCH')
+        Course.objects.bulk_create(
+            [Course(name=f'Course {n}', university=university) for n in range(50)]
+        )
+        course = Course.objects.first()
+
+        CustomUser.objects.bulk_create((
+            CustomUser(
+                username=f'member{n}@bench.test', email=f'member{n}@bench.test', password=password,
+                first_name='Member', last_name=str(n), student_id=f'BENCH{n:07d}', phone_number='0700000000',
+                university=university, course=course, year_of_study=1 + n % 4
+            ) for n in range(members)
+        ), batch_size=BATCH_SIZE)
+        staff = CustomUser.objects.create_user(
+            username='staff@bench.test', email='staff@bench.test', password=PASSWORD, is_staff=True, is_superuser=True
+        )
+        user_ids = list(CustomUser.objects.exclude(pk=staff.pk).order_by('id').values_list('id', flat=True))
+        member = CustomUser.objects.get(pk=user_ids[0])
+
+        Account.objects.bulk_create((
+            Account(user_id=uid, account_number=f'SACCO-{n + 1:012d}', account_type='Savings Account',
+                    balance=Decimal(random.randint(0, 500) * 1000))
+            for n, uid in enumerate(user_ids)
+        ), batch_size=BATCH_SIZE)
+
+        statuses = ['COMPLETED'] * 8 + ['PENDING', 'FAILED']
+        Deposit.objects.bulk_create((
+            Deposit(user_id=user_ids[n % len(user_ids)], tx_ref=f'SACCO_BENCH_{n:09d}',
+                    amount=Decimal(random.randint(1, 100) * 1000), status=random.choice(statuses))
+            for n in range(deposits)
+        ), batch_size=BATCH_SIZE)
+
+        ShareTransaction.objects.bulk_create((
+            ShareTransaction(user_id=uid, number_of_shares=5, amount=Decimal('5000'),
+                             transaction_type='DIVIDEND' if n % 3 == 0 else 'BUY', status='COMPLETED')
+            for n, uid in enumerate(user_ids)
+        ), batch_size=BATCH_SIZE)
+
+        LoginActivity.objects.bulk_create((
+            LoginActivity(user_id=uid, ip_address='127.0.0.1', location='Login', device='benchmark')
+            for uid in user_ids
+        ), batch_size=BATCH_SIZE)
+
+        borrower_users = user_ids[:max(1, min(len(user_ids), loans))]
+        Borrower.objects.bulk_create(
+            (Borrower(user_id=uid, address='Kampala') for uid in borrower_users), batch_size=BATCH_SIZE
+        )
+        borrower_ids = list(Borrower.objects.order_by('id').values_list('id', flat=True))
+
+        Loan.objects.bulk_create((
+            Loan(borrower_id=borrower_ids[n % len(borrower_ids)], loan_code=f'B{n:06d}',
+                 amount=Decimal(random.randint(1, 50) * 100000), interest_rate=Decimal('12.00'),
+                 start_date=now - timedelta(days=30), due_date=now + timedelta(days=30 * installments),
+                 loan_status=random.choice(['APPROVED', 'DISBURSED', 'PENDING', 'COMPLETED']))
+            for n in range(loans)
+        ), batch_size=BATCH_SIZE)
+
+        loan_rows = list(Loan.objects.values_list('id', 'borrower_id', 'amount'))
+        RepaymentSchedule.objects.bulk_create((
+            RepaymentSchedule(loan_id=loan_id, installment_number=i + 1,
+                              due_date=(now + timedelta(days=30 * i)).date(),
+                              amount=(amount / installments).quantize(Decimal('0.01')))
+            for loan_id, _, amount in loan_rows for i in range(installments)
+        ), batch_size=BATCH_SIZE)
+        Payment.objects.bulk_create((
+            Payment(borrower_id=borrower_id, loan_id=loan_id,
+                    amount=(amount / installments).quantize(Decimal('0.01')), payment_status='COMPLETED')
+            for loan_id, borrower_id, amount in loan_rows for _ in range(2)
+        ), batch_size=BATCH_SIZE)
+        Report.objects.bulk_create((
+            Report(borrower_id=borrower_id, total_loans=Decimal('0'), total_payments=Decimal('0'))
+            for borrower_id in borrower_ids
+        ), batch_size=BATCH_SIZE)
+        PushNotification.objects.bulk_create(
+            (PushNotification(user_id=uid, title='Benchmark', body='Benchmark', status='SENT') for uid in user_ids[:1000]),
+            batch_size=BATCH_SIZE
+        )
+
+        PushSubscription.objects.bulk_create(
+            (PushSubscription(user_id=uid, endpoint=f'https://push.bench.test/{uid}', p256dh_key='key', auth_key='auth')
+             for uid in user_ids[:100]),
+            batch_size=BATCH_SIZE
+        )
+        NationalIDVerification.objects.create(
+            full_name='Member 0', nin='CM00000000BENCH', card_number='000000000', nationality='UGA', sex='M',
+            front_image='front.jpg', back_image='back.jpg', extracted_text_front='', extracted_text_back=''
+        )
+
+        rebuild_summaries()
+        sequences.restart(sequences.ACCOUNT_NUMBER_SEQUENCE, members + 1)
+
+        if not Borrower.objects.filter(user=member).exists():
+            Borrower.objects.create(user=member, address='Kampala')
+
+        return {
+            'member': member,
+            'staff': staff,
+            'university': university,
+            'course': course,
+            'deposit': Deposit.objects.filter(user=member).first(),
+            'loan': Loan.objects.filter(borrower__user=member).first() or Loan.objects.first(),
+            'counter': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Scenarios
+    # ------------------------------------------------------------------
+
+    def _scenarios(self, ctx):
+        from api.models import Deposit, Account, ShareTransaction, LoginActivity, Borrower, Payment
+        from api.models import RepaymentSchedule, Report, PushNotification, PushSubscription, NationalIDVerification
+
+        member = ctx['member']
+        loan = ctx['loan']
+
+        def unique(prefix):
+            ctx['counter'] += 1
+            return f"{prefix}{ctx['counter']}"
+
+        def pending_deposit():
+            return Deposit.objects.create(user=member, tx_ref=unique('SACCO_BENCH_P_'), amount=Decimal('5000'), status='PENDING')
+
+        def webhook_request():
+            deposit = pending_deposit()
+            data = {'status': 'success', 'customer_reference': deposit.tx_ref, 'internal_reference': f'INT_{deposit.tx_ref}'}
+            timestamp = str(int(time.time()))
+            signed = WEBHOOK_URL + timestamp + ''.join(f'{k}{v}' for k, v in sorted(data.items()))
+            signature = hmac.new(settings.RELWORX_WEBHOOK_KEY.encode(), signed.encode(), hashlib.sha256).hexdigest()
+            return data, {'HTTP_RELWORX_SIGNATURE': f't={timestamp},v={signature}'}
+
+        def register_data():
+            n = unique('')
+            return {
+                'username': f'Bench Registrant {n}', 'email': f'register{n}@bench.test',
+                'password': PASSWORD, 'confirm_password': PASSWORD, 'student_id': f'REG{n}',
+                'phone_number': '0700000000', 'university': ctx['university'].id, 'year_of_study': 1,
+            }
+
+        def first_id(model, **filters):
+            return model.objects.filter(**filters).values_list('id', flat=True).first()
+
+        # name -> (method, path or callable, user role, data callable or None)
+        return {
+            'api-root': ('get', '/api/', 'member', None),
+            'customuser-list': ('get', '/api/users/', 'staff', None),
+            'customuser-detail': ('get', lambda: f'/api/users/{member.id}/', 'member', None),
+            'customuser-me': ('get', '/api/users/me/', 'member', None),
+            'customuser-update-profile': ('patch', '/api/users/update-profile/', 'member', lambda: {'next_of_kin': unique('Kin ')}),
+            'customuser-user-settings': ('get', '/api/users/settings/', 'member', None),
+            'customuser-change-password': ('post', '/api/users/change-password/', 'member', lambda: {'current_password': 'wrong', 'new_password': 'Another123'}),
+            'customuser-enable-2fa': ('post', '/api/users/enable-2fa/', 'member', None),
+            'customuser-verify-2fa': ('post', '/api/users/verify-2fa/', 'member', lambda: {'otp': '000000'}),
+            'customuser-disable-2fa': ('post', '/api/users/disable-2fa/', 'member', lambda: {'password': 'wrong'}),
+            'customuser-send-login-otp': ('post', '/api/users/send-login-otp/', None, lambda: {'user_id': member.id}),
+            'account-list': ('get', '/api/accounts/', 'staff', None),
+            'account-detail': ('get', lambda: f"/api/accounts/{first_id(Account, user=member)}/", 'member', None),
+            'deposit-list': ('get', '/api/deposits/', 'staff', None),
+            'deposit-detail': ('get', lambda: f"/api/deposits/{ctx['deposit'].id}/", 'member', None),
+            'sharetransaction-list': ('get', '/api/shares/', 'staff', None),
+            'sharetransaction-detail': ('get', lambda: f"/api/shares/{first_id(ShareTransaction, user=member)}/", 'member', None),
+            'loginactivity-list': ('get', '/api/login-activities/', 'staff', None),
+            'loginactivity-detail': ('get', lambda: f"/api/login-activities/{first_id(LoginActivity, user=member)}/", 'member', None),
+            'borrower-list': ('get', '/api/borrowers/', 'staff', None),
+            'borrower-detail': ('get', lambda: f"/api/borrowers/{first_id(Borrower, user=member)}/", 'member', None),
+            'loan-list': ('get', '/api/loans/', 'staff', None),
+            'loan-detail': ('get', lambda: f'/api/loans/{loan.id}/', 'staff', None),
+            'loan-approve': ('post', lambda: f'/api/loans/{loan.id}/approve/', 'staff', None),
+            'payment-list': ('get', '/api/payments/', 'staff', None),
+            'payment-detail': ('get', lambda: f"/api/payments/{first_id(Payment)}/", 'staff', None),
+            'repaymentschedule-list': ('get', '/api/repayment-schedules/', 'staff', None),
+            'repaymentschedule-detail': ('get', lambda: f"/api/repayment-schedules/{first_id(RepaymentSchedule)}/", 'staff', None),
+            'report-list': ('get', '/api/reports/', 'staff', None),
+            'report-detail': ('get', lambda: f"/api/reports/{first_id(Report)}/", 'staff', None),
+            'nationalidverification-list': ('get', '/api/national-id-verifications/', 'staff', None),
+            'nationalidverification-detail': ('get', lambda: f"/api/national-id-verifications/{first_id(NationalIDVerification)}/", 'staff', None),
+            'university-list': ('get', '/api/universities/', None, None),
+            'university-detail': ('get', lambda: f"/api/universities/{ctx['university'].id}/", None, None),
+            'course-list': ('get', '/api/courses/', None, None),
+            'course-detail': ('get', lambda: f"/api/courses/{ctx['course'].id}/", None, None),
+            'push-subscription-list': ('get', '/api/push-subscriptions/', 'member', None),
+            'push-subscription-detail': ('get', lambda: f"/api/push-subscriptions/{first_id(PushSubscription, user=member)}/", 'member', None),
+            'push-subscription-unsubscribe': ('post', '/api/push-subscriptions/unsubscribe/', 'member', lambda: {'endpoint': 'https://push.bench.test/missing'}),
+            'push-subscription-send-notification': ('post', '/api/push-subscriptions/send_notification/', 'staff', lambda: {'title': 'Bench', 'body': 'Bench'}),
+            'push-notification-list': ('get', '/api/push-notifications/', 'member', None),
+            'push-notification-broadcast': ('post', '/api/push-notifications/broadcast/', 'staff', lambda: {'title': 'Bench', 'body': 'Bench'}),
+            'push-notification-detail': ('get', lambda: f"/api/push-notifications/{first_id(PushNotification, user=member)}/", 'member', None),
+            'register': ('post', '/api/auth/register/', None, register_data),
+            'login': ('post', '/api/auth/login/', None, lambda: {'identifier': member.email, 'password': PASSWORD}),
+            'logout': ('post', '/api/auth/logout/', 'logout', None),
+            'current-user': ('get', '/api/auth/user/', 'member', None),
+            'password-reset-request': ('post', '/api/auth/password-reset/', None, lambda: {'email': member.email}),
+            'password-reset-confirm': ('post', '/api/auth/password-reset-confirm/', None, lambda: {'uid': 'x', 'token': 'x', 'new_password': PASSWORD, 'confirm_password': PASSWORD}),
+            'dashboard-stats': ('get', '/api/dashboard/stats/', 'member', None),
+            'dashboard-cache-stats': ('get', '/api/dashboard/cache-stats/', 'staff', None),
+            'profiling-stats': ('get', '/api/profiling/stats/', 'staff', None),
+            'test-email-config': ('get', '/api/test/email-config/', None, None),
+            'initiate-deposit': ('post', '/api/payment-requests/initiate-deposit/', 'member', lambda: {'amount': 5000, 'phone_number': '+256700000000'}),
+            'verify-deposit': ('post', '/api/payment-requests/verify-deposit/', 'member', lambda: {'tx_ref': pending_deposit().tx_ref}),
+            'relworx-webhook': ('post', '/api/payment-requests/relworx-webhook/', None, webhook_request),
+        }
+
+    def _run(self, ctx, options):
+        scenarios = self._scenarios(ctx)
+        routes = _api_route_names()
+        only = set(options['only'].split(',')) if options['only'] else None
+
+        missing = sorted(routes - set(scenarios))
+        if missing:
+            self.stdout.write(self.style.WARNING(f"⚠️  Routes without a benchmark scenario: {', '.join(missing)}"))
+
+        clients = {None: Client()}
+        for role in ('member', 'staff'):
+            clients[role] = Client()
+            clients[role].force_login(ctx[role])
+        # Logging out flushes the session, so it gets a client of its own
+        clients['logout'] = Client()
+
+        results = {}
+        for name, (method, path, role, data_fn) in scenarios.items():
+            if only and name not in only:
+                continue
+            if name not in routes:
+                continue
+
+            self.stdout.write(f"  → {name}")
+            client = clients[role]
+
+            def call():
+                url = path() if callable(path) else path
+                data, extra = {}, {}
+                if data_fn is not None:
+                    data = data_fn()
+                    if isinstance(data, tuple):
+                        data, extra = data
+                if name == 'logout':
+                    client.force_login(ctx['member'])
+                request = getattr(client, method)
+                if method == 'get':
+                    return request(url, secure=True, **extra)
+                return request(url, data=data, content_type='application/json', secure=True, **extra)
+
+            for _ in range(options['warmup']):
+                call()
+
+            # Memory pass (tracemalloc slows requests down, so it is not timed)
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            timings, queries, statuses = [], [], set()
+            for _ in range(options['iterations']):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = call()
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(captured.captured_queries))
+                statuses.add(response.status_code)
+
+            results[name] = {
+                'method': method.upper(),
+                'p50_ms': round(statistics.median(timings), 2),
+                'p95_ms': round(_percentile(timings, 95), 2),
+                'max_ms': round(max(timings), 2),
+                'queries': max(queries),
+                'peak_kb': round(peak / 1024, 1),
+                'status': sorted(statuses),
+            }
+
+        return results
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def _print_results(self, results):
+        self.stdout.write(self.style.WARNING('\n📊 Results'))
+        self.stdout.write(self.style.WARNING('=' * 70))
+        header = f"{'route':<40} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'peak KB':>9}  status"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, row in sorted(results.items()):
+            self.stdout.write(
+                f"{name:<40} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['queries']:>8} "
+                f"{row['peak_kb']:>9.1f}  {','.join(str(s) for s in row['status'])}"
+            )
+
+    def _compare(self, report, baseline_path, threshold):
+        with open(baseline_path) as handle:
+            baseline = json.load(handle)
+
+        self.stdout.write(self.style.WARNING(f"\n🔍 Comparing with {baseline_path} (revision {baseline['meta'].get('revision')})"))
+        regressions = []
+        for name, row in sorted(report['results'].items()):
+            base = baseline['results'].get(name)
+            if not base:
+                continue
+            slower = base['p95_ms'] and (row['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100
+            more_queries = row['queries'] - base['queries']
+            if slower > threshold or more_queries > 0:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f"   ❌ {name}: p95 {base['p95_ms']:.2f} → {row['p95_ms']:.2f} ms ({slower:+.0f}%), "
+                    f"queries {base['queries']} → {row['queries']}"
+                ))
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} endpoint(s) regressed beyond {threshold:.0f}% p95 or added queries")
+        self.stdout.write(self.style.SUCCESS('   ✅ No regressions'))
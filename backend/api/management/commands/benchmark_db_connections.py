@@ -0,0 +1,97 @@
+"""
+Management command to measure what persistent database connections save per request
+
+Replays the request cycle (request_started, one query, request_finished)
+against the configured database, first with CONN_MAX_AGE=0 (a new
+connection, and SSL handshake, for every request) and then with persistent
+connections, using --threads concurrent "workers". Run it from the web
+service's environment against the real PostgreSQL server.
+
+Examples:
+    python manage.py benchmark_db_connections --requests 500 --threads 4
+    DB_POOLER=pgbouncer DB_PORT=6432 python manage.py benchmark_db_connections
+"""
+import statistics
+import threading
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+
+from api.management.commands.benchmark_api import _percentile
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request latency with and without persistent database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per worker thread')
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent worker threads')
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE for the persistent run')
+
+    def run_worker(self, max_age, requests, timings):
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.close()
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            request_started.send(sender=WSGIHandler, environ={})
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            request_finished.send(sender=WSGIHandler)
+            samples.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        timings.extend(samples)
+
+    def measure(self, max_age, requests, threads):
+        timings = []
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count)
+        try:
+            workers = [
+                threading.Thread(target=self.run_worker, args=(max_age, requests, timings))
+                for _ in range(threads)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            connection_created.disconnect(count)
+
+        return {
+            'connections': len(opened),
+            'mean_ms': statistics.mean(timings),
+            'p50_ms': statistics.median(timings),
+            'p95_ms': _percentile(timings, 95),
+        }
+
+    def handle(self, *args, **options):
+        settings_dict = connections['default'].settings_dict
+        self.stdout.write(self.style.WARNING(
+            f"🔌 {settings_dict['ENGINE'].rsplit('.', 1)[-1]} at {settings_dict.get('HOST') or settings_dict['NAME']}: "
+            f"{options['threads']} threads x {options['requests']} requests"
+        ))
+
+        results = [
+            ('reconnect (CONN_MAX_AGE=0)', self.measure(0, options['requests'], options['threads'])),
+            (f"persistent (CONN_MAX_AGE={options['max_age']})",
+             self.measure(options['max_age'], options['requests'], options['threads'])),
+        ]
+
+        self.stdout.write(f"{'mode':<32} {'connections':>11} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, row in results:
+            self.stdout.write(
+                f"{name:<32} {row['connections']:>11} {row['mean_ms']:>8.2f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}"
+            )
+
+        saved = results[0][1]['mean_ms'] - results[1][1]['mean_ms']
+        self.stdout.write(self.style.SUCCESS(f"✅ Persistent connections save {saved:.2f} ms per request"))
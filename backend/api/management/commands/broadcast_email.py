@@ -0,0 +1,74 @@
+"""
+Management command to email an announcement to every member who has email notifications on
+
+Each member gets the precompiled 'broadcast' template rendered with their
+name and in their language; messages are queued as send_emails jobs of
+EMAIL_BATCH_SIZE, so the job worker delivers each batch over one connection.
+
+Usage:
+    python manage.py broadcast_email --title "AGM on 12 March" --message "Join us at ..."
+    python manage.py broadcast_email --title "..." --message "..." --verified-only --yes
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.jobs import enqueue
+from api.utils import email_templates
+
+User = get_user_model()
+
+RECIPIENT_FIELDS = ('email', 'username', 'first_name', 'last_name', 'language')
+
+
+class Command(BaseCommand):
+    help = 'Email an announcement to all members with email notifications enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--title', type=str, required=True, help='Email subject and heading')
+        parser.add_argument('--message', type=str, required=True, help='Announcement text')
+        parser.add_argument('--url', type=str, default=None, help='Link shown under the message')
+        parser.add_argument('--verified-only', action='store_true', help='Send only to verified users')
+        parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation')
+
+    def handle(self, *args, **options):
+        recipients = User.objects.filter(is_active=True, email_notifications=True).exclude(email='')
+        if options['verified_only']:
+            recipients = recipients.filter(is_verified=True)
+
+        total = recipients.count()
+        if not total:
+            self.stdout.write(self.style.ERROR('❌ No members with email notifications enabled'))
+            return
+
+        self.stdout.write(self.style.WARNING(f"📧 Broadcasting '{options['title']}' to {total} member(s)"))
+        if not options['yes']:
+            confirm = input(f"\n⚠️  Queue email to {total} member(s)? (yes/no): ")
+            if confirm.lower() != 'yes':
+                self.stdout.write(self.style.WARNING('❌ Broadcast cancelled'))
+                return
+
+        batch_size = getattr(settings, 'EMAIL_BATCH_SIZE', 50)
+        context = {'title': options['title'], 'message': options['message'], 'url': options['url']}
+        started = time.perf_counter()
+        batch, queued, jobs = [], 0, 0
+
+        for user in recipients.only(*RECIPIENT_FIELDS).order_by('pk').iterator(chunk_size=2000):
+            batch.append(email_templates.message(
+                'broadcast', user.email, {**context, 'name': user.get_full_name() or user.username},
+                language=user.language,
+            ))
+            if len(batch) == batch_size:
+                enqueue('send_emails', {'messages': batch})
+                queued, jobs, batch = queued + len(batch), jobs + 1, []
+
+        if batch:
+            enqueue('send_emails', {'messages': batch})
+            queued, jobs = queued + len(batch), jobs + 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Queued {queued} emails in {jobs} send_emails job(s) ({elapsed:.2f}s)"
+        ))
@@ -0,0 +1,25 @@
+"""
+Management command to snapshot borrower loan and payment totals into Report rows
+
+Usage:
+  python manage.py build_reports          # Daily cron: borrowers with activity since the last run
+  python manage.py build_reports --full   # Every borrower
+"""
+from django.core.management.base import BaseCommand
+
+from api.reports import build_reports
+
+
+class Command(BaseCommand):
+    help = 'Write Report snapshots for borrowers whose loans or payments changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Snapshot every borrower, not only changed ones')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('📊 Building borrower reports...'))
+        run = build_reports(full=options['full'])
+        elapsed = (run.finished_at - run.started_at).total_seconds()
+
+        kind = 'full' if run.full else 'incremental'
+        self.stdout.write(self.style.SUCCESS(f'✅ {run.borrowers} borrower reports written ({kind}) in {elapsed:.2f}s'))
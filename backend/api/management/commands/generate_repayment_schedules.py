@@ -0,0 +1,50 @@
+"""
+Management command to (re)generate loan repayment schedules in bulk
+
+Usage:
+  python manage.py generate_repayment_schedules                          # Approved/disbursed loans, replace unpaid schedules
+  python manage.py generate_repayment_schedules --missing-only           # Only loans without a schedule
+  python manage.py generate_repayment_schedules --status PENDING --status APPROVED
+  python manage.py generate_repayment_schedules --batch-size 500
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.loans import DEFAULT_BATCH_SIZE, regenerate_schedules
+from api.models import Loan
+
+
+class Command(BaseCommand):
+    help = 'Generate RepaymentSchedule rows for many loans in one transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=[choice for choice, _ in Loan.LOAN_STATUS_CHOICES],
+            help='Only loans in this status (repeatable; default: APPROVED and DISBURSED)'
+        )
+        parser.add_argument('--missing-only', action='store_true', help='Skip loans that already have a schedule')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Loans per insert batch')
+
+    def handle(self, *args, **options):
+        statuses = options['status'] or ['APPROVED', 'DISBURSED']
+        loans = Loan.objects.filter(loan_status__in=statuses)
+
+        self.stdout.write(self.style.WARNING('📅 Generating repayment schedules...'))
+        started = time.perf_counter()
+        report = regenerate_schedules(loans, batch_size=options['batch_size'], missing_only=options['missing_only'])
+        elapsed = time.perf_counter() - started
+
+        per_loan = elapsed * 1000 / report['loans'] if report['loans'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {report['installments']} installments for {report['loans']} loans "
+            f"in {elapsed:.2f}s ({per_loan:.2f} ms/loan)"
+        ))
+        if report['skipped_paid']:
+            self.stdout.write(self.style.WARNING(
+                f"⏭️ {report['skipped_paid']} loans kept their schedule because an installment is paid"
+            ))
+        for loan_id, error in report['errors'].items():
+            self.stdout.write(self.style.ERROR(f"⚠️ Loan {loan_id}: {error}"))
@@ -0,0 +1,59 @@
+"""
+Management command to reconcile pending deposits with Relworx
+
+Usage:
+  python manage.py poll_pending_deposits                 # One batch (cron)
+  python manage.py poll_pending_deposits --loop          # Keep polling every --interval seconds
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.deposits import poll_pending_deposits
+from api.utils import metrics
+
+
+class Command(BaseCommand):
+    help = 'Settle pending deposits that are due for a check, using one Relworx history call per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'DEPOSIT_POLL_BATCH_SIZE', 200),
+            help='Maximum deposits checked per pass'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Run continuously'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=getattr(settings, 'DEPOSIT_POLL_INTERVAL', 10),
+            help='Seconds between passes when looping'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            stats = poll_pending_deposits(batch_size=options['batch_size'])
+
+            if stats['checked']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ Checked {stats['checked']} deposits: {stats['COMPLETED']} completed, "
+                    f"{stats['FAILED']} failed, {stats['PENDING']} still pending "
+                    f"({stats['remote_calls']} Relworx calls)"
+                ))
+
+            if not options['loop']:
+                break
+            metrics.maybe_flush()
+
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
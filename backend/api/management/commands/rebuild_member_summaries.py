@@ -0,0 +1,31 @@
+"""
+Management command to rebuild precomputed member dashboard summaries from scratch
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils.member_summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild MemberSummary rows from accounts, deposits, loans, payments and share transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Only rebuild the summary for this user (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        started = time.monotonic()
+
+        self.stdout.write(self.style.WARNING('📊 Rebuilding member summaries...'))
+        written = rebuild_summaries(user_ids)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {written} summaries in {elapsed:.2f}s'))
@@ -0,0 +1,74 @@
+"""
+Management command to reconcile all deposits against Relworx transaction history
+
+Usage:
+  python manage.py reconcile_deposits                          # Fetch 30-day history and apply fixes
+  python manage.py reconcile_deposits --dry-run                # Report only
+  python manage.py reconcile_deposits --history-file dump.json # Use a saved history export
+  python manage.py reconcile_deposits --output report.json     # Save the full report
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.deposits import reconcile_deposits
+
+
+class Command(BaseCommand):
+    help = 'Diff deposits against one Relworx transaction history call and settle what it resolves'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report differences without changing deposits')
+        parser.add_argument('--history-file', help='Reconcile against a saved get_transaction_history() payload')
+        parser.add_argument('--output', help='Write the full report as JSON to this path')
+
+    def load_history(self, path):
+        if path:
+            try:
+                with open(path) as handle:
+                    return json.load(handle)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read history file {path}: {e}")
+
+        from api.relworx import get_gateway
+
+        result = get_gateway().get_transaction_history()
+        if not result['success']:
+            raise CommandError(f"Relworx history request failed: {result.get('error')}")
+        return result['data']
+
+    def handle(self, *args, **options):
+        history = self.load_history(options['history_file'])
+
+        self.stdout.write(self.style.WARNING('🔍 Reconciling deposits against Relworx history...'))
+        report = reconcile_deposits(history, apply=not options['dry_run'])
+
+        verb = 'Would settle' if options['dry_run'] else 'Settled'
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {report['history']} provider transactions, {report['matched']} matched deposits. "
+            f"{verb} {len(report['completed'])} completed and {len(report['failed'])} failed."
+        ))
+
+        for mismatch in report['amount_mismatches']:
+            self.stdout.write(self.style.ERROR(
+                f"⚠️ Amount mismatch {mismatch['tx_ref']}: ours {mismatch['amount']}, Relworx {mismatch['provider_amount']}"
+            ))
+        for conflict in report['conflicts']:
+            self.stdout.write(self.style.ERROR(
+                f"⚠️ Status conflict {conflict['tx_ref']}: ours {conflict['status']}, Relworx {conflict['provider_status']}"
+            ))
+        if report['orphans']:
+            self.stdout.write(self.style.ERROR(
+                f"⚠️ {len(report['orphans'])} Relworx transactions have no deposit: {', '.join(report['orphans'][:20])}"
+            ))
+
+        if report['local_orphans']:
+            self.stdout.write(self.style.ERROR(
+                f"⚠️ {len(report['local_orphans'])} pending deposits are missing from the Relworx history: "
+                f"{', '.join(report['local_orphans'][:20])}"
+            ))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"📄 Report written to {options['output']}"))
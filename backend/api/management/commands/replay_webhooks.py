@@ -0,0 +1,64 @@
+"""
+Management command to reprocess stored Relworx webhook events
+
+Usage:
+  python manage.py replay_webhooks --since 2025-01-01T00:00 --until 2025-01-02T00:00
+  python manage.py replay_webhooks --status FAILED                # Retry events that gave up
+  python manage.py replay_webhooks --reference SACCO_12_ABCDEF    # One deposit's events
+  python manage.py replay_webhooks --since 2025-01-01 --dry-run
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from api.models import WebhookEvent
+from api.webhooks import replay, select_events
+
+
+def _parse_moment(value):
+    if value is None:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Not a date or datetime: {value}")
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Reprocess stored Relworx webhook events received in a time range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Replay events received at or after this date/datetime')
+        parser.add_argument('--until', help='Replay events received before this date/datetime')
+        parser.add_argument('--reference', help='Only events for this deposit tx_ref')
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=[choice for choice, _ in WebhookEvent.STATUS_CHOICES],
+            help='Only events in this status (repeatable; default: all)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count matching events')
+
+    def handle(self, *args, **options):
+        since = _parse_moment(options['since'])
+        until = _parse_moment(options['until'])
+        if not (since or until or options['reference'] or options['status']):
+            raise CommandError('Give --since/--until, --reference or --status to select events')
+
+        selection = dict(since=since, until=until, reference=options['reference'], statuses=options['status'])
+
+        if options['dry_run']:
+            count = select_events(**selection).count()
+            self.stdout.write(self.style.WARNING(f'🔍 {count} events would be replayed'))
+            return
+
+        self.stdout.write(self.style.WARNING('🔁 Replaying webhook events...'))
+        replayed = replay(**selection)
+        self.stdout.write(self.style.SUCCESS(f'✅ Replayed {replayed} events'))
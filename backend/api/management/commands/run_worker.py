@@ -0,0 +1,58 @@
+"""
+Management command to run background job workers
+
+Usage:
+  python manage.py run_worker                 # Run until interrupted
+  python manage.py run_worker --threads 8     # Eight concurrent worker threads
+  python manage.py run_worker --once          # Drain due jobs and exit (cron)
+"""
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.jobs import Worker, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs (emails, push notifications, ...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=getattr(settings, 'JOBS_WORKER_THREADS', 4),
+            help='Number of worker threads'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=getattr(settings, 'JOBS_POLL_INTERVAL', 1.0),
+            help='Seconds an idle thread waits before polling again'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every job that is currently due, then exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            executed = run_pending()
+            self.stdout.write(self.style.SUCCESS(f'✅ Ran {executed} jobs'))
+            return
+
+        worker = Worker(threads=options['threads'], poll_interval=options['poll_interval'])
+
+        def shutdown(signum, frame):
+            self.stdout.write(self.style.WARNING('🛑 Stopping after current jobs...'))
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        self.stdout.write(self.style.WARNING(
+            f"⚙️ Starting {options['threads']} worker threads (polling every {options['poll_interval']}s)"
+        ))
+        worker.run()
+        self.stdout.write(self.style.SUCCESS('✅ Worker stopped'))
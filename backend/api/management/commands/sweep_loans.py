@@ -0,0 +1,38 @@
+"""
+Management command to update installment and loan statuses in bulk
+
+Usage:
+  python manage.py sweep_loans                      # Run from cron, e.g. hourly
+  python manage.py sweep_loans --date 2025-06-30    # Judge overdue installments as of a date
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.loans import sweep_loans
+from api.utils import metrics
+
+
+class Command(BaseCommand):
+    help = 'Mark repayment installments paid/overdue and complete fully paid loans with set-based updates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Date to compare due dates against (default: today)')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            today = parse_date(options['date'])
+            if today is None:
+                raise CommandError(f"Not a date: {options['date']}")
+
+        started = time.perf_counter()
+        counts = sweep_loans(today)
+        elapsed = time.perf_counter() - started
+        metrics.flush()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {counts['paid']} installments paid, {counts['overdue']} overdue, "
+            f"{counts['completed']} loans completed in {elapsed:.2f}s"
+        ))
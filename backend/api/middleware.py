@@ -0,0 +1,115 @@
+"""
+Custom middleware for the SomaSave API
+"""
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.exceptions import MiddlewareNotUsed
+import time
+
+SESSION_REFRESHED_KEY = '_refreshed_at'
+
+
+class SlidingSessionMiddleware:
+    """
+    Keep active sessions alive without saving them on every request.
+    
+    With SESSION_SAVE_EVERY_REQUEST the session row was rewritten on every API
+    call just to push its expiry forward. Instead, a session is only marked
+    modified when its last refresh is more than SESSION_REFRESH_INTERVAL
+    seconds old; SessionMiddleware then saves it with a fresh expiry and
+    re-issues the cookie. Must sit directly below SessionMiddleware.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        response = self.get_response(request)
+        
+        session = getattr(request, 'session', None)
+        if session is None or not session.session_key or session.modified:
+            return response
+        
+        # Only signed-in sessions slide; never create a session for an anonymous request
+        if SESSION_KEY not in session or session.get_expire_at_browser_close():
+            return response
+        
+        now = int(time.time())
+        interval = getattr(settings, 'SESSION_REFRESH_INTERVAL', 900)
+        if now - session.get(SESSION_REFRESHED_KEY, 0) >= interval:
+            session[SESSION_REFRESHED_KEY] = now
+        
+        return response
+
+
+class RequestProfilingMiddleware:
+    """
+    Record wall time, SQL and outbound HTTP time per view (see api.utils.profiling).
+    
+    Opt-in with PROFILING_ENABLED; when off Django drops the middleware at
+    startup, so it costs nothing. Sits first in MIDDLEWARE so session and
+    authentication queries are included.
+    """
+    
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        from .utils import profiling
+        
+        with profiling.profile_request() as (profile, profiler):
+            response = self.get_response(request)
+        
+        profiling.record(profiling.view_name_for(request), profile, response.status_code, profiler)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record request latency, status, query count and worker busy time for /metrics.
+    
+    Routes are labelled by URL name so the label set stays bounded. Disabled
+    with METRICS_ENABLED=False.
+    """
+    
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        
+        from .utils import metrics
+        self.metrics = metrics
+        metrics.WORKER_PROCESSES.set(1)
+    
+    def __call__(self, request):
+        from django.db import connection
+        
+        metrics = self.metrics
+        queries = [0]
+        
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+        
+        metrics.WORKER_REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            with connection.execute_wrapper(count_query):
+                response = self.get_response(request)
+            status_code = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            match = getattr(request, 'resolver_match', None)
+            route = match.view_name if match else 'unresolved'
+            
+            metrics.WORKER_REQUESTS_IN_PROGRESS.dec()
+            metrics.WORKER_BUSY_SECONDS.inc(elapsed)
+            metrics.HTTP_REQUEST_SECONDS.observe(elapsed, route=route, method=request.method)
+            metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=status_code)
+            metrics.HTTP_REQUEST_QUERIES.observe(queries[0], route=route)
+            metrics.DB_QUERIES.inc(queries[0], route=route)
+            metrics.maybe_flush()
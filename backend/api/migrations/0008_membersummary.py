@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_customuser_push_notifications_enabled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_savings', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('active_loans_count', models.IntegerField(default=0)),
+                ('active_loans_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_repayments', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('dividends_ytd', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('dividends_year', models.IntegerField(default=0)),
+                ('deposits_30d', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('window_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'api_membersummary',
+            },
+        ),
+    ]
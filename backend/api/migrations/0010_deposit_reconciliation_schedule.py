@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:31
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_pending_deposits(apps, schema_editor):
+    """Queue deposits that are already pending for the reconciliation poller"""
+    Deposit = apps.get_model('api', 'Deposit')
+    Deposit.objects.filter(status='PENDING').update(next_check_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deposit',
+            name='check_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='deposit',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['status', 'next_check_at'], name='deposit_status_next_check_idx'),
+        ),
+        migrations.RunPython(schedule_pending_deposits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+def start_account_number_sequence(apps, schema_editor):
+    """Continue numbering after the highest SACCO-############ number already issued"""
+    Account = apps.get_model('api', 'Account')
+    NumberSequence = apps.get_model('api', 'NumberSequence')
+
+    highest = 0
+    for number in Account.objects.filter(account_number__startswith='SACCO-').values_list('account_number', flat=True).iterator():
+        suffix = number[len('SACCO-'):]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    # Registrations numbered by count() may have skipped values; never go below it
+    highest = max(highest, Account.objects.count())
+
+    NumberSequence.objects.update_or_create(name='account_number', defaults={'next_value': highest + 1})
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE SEQUENCE IF NOT EXISTS api_account_number_seq")
+        schema_editor.execute("SELECT setval('api_account_number_seq', %s, false)", [highest + 1])
+
+
+def drop_account_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP SEQUENCE IF EXISTS api_account_number_seq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_deposit_reconciliation_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+            options={
+                'db_table': 'api_numbersequence',
+            },
+        ),
+        migrations.RunPython(start_account_number_sequence, drop_account_number_sequence),
+    ]
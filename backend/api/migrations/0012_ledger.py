@@ -0,0 +1,85 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+OPENING_BOOK = 'OPENING_BALANCES'
+
+
+def open_existing_balances(apps, schema_editor):
+    """Post each existing balance as an opening entry so ledger sums match Account.balance"""
+    Account = apps.get_model('api', 'Account')
+    LedgerTransaction = apps.get_model('api', 'LedgerTransaction')
+    LedgerEntry = apps.get_model('api', 'LedgerEntry')
+
+    accounts = Account.objects.exclude(balance=0).only('id', 'account_type', 'balance').order_by('id')
+    batch = []
+
+    def flush(batch):
+        postings = LedgerTransaction.objects.bulk_create([
+            LedgerTransaction(reference=f'OPENING-{account.pk}', kind='OPENING', description='Opening balance')
+            for account in batch
+        ])
+        # Re-read ids: not every backend returns them from bulk_create
+        ids = dict(LedgerTransaction.objects.filter(
+            reference__in=[posting.reference for posting in postings]
+        ).values_list('reference', 'id'))
+        entries = []
+        for account in batch:
+            transaction_id = ids[f'OPENING-{account.pk}']
+            entries.append(LedgerEntry(
+                transaction_id=transaction_id, account_id=account.pk, book=account.account_type,
+                amount=account.balance, balance_after=account.balance
+            ))
+            entries.append(LedgerEntry(transaction_id=transaction_id, book=OPENING_BOOK, amount=-account.balance))
+        LedgerEntry.objects.bulk_create(entries)
+
+    for account in accounts.iterator(chunk_size=2000):
+        batch.append(account)
+        if len(batch) >= 2000:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_account_number_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100, unique=True)),
+                ('kind', models.CharField(max_length=30)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'api_ledgertransaction',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.CharField(max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('balance_after', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='api.account')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='api.ledgertransaction')),
+            ],
+            options={
+                'db_table': 'api_ledgerentry',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['account', '-id'], name='ledger_account_recent_idx')],
+            },
+        ),
+        migrations.RunPython(open_existing_balances, migrations.RunPython.noop),
+    ]
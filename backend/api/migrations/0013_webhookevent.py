@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='relworx', max_length=30)),
+                ('event_key', models.CharField(max_length=255)),
+                ('reference', models.CharField(db_index=True, max_length=100)),
+                ('payload', models.JSONField(default=dict)),
+                ('signature_timestamp', models.CharField(blank=True, max_length=50)),
+                ('status', models.CharField(choices=[('RECEIVED', 'Received'), ('PROCESSED', 'Processed'), ('IGNORED', 'Ignored'), ('FAILED', 'Failed')], default='RECEIVED', max_length=20)),
+                ('deliveries', models.PositiveIntegerField(default=1)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'api_webhookevent',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='webhook_event_status_idx'), models.Index(fields=['received_at'], name='webhook_event_received_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='webhookevent',
+            constraint=models.UniqueConstraint(fields=('provider', 'event_key'), name='webhook_event_provider_key_uniq'),
+        ),
+    ]
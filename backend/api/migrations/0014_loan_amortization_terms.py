@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='interest_method',
+            field=models.CharField(choices=[('REDUCING', 'Reducing balance'), ('FLAT', 'Flat rate')], default='REDUCING', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='repayment_frequency',
+            field=models.CharField(choices=[('MONTHLY', 'Monthly'), ('WEEKLY', 'Weekly')], default='MONTHLY', max_length=20),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_loan_amortization_terms'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='repaymentschedule',
+            index=models.Index(fields=['status', 'due_date'], name='repayment_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repaymentschedule',
+            index=models.Index(fields=['loan', 'installment_number'], name='repayment_loan_number_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_incremental_reports'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='deposit',
+            name='deposit_status_next_check_idx',
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['email'], name='customuser_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['next_check_at'], name='deposit_pending_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='deposit_user_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['borrower', 'loan_status'], name='loan_borrower_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginactivity',
+            index=models.Index(fields=['user', '-login_time'], name='login_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pushsubscription',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='push_sub_active_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharetransaction',
+            index=models.Index(fields=['user', 'transaction_type', 'timestamp'], name='share_user_type_time_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileImageUpload',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pending_profile_image', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('image', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'api_profileimageupload',
+            },
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_image_status',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_profile_image_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrower_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'api_reportdeletion',
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 # Create your models here.
 
@@ -46,6 +47,7 @@ class CustomUser(AbstractUser):
     gender = models.CharField(max_length=10, null=True, blank=True)
     next_of_kin = models.CharField(max_length=100, null=True, blank=True)
     profile_image = models.URLField(max_length=500, null=True, blank=True)
+    profile_image_status = models.CharField(max_length=20, blank=True, default='')  # PENDING/READY/FAILED while a new image is processed (see api/profile_images.py)
     
     # Student Information
     student_id = models.CharField(max_length=50, unique=True, null=True, blank=True)
@@ -71,6 +73,10 @@ class CustomUser(AbstractUser):
     
     class Meta:
         db_table = 'clients_portal_customuser'
+        indexes = [
+            # Login and password reset look members up by email
+            models.Index(fields=['email'], name='customuser_email_idx'),
+        ]
     
     def __str__(self):
         return f"{self.username} - {self.get_full_name()}"
@@ -99,10 +105,17 @@ class Deposit(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     status = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
+    next_check_at = models.DateTimeField(null=True, blank=True)  # When the reconciliation poller next checks a PENDING deposit
+    check_attempts = models.PositiveIntegerField(default=0)
     
     class Meta:
         db_table = 'clients_portal_deposit'
         ordering = ['-created_at']
+        indexes = [
+            # Only pending deposits are polled; settled ones never enter this index
+            models.Index(fields=['next_check_at'], condition=models.Q(status='PENDING'), name='deposit_pending_check_idx'),
+            models.Index(fields=['user', 'status', 'created_at'], name='deposit_user_status_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tx_ref} - {self.amount} - {self.status}"
@@ -120,6 +133,9 @@ class ShareTransaction(models.Model):
     class Meta:
         db_table = 'clients_portal_sharetransaction'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', 'transaction_type', 'timestamp'], name='share_user_type_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - {self.number_of_shares} shares"
@@ -137,6 +153,9 @@ class LoginActivity(models.Model):
     class Meta:
         db_table = 'clients_portal_loginactivity'
         ordering = ['-login_time']
+        indexes = [
+            models.Index(fields=['user', '-login_time'], name='login_user_recent_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.login_time}"
@@ -165,6 +184,14 @@ class Loan(models.Model):
         ('DISBURSED', 'Disbursed'),
         ('COMPLETED', 'Completed'),
     ]
+    INTEREST_METHOD_CHOICES = [
+        ('REDUCING', 'Reducing balance'),
+        ('FLAT', 'Flat rate'),
+    ]
+    REPAYMENT_FREQUENCY_CHOICES = [
+        ('MONTHLY', 'Monthly'),
+        ('WEEKLY', 'Weekly'),
+    ]
     
     borrower = models.ForeignKey(Borrower, on_delete=models.CASCADE, related_name='loans')
     loan_code = models.CharField(max_length=7, unique=True)
@@ -173,10 +200,17 @@ class Loan(models.Model):
     start_date = models.DateTimeField()
     due_date = models.DateTimeField()
     loan_status = models.CharField(max_length=20, choices=LOAN_STATUS_CHOICES, default='PENDING')
+    # How the repayment schedule is computed (interest_rate is a yearly percentage)
+    interest_method = models.CharField(max_length=20, choices=INTEREST_METHOD_CHOICES, default='REDUCING')
+    repayment_frequency = models.CharField(max_length=20, choices=REPAYMENT_FREQUENCY_CHOICES, default='MONTHLY')
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True, db_index=True)  # Drives incremental reports
     
     class Meta:
         db_table = 'adminapp_loan'
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['borrower', 'loan_status'], name='loan_borrower_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.loan_code} - {self.borrower.user.username}"
@@ -195,6 +229,7 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     payment_date = models.DateTimeField(auto_now_add=True)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='PENDING')
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True, db_index=True)  # Drives incremental reports
     
     class Meta:
         db_table = 'adminapp_payment'
@@ -221,6 +256,10 @@ class RepaymentSchedule(models.Model):
     class Meta:
         db_table = 'adminapp_repaymentschedule'
         ordering = ['due_date']
+        indexes = [
+            models.Index(fields=['status', 'due_date'], name='repayment_status_due_idx'),
+            models.Index(fields=['loan', 'installment_number'], name='repayment_loan_number_idx'),
+        ]
     
     def __str__(self):
         return f"Loan {self.loan.loan_code} - Installment {self.installment_number}"
@@ -241,6 +280,34 @@ class Report(models.Model):
         return f"Report for {self.borrower.user.username} - {self.report_date}"
 
 
+class ReportRun(models.Model):
+    """One pass of the borrower report builder (see api/reports.py)"""
+    started_at = models.DateTimeField()  # Loan/payment changes from here on are picked up by the next run
+    finished_at = models.DateTimeField(null=True, blank=True)
+    full = models.BooleanField(default=False)
+    borrowers = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'api_reportrun'
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"Report run {self.started_at} ({self.borrowers} borrowers)"
+
+
+class ReportDeletion(models.Model):
+    """A loan or payment deleted since the last report run; updated_at cannot show a delete"""
+    # Plain id: the borrower itself may be deleted along with its loans
+    borrower_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'api_reportdeletion'
+    
+    def __str__(self):
+        return f"Deletion for borrower {self.borrower_id} at {self.deleted_at}"
+
+
 class NationalIDVerification(models.Model):
     """National ID verification matching clients_portal_nationalidverification"""
     STATUS_CHOICES = [
@@ -284,6 +351,9 @@ class PushSubscription(models.Model):
     class Meta:
         db_table = 'api_pushsubscription'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user'], condition=models.Q(is_active=True), name='push_sub_active_user_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.endpoint[:50]}..."
@@ -313,3 +383,156 @@ class PushNotification(models.Model):
     
     def __str__(self):
         return f"{self.title} - {self.status}"
+
+
+class MemberSummary(models.Model):
+    """Precomputed per-member dashboard totals, maintained on every write"""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    total_savings = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    active_loans_count = models.IntegerField(default=0)
+    active_loans_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_repayments = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    dividends_ytd = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    dividends_year = models.IntegerField(default=0)
+    deposits_30d = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    window_date = models.DateField(null=True, blank=True)  # Day the rolling 30-day window was last rebuilt
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'api_membersummary'
+    
+    def __str__(self):
+        return f"Summary for {self.user_id}"
+
+
+class BackgroundJob(models.Model):
+    """Durable queue entry for work run outside the request cycle (see api/jobs.py)"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)  # Visibility timeout of a claimed job
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'api_backgroundjob'
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='api_job_status_run_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} - {self.status}"
+
+
+class NumberSequence(models.Model):
+    """Block allocator state for sequences on databases without native sequences (see api/utils/sequences.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=1)  # First value not yet handed out to any process
+    
+    class Meta:
+        db_table = 'api_numbersequence'
+    
+    def __str__(self):
+        return f"{self.name} @ {self.next_value}"
+
+
+class LedgerTransaction(models.Model):
+    """One balanced posting to the ledger; `reference` makes posting idempotent (see api/ledger.py)"""
+    reference = models.CharField(max_length=100, unique=True)  # e.g. a deposit tx_ref
+    kind = models.CharField(max_length=30)
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'api_ledgertransaction'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.kind} {self.reference}"
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only ledger line. Member-account lines carry the account's running
+    balance; lines against internal books (e.g. mobile money clearing) have no
+    account and no running balance.
+    """
+    transaction = models.ForeignKey(LedgerTransaction, on_delete=models.PROTECT, related_name='entries')
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, null=True, blank=True, related_name='ledger_entries')
+    book = models.CharField(max_length=50)  # Account type for member lines, internal book name otherwise
+    amount = models.DecimalField(max_digits=14, decimal_places=2)  # Positive credits, negative debits
+    balance_after = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'api_ledgerentry'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['account', '-id'], name='ledger_account_recent_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.book} {self.amount} ({self.transaction_id})"
+
+
+class WebhookEvent(models.Model):
+    """Inbox row for a received provider callback, processed by a background job (see api/webhooks.py)"""
+    STATUS_CHOICES = [
+        ('RECEIVED', 'Received'),
+        ('PROCESSED', 'Processed'),
+        ('IGNORED', 'Ignored'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    provider = models.CharField(max_length=30, default='relworx')
+    event_key = models.CharField(max_length=255)  # Provider's identity for the event; retries share it
+    reference = models.CharField(max_length=100, db_index=True)  # Our tx_ref (customer_reference)
+    payload = models.JSONField(default=dict)
+    signature_timestamp = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RECEIVED')
+    deliveries = models.PositiveIntegerField(default=1)  # Times the provider sent this event
+    attempts = models.PositiveIntegerField(default=0)  # Times we tried to process it
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'api_webhookevent'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_key'], name='webhook_event_provider_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_event_status_idx'),
+            models.Index(fields=['received_at'], name='webhook_event_received_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.provider} {self.event_key} - {self.status}"
+
+
+class ProfileImageUpload(models.Model):
+    """A member's downsized profile image waiting for the background upload to Cloudinary"""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='pending_profile_image')
+    image = models.BinaryField()  # JPEG, at most PROFILE_IMAGE_MAX_DIMENSION on the long edge
+    created_at = models.DateTimeField(auto_now=True)  # Replaced on every new upload
+    
+    class Meta:
+        db_table = 'api_profileimageupload'
+    
+    def __str__(self):
+        return f"Profile image for user {self.user_id} ({len(self.image)} bytes)"
@@ -0,0 +1,27 @@
+"""
+Keyset (cursor) pagination for API list endpoints
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class ModelOrderingCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on each model's natural ordering
+
+    Uses the view's `ordering` attribute when set, otherwise the model's
+    Meta.ordering (-created_at, -timestamp, -login_time, -payment_date, ...),
+    falling back to -pk for models without one. Pages are fetched with a
+    WHERE on the ordering column instead of OFFSET, so the cost of a page
+    does not grow with its position in the table.
+    """
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+    ordering = '-pk'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', None) or queryset.model._meta.ordering or self.ordering
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
@@ -0,0 +1,170 @@
+"""
+Profile image pipeline
+
+`PATCH /api/users/update-profile/` never talks to Cloudinary. The multipart
+upload is spooled to a temporary file (SpooledMultiPartParser), opened with
+Pillow, checked and downsized to PROFILE_IMAGE_MAX_DIMENSION on the long edge
+(JPEGs are decoded at reduced scale, so a 10MB photo never becomes a full
+size bitmap in the web worker), and the resulting small JPEG is stored in a
+ProfileImageUpload row. The member's profile_image_status becomes PENDING
+and the request returns.
+
+The upload_profile_image job then sends the stored JPEG to Cloudinary as
+public_id user_<id> with overwrite, so retries and duplicate jobs replace the
+same asset, saves the new URL and marks the status READY (or FAILED if
+Cloudinary rejects the image, or the job's last attempt errors). The image is kept in the database rather than
+on disk because the job worker may run on another machine.
+"""
+from io import BytesIO
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from rest_framework.parsers import MultiPartParser
+from .utils import metrics
+from .utils.profiling import external_call
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOUDINARY_FOLDER = 'somasave/profiles'
+# Cloudinary crops the face from the downsized image
+CLOUDINARY_TRANSFORMATION = [
+    {'width': 400, 'height': 400, 'crop': 'fill', 'gravity': 'face'},
+    {'quality': 'auto:good'},
+]
+ACCEPTED_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image we accept"""
+
+
+class SpooledMultiPartParser(MultiPartParser):
+    """Multipart parser that writes uploaded files to a temporary file instead of memory"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']._request
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().parse(stream, media_type=media_type, parser_context=parser_context)
+
+
+def public_id(user_id):
+    return f'user_{user_id}'
+
+
+def downsize(upload):
+    """
+    Validate an uploaded image and re-encode it as a small JPEG.
+
+    Args:
+        upload: UploadedFile (or any file object)
+
+    Returns:
+        bytes: JPEG no larger than PROFILE_IMAGE_MAX_DIMENSION on either edge
+
+    Raises:
+        InvalidImage: Too large, not an image, or an unsupported format
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    max_bytes = getattr(settings, 'PROFILE_IMAGE_MAX_UPLOAD_SIZE', 10485760)
+    max_dimension = getattr(settings, 'PROFILE_IMAGE_MAX_DIMENSION', 800)
+    max_pixels = getattr(settings, 'PROFILE_IMAGE_MAX_PIXELS', 40000000)
+
+    if getattr(upload, 'size', 0) > max_bytes:
+        raise InvalidImage(f'Image is larger than {max_bytes // 1048576}MB')
+
+    try:
+        upload.seek(0)
+        with Image.open(upload) as image:
+            if image.format not in ACCEPTED_FORMATS:
+                raise InvalidImage(f'Unsupported image format: {image.format}')
+            width, height = image.size
+            if width * height > max_pixels:
+                raise InvalidImage(f'Image is too large ({width}x{height})')
+
+            # Let the JPEG decoder scale down by up to 8x while decoding
+            image.draft('RGB', (max_dimension, max_dimension))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_dimension, max_dimension))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            output = BytesIO()
+            image.save(output, 'JPEG', quality=85, optimize=True)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise InvalidImage(f'Not a valid image: {e}') from e
+    return output.getvalue()
+
+
+def queue_upload(user, image):
+    """Store a member's downsized profile image and queue its upload to Cloudinary"""
+    from .jobs import enqueue
+    from .models import ProfileImageUpload
+
+    with transaction.atomic():
+        ProfileImageUpload.objects.update_or_create(user_id=user.pk, defaults={'image': image})
+        user.profile_image_status = 'PENDING'
+        user.save(update_fields=['profile_image_status'])
+        enqueue('upload_profile_image', {'user_id': user.pk})
+    logger.info(f"Profile image for user {user.pk} queued ({len(image)} bytes)")
+
+
+def upload_pending(user_id, final_attempt=False):
+    """
+    Send a member's pending profile image to Cloudinary.
+
+    Args:
+        final_attempt: On an error, mark the upload FAILED and drop the stored
+            image instead of leaving it PENDING for a retry that never comes
+
+    Returns:
+        str: READY, FAILED, or '' when there was nothing to upload
+
+    Raises:
+        Exception: Transient Cloudinary or network failure, the job is retried
+            (re-raised after marking the upload FAILED on the final attempt)
+    """
+    import cloudinary.exceptions
+    import cloudinary.uploader
+    from .models import CustomUser, ProfileImageUpload
+    from .utils.dashboard_cache import invalidate_dashboard
+
+    pending = ProfileImageUpload.objects.filter(user_id=user_id).first()
+    if pending is None:
+        return ''
+
+    error = None
+    try:
+        with external_call('cloudinary'):
+            result = cloudinary.uploader.upload(
+                BytesIO(bytes(pending.image)),
+                folder=CLOUDINARY_FOLDER,
+                public_id=public_id(user_id),
+                overwrite=True,
+                invalidate=True,
+                resource_type='image',
+                transformation=CLOUDINARY_TRANSFORMATION,
+            )
+        outcome, changes = 'READY', {'profile_image': result['secure_url']}
+    except (cloudinary.exceptions.BadRequest, cloudinary.exceptions.NotAllowed) as e:
+        logger.error(f"Cloudinary rejected the profile image for user {user_id}: {e}")
+        outcome, changes = 'FAILED', {}
+    except Exception as e:
+        if not final_attempt:
+            raise
+        logger.error(f"Profile image upload for user {user_id} failed on its last attempt: {e}")
+        outcome, changes, error = 'FAILED', {}, e
+
+    with transaction.atomic():
+        # A newer image uploaded meanwhile keeps its own row and job
+        if not ProfileImageUpload.objects.filter(user_id=user_id, created_at=pending.created_at).delete()[0]:
+            return ''
+        CustomUser.objects.filter(pk=user_id).update(profile_image_status=outcome, **changes)
+
+    invalidate_dashboard(user_id)
+    metrics.PROFILE_IMAGE_UPLOADS.inc(outcome=outcome.lower())
+    logger.info(f"Profile image for user {user_id}: {outcome} {changes.get('profile_image', '')}")
+    if error is not None:
+        raise error
+    return outcome
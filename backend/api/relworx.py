@@ -1,15 +1,82 @@
 """
 Relworx Payment Gateway Integration Module
 Handles all interactions with Relworx Payments API
+
+Use get_gateway() rather than instantiating RelworxPaymentGateway per request:
+the shared instance keeps a pooled keep-alive session (no TCP/TLS handshake per
+call) and a circuit breaker that fails fast while Relworx is degraded.
 """
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 import hashlib
 import hmac
+import random
+import threading
+import time
 from django.conf import settings
+from .utils.profiling import external_call
 
 logger = logging.getLogger(__name__)
 
+# Responses that indicate the provider, not the request, is at fault
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+
+
+class GatewayUnavailable(Exception):
+    """Raised when the circuit breaker is open and Relworx calls are short-circuited"""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker
+    
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail immediately for `reset_timeout` seconds. The first call after that is
+    let through as a trial: success closes the circuit, failure re-opens it.
+    """
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+    
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f"Relworx circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
 
 class RelworxPaymentGateway:
     """Wrapper for Relworx Payments API"""
@@ -19,6 +86,29 @@ class RelworxPaymentGateway:
         self.api_key = settings.RELWORX_API_KEY
         self.account_no = settings.RELWORX_ACCOUNT_NO
         self.webhook_key = settings.RELWORX_WEBHOOK_KEY
+        self.timeout = (
+            getattr(settings, 'RELWORX_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'RELWORX_READ_TIMEOUT', 20),
+        )
+        self.status_retries = getattr(settings, 'RELWORX_STATUS_RETRIES', 2)
+        self.breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'RELWORX_BREAKER_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'RELWORX_BREAKER_RESET', 30),
+        )
+        self.session = self._build_session()
+    
+    def _build_session(self):
+        """Keep-alive session sized for the number of concurrent web/worker threads"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=getattr(settings, 'RELWORX_POOL_CONNECTIONS', 2),
+            pool_maxsize=getattr(settings, 'RELWORX_POOL_MAXSIZE', 10),
+            max_retries=0,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self._get_headers())
+        return session
     
     def _get_headers(self):
         """Generate request headers for Relworx API"""
@@ -28,6 +118,50 @@ class RelworxPaymentGateway:
             'Authorization': f'Bearer {self.api_key}'
         }
     
+    def _request(self, method, url, retries=0, **kwargs):
+        """
+        Send a request through the shared session and circuit breaker.
+        
+        Only idempotent calls should pass `retries`; they are retried on
+        connection errors, timeouts and 429/5xx gateway responses with
+        exponential backoff and full jitter.
+        
+        Raises:
+            GatewayUnavailable: If the circuit is open
+            requests.exceptions.RequestException: On transport or HTTP errors
+        """
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise GatewayUnavailable("Payment provider is temporarily unavailable. Please try again shortly.")
+            
+            try:
+                with external_call('relworx'):
+                    response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                logger.warning(f"Relworx {method} {url} failed ({e}), retrying")
+            except Exception:
+                # Any other error (chunked encoding, redirect loop, ...) is a failed call too,
+                # and must end a half-open trial or the circuit never closes again
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= retries:
+                    response.raise_for_status()
+                    return response
+                logger.warning(f"Relworx {method} {url} returned {response.status_code}, retrying")
+            
+            attempt += 1
+            time.sleep(random.uniform(0, min(2.0, 0.25 * 2 ** attempt)))
+    
     def request_payment(self, reference, msisdn, currency, amount, description=None):
         """
         Request payment from mobile money subscriber
@@ -58,13 +192,12 @@ class RelworxPaymentGateway:
         logger.info(f"Requesting payment from Relworx: {reference}, {msisdn}, {currency} {amount}")
         logger.info(f"Relworx URL: {url}")
         logger.info(f"Relworx Payload: {payload}")
-        logger.info(f"Relworx Headers: {self._get_headers()}")
         
         try:
-            response = requests.post(url, json=payload, headers=self._get_headers(), timeout=30)
+            # Not retried: a repeated POST could charge the subscriber twice
+            response = self._request('POST', url, json=payload)
             logger.info(f"Relworx Response Status: {response.status_code}")
             logger.info(f"Relworx Response Text: {response.text}")
-            response.raise_for_status()
             
             data = response.json()
             logger.info(f"Relworx payment request successful: {data}")
@@ -90,7 +223,7 @@ class RelworxPaymentGateway:
                 'status_code': e.response.status_code
             }
             
-        except requests.exceptions.RequestException as e:
+        except (GatewayUnavailable, requests.exceptions.RequestException) as e:
             logger.error(f"Relworx request failed: {str(e)}")
             return {
                 'success': False,
@@ -125,8 +258,7 @@ class RelworxPaymentGateway:
             }
         
         try:
-            response = requests.get(url, params=params, headers=self._get_headers(), timeout=30)
-            response.raise_for_status()
+            response = self._request('GET', url, retries=self.status_retries, params=params)
             
             data = response.json()
             logger.info(f"Transaction status: {data}")
@@ -135,7 +267,7 @@ class RelworxPaymentGateway:
                 'data': data
             }
             
-        except requests.exceptions.RequestException as e:
+        except (GatewayUnavailable, requests.exceptions.RequestException) as e:
             logger.error(f"Failed to check status: {str(e)}")
             return {
                 'success': False,
@@ -159,8 +291,7 @@ class RelworxPaymentGateway:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=self._get_headers(), timeout=30)
-            response.raise_for_status()
+            response = self._request('POST', url, json=payload)
             
             data = response.json()
             return {
@@ -168,7 +299,7 @@ class RelworxPaymentGateway:
                 'data': data
             }
             
-        except requests.exceptions.RequestException as e:
+        except (GatewayUnavailable, requests.exceptions.RequestException) as e:
             logger.error(f"Validation failed: {str(e)}")
             return {
                 'success': False,
@@ -224,8 +355,7 @@ class RelworxPaymentGateway:
         }
         
         try:
-            response = requests.get(url, params=params, headers=self._get_headers(), timeout=30)
-            response.raise_for_status()
+            response = self._request('GET', url, retries=self.status_retries, params=params)
             
             data = response.json()
             return {
@@ -233,9 +363,23 @@ class RelworxPaymentGateway:
                 'data': data
             }
             
-        except requests.exceptions.RequestException as e:
+        except (GatewayUnavailable, requests.exceptions.RequestException) as e:
             logger.error(f"Failed to get transaction history: {str(e)}")
             return {
                 'success': False,
                 'error': str(e)
             }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return the process-wide RelworxPaymentGateway"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = RelworxPaymentGateway()
+    return _gateway
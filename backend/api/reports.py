@@ -0,0 +1,88 @@
+"""
+Borrower report snapshots
+
+`python manage.py build_reports` (daily cron) writes a Report row per
+borrower with their lending and repayment totals, computed with one grouped
+aggregate query per metric and inserted with bulk_create. Runs are
+incremental: only borrowers whose loans or payments changed since the last
+finished ReportRun get a new snapshot, found through the indexed
+Loan/Payment `updated_at` columns and, for deletes, the ReportDeletion rows
+written by api.signals. A borrower's current figures are their latest Report
+row; `--full` snapshots every borrower.
+"""
+from decimal import Decimal
+from django.db.models import Sum
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Loans that were actually granted count towards total_loans
+LENT_LOAN_STATUSES = ('APPROVED', 'DISBURSED', 'COMPLETED')
+BATCH_SIZE = 2000
+
+ZERO = Decimal('0.00')
+
+
+def _grouped_totals(queryset, borrower_ids):
+    return dict(
+        queryset.filter(borrower_id__in=borrower_ids)
+        .values('borrower_id').annotate(total=Sum('amount')).order_by()
+        .values_list('borrower_id', 'total')
+    )
+
+
+def changed_borrowers(since):
+    """IDs of borrowers with a loan or payment written or deleted at or after `since`"""
+    from .models import Borrower, Loan, Payment, ReportDeletion
+
+    loans = Loan.objects.filter(updated_at__gte=since).values_list('borrower_id', flat=True)
+    payments = Payment.objects.filter(updated_at__gte=since).values_list('borrower_id', flat=True)
+    # Borrowers deleted along with their loans have no report left to update
+    deleted = Borrower.objects.filter(
+        pk__in=ReportDeletion.objects.filter(deleted_at__gte=since).values('borrower_id')
+    ).values_list('pk', flat=True)
+    return sorted(set(loans.distinct()) | set(payments.distinct()) | set(deleted))
+
+
+def build_reports(full=False):
+    """
+    Snapshot totals for borrowers with new activity (or all with `full`).
+
+    Returns:
+        ReportRun: The finished run
+    """
+    from .models import Borrower, Loan, Payment, Report, ReportDeletion, ReportRun
+
+    previous = ReportRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+    full = full or previous is None
+    run = ReportRun.objects.create(started_at=timezone.now(), full=full)
+
+    if full:
+        borrower_ids = list(Borrower.objects.order_by('pk').values_list('pk', flat=True))
+    else:
+        borrower_ids = changed_borrowers(previous.started_at)
+
+    lent = Loan.objects.filter(loan_status__in=LENT_LOAN_STATUSES)
+    repaid = Payment.objects.filter(payment_status='COMPLETED')
+
+    for start in range(0, len(borrower_ids), BATCH_SIZE):
+        chunk = borrower_ids[start:start + BATCH_SIZE]
+        loan_totals = _grouped_totals(lent, chunk)
+        payment_totals = _grouped_totals(repaid, chunk)
+        Report.objects.bulk_create([
+            Report(
+                borrower_id=borrower_id,
+                total_loans=loan_totals.get(borrower_id) or ZERO,
+                total_payments=payment_totals.get(borrower_id) or ZERO,
+            )
+            for borrower_id in chunk
+        ])
+
+    run.borrowers = len(borrower_ids)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['borrowers', 'finished_at'])
+    # Deletes before this run's start are covered by its snapshots
+    ReportDeletion.objects.filter(deleted_at__lt=run.started_at).delete()
+    logger.info(f"Report run {run.pk}: {run.borrowers} borrower snapshots ({'full' if full else 'incremental'})")
+    return run
@@ -1,7 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.utils.encoding import force_bytes
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlsafe_base64_decode
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from .models import (
@@ -9,6 +8,28 @@ from .models import (
     Borrower, Loan, Payment, RepaymentSchedule, Report, NationalIDVerification,
     University, Course, PushSubscription, PushNotification
 )
+from .utils.sequences import allocate_account_number
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that honours a `?fields=id,amount,status` sparse fieldset
+    on GET requests, dropping every other field from the output
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        
+        allowed = {name.strip() for name in requested.split(',') if name.strip()}
+        for field_name in set(self.fields) - allowed:
+            self.fields.pop(field_name)
 
 
 class UniversitySerializer(serializers.ModelSerializer):
@@ -25,7 +46,7 @@ class CourseSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'code', 'university', 'university_name', 'duration_years', 'is_active']
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(DynamicFieldsModelSerializer):
     university_name = serializers.CharField(source='university.name', read_only=True)
     course_name = serializers.CharField(source='course.name', read_only=True)
     
@@ -34,9 +55,10 @@ class CustomUserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 
                   'national_id', 'date_of_birth', 'gender', 'next_of_kin', 'is_verified',
                   'student_id', 'university', 'university_name', 'course', 'course_name', 'year_of_study', 'profile_image',
-                  'email_notifications', 'sms_notifications', 'transaction_alerts', 'loan_reminders',
-                  'marketing_emails', 'language', 'currency', 'two_factor_auth', 'date_joined']
-        read_only_fields = ['id', 'is_verified', 'university_name', 'course_name', 'date_joined', 'username']
+                  'profile_image_status', 'email_notifications', 'sms_notifications', 'transaction_alerts',
+                  'loan_reminders', 'marketing_emails', 'language', 'currency', 'two_factor_auth', 'date_joined']
+        read_only_fields = ['id', 'is_verified', 'university_name', 'course_name', 'date_joined', 'username',
+                            'profile_image_status']
         extra_kwargs = {
             'profile_image': {'required': False, 'allow_null': True, 'allow_blank': True},
             'first_name': {'required': False},
@@ -54,15 +76,17 @@ class UserSettingsSerializer(serializers.ModelSerializer):
                   'loan_reminders', 'marketing_emails', 'push_notifications_enabled', 'language', 'currency', 'two_factor_auth']
 
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(DynamicFieldsModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     
     class Meta:
         model = Account
         fields = '__all__'
+        # Balances change only through api/ledger.py postings
+        read_only_fields = ['user', 'account_number', 'balance']
 
 
-class DepositSerializer(serializers.ModelSerializer):
+class DepositSerializer(DynamicFieldsModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     
     class Meta:
@@ -70,7 +94,7 @@ class DepositSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ShareTransactionSerializer(serializers.ModelSerializer):
+class ShareTransactionSerializer(DynamicFieldsModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     
     class Meta:
@@ -78,7 +102,7 @@ class ShareTransactionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class LoginActivitySerializer(serializers.ModelSerializer):
+class LoginActivitySerializer(DynamicFieldsModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     
     class Meta:
@@ -86,7 +110,7 @@ class LoginActivitySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class BorrowerSerializer(serializers.ModelSerializer):
+class BorrowerSerializer(DynamicFieldsModelSerializer):
     user = CustomUserSerializer(read_only=True)
     
     class Meta:
@@ -94,7 +118,7 @@ class BorrowerSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class LoanSerializer(serializers.ModelSerializer):
+class LoanSerializer(DynamicFieldsModelSerializer):
     borrower_name = serializers.CharField(source='borrower.user.get_full_name', read_only=True)
     
     class Meta:
@@ -102,7 +126,7 @@ class LoanSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(DynamicFieldsModelSerializer):
     borrower_name = serializers.CharField(source='borrower.user.get_full_name', read_only=True)
     
     class Meta:
@@ -110,13 +134,13 @@ class PaymentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class RepaymentScheduleSerializer(serializers.ModelSerializer):
+class RepaymentScheduleSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = RepaymentSchedule
         fields = '__all__'
 
 
-class ReportSerializer(serializers.ModelSerializer):
+class ReportSerializer(DynamicFieldsModelSerializer):
     borrower_name = serializers.CharField(source='borrower.user.get_full_name', read_only=True)
     
     class Meta:
@@ -124,20 +148,20 @@ class ReportSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class NationalIDVerificationSerializer(serializers.ModelSerializer):
+class NationalIDVerificationSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = NationalIDVerification
         fields = '__all__'
 
 
-class PushSubscriptionSerializer(serializers.ModelSerializer):
+class PushSubscriptionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = PushSubscription
         fields = ['id', 'endpoint', 'p256dh_key', 'auth_key', 'user_agent', 'is_active', 'created_at']
         read_only_fields = ['id', 'created_at']
 
 
-class PushNotificationSerializer(serializers.ModelSerializer):
+class PushNotificationSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = PushNotification
         fields = ['id', 'user', 'title', 'body', 'icon', 'badge', 'url', 'status', 'sent_at', 'created_at']
@@ -215,14 +239,10 @@ class RegisterSerializer(serializers.ModelSerializer):
             year_of_study=validated_data.get('year_of_study')
         )
         
-        # Generate account number
-        account_count = Account.objects.count() + 1
-        account_number = f"SACCO-{account_count:012d}"
-        
         # Create default savings account
         Account.objects.create(
             user=user,
-            account_number=account_number,
+            account_number=allocate_account_number(),
             account_type='Savings Account',
             balance=0.00
         )
@@ -248,20 +268,6 @@ class PasswordResetRequestSerializer(serializers.Serializer):
         email = self.validated_data['email']
         user = CustomUser.objects.get(email=email)
         
-        # Generate token and uid
-        token_generator = PasswordResetTokenGenerator()
-        token = token_generator.make_token(user)
-        uid = urlsafe_base64_encode(force_bytes(user.pk))
-        
-        # Get FRONTEND_URL with proper fallback
-        frontend_url = getattr(settings, 'FRONTEND_URL', None)
-        if not frontend_url:
-            logger.error("FRONTEND_URL not set in environment variables")
-            frontend_url = 'https://somasave.com'  # Default to production URL
-        
-        logger.info(f"Using FRONTEND_URL: {frontend_url}")
-        reset_link = f"{frontend_url}/reset-password/{uid}/{token}"
-        
         # CRITICAL: Check if email is configured BEFORE attempting to send
         if not settings.EMAIL_HOST_PASSWORD:
             logger.error(f"❌ CRITICAL: EMAIL_HOST_PASSWORD not set in Railway environment variables!")
@@ -279,247 +285,14 @@ class PasswordResetRequestSerializer(serializers.Serializer):
         logger.info(f"👤 EMAIL_HOST_USER: {settings.EMAIL_HOST_USER}")
         logger.info(f"🔑 EMAIL_HOST_PASSWORD: {'SET ✓' if settings.EMAIL_HOST_PASSWORD else 'NOT SET ✗'}")
         
-        # Send email
-        subject = 'SomaSave SACCO - Password Reset Request'
+        # The worker builds the reset link, so no token is stored in the job payload
+        from .jobs import enqueue
+        enqueue('send_password_reset_email', {'user_id': user.pk})
+        logger.info(f"📧 Password reset email queued for {email}")
         
-        # Plain text version
-        text_message = f"""
-Hello {user.get_full_name() or user.username},
-
-You recently requested to reset your password for your SomaSave SACCO account.
-
-To reset your password, please click the link below:
-{reset_link}
-
-This link will expire in 24 hours for security reasons.
-
-If you did not request a password reset, please ignore this email or contact our support team if you have concerns about your account security.
-
-Best regards,
-SomaSave SACCO Team
-
----
-This is an automated message. Please do not reply to this email.
-For assistance, contact us at info@somasave.com
-        """
-        
-        # HTML version
-        html_message = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Password Reset Request</title>
-</head>
-<body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f7fa;">
-    <table role="presentation" style="width: 100%; border-collapse: collapse; background-color: #f4f7fa;">
-        <tr>
-            <td align="center" style="padding: 40px 0;">
-                <table role="presentation" style="width: 600px; max-width: 100%; border-collapse: collapse; background-color: #ffffff; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-                    <!-- Header -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #10b981 0%, #059669 100%); padding: 40px 30px; text-align: center; border-radius: 8px 8px 0 0;">
-                            <h1 style="margin: 0; color: #ffffff; font-size: 28px; font-weight: 600;">SomaSave SACCO</h1>
-                            <p style="margin: 10px 0 0 0; color: #f0fdf4; font-size: 14px;">Your Trusted Financial Partner</p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Content -->
-                    <tr>
-                        <td style="padding: 40px 30px;">
-                            <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px; font-weight: 600;">Password Reset Request</h2>
-                            
-                            <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
-                                Hello <strong>{user.get_full_name() or user.username}</strong>,
-                            </p>
-                            
-                            <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
-                                You recently requested to reset your password for your SomaSave SACCO account. Click the button below to proceed with resetting your password.
-                            </p>
-                            
-                            <!-- Reset Button -->
-                            <table role="presentation" style="margin: 30px 0; width: 100%;">
-                                <tr>
-                                    <td align="center">
-                                        <a href="{reset_link}" style="display: inline-block; padding: 16px 40px; background: linear-gradient(135deg, #10b981 0%, #059669 100%); color: #ffffff; text-decoration: none; border-radius: 6px; font-weight: 600; font-size: 16px; box-shadow: 0 4px 6px rgba(16, 185, 129, 0.25);">Reset Password</a>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <p style="margin: 0 0 20px 0; color: #6b7280; font-size: 14px; line-height: 1.6;">
-                                Or copy and paste this link into your browser:
-                            </p>
-                            <p style="margin: 0 0 20px 0; color: #3b82f6; font-size: 14px; word-break: break-all;">
-                                {reset_link}
-                            </p>
-                            
-                            <!-- Security Info Box -->
-                            <table role="presentation" style="width: 100%; background-color: #fef3c7; border-left: 4px solid #f59e0b; border-radius: 4px; margin: 30px 0;">
-                                <tr>
-                                    <td style="padding: 20px;">
-                                        <p style="margin: 0 0 10px 0; color: #92400e; font-size: 14px; font-weight: 600;">
-                                            🔒 Security Notice
-                                        </p>
-                                        <p style="margin: 0; color: #78350f; font-size: 14px; line-height: 1.5;">
-                                            This link will expire in <strong>24 hours</strong> for security reasons. If you did not request a password reset, please ignore this email or contact our support team immediately.
-                                        </p>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <p style="margin: 30px 0 0 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
-                                Best regards,<br>
-                                <strong>SomaSave SACCO Team</strong>
-                            </p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="background-color: #f9fafb; padding: 30px; text-align: center; border-radius: 0 0 8px 8px; border-top: 1px solid #e5e7eb;">
-                            <p style="margin: 0 0 10px 0; color: #6b7280; font-size: 13px;">
-                                This is an automated message. Please do not reply to this email.
-                            </p>
-                            <p style="margin: 0 0 15px 0; color: #6b7280; font-size: 13px;">
-                                For assistance, contact us at <a href="mailto:info@somasave.com" style="color: #10b981; text-decoration: none;">info@somasave.com</a>
-                            </p>
-                            <p style="margin: 0; color: #9ca3af; font-size: 12px;">
-                                © 2025 SomaSave SACCO. All rights reserved.
-                            </p>
-                        </td>
-                    </tr>
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>
-        """
-        
-        try:
-            logger.info(f"📧 Attempting to send password reset email to {email}")
-            logger.info(f"👤 From: {settings.DEFAULT_FROM_EMAIL} → To: {email}")
-            logger.info(f"🔗 Reset Link: {reset_link}")
-            
-            # Check if using Resend (recommended for Railway since SMTP ports are blocked)
-            use_resend = getattr(settings, 'USE_RESEND', False)
-            resend_api_key = getattr(settings, 'RESEND_API_KEY', None)
-            
-            logger.info(f"📮 USE_RESEND flag: {use_resend}")
-            logger.info(f"🔑 RESEND_API_KEY configured: {bool(resend_api_key)}")
-            
-            # Force Resend if API key is available (Railway environment)
-            if resend_api_key and not use_resend:
-                logger.warning(f"⚠️ RESEND_API_KEY found but USE_RESEND=False, forcing Resend API")
-                use_resend = True
-            
-            if use_resend:
-                # Use Resend API (works on Railway where SMTP is blocked)
-                if not resend_api_key:
-                    error_msg = "Resend API key not configured. Set RESEND_API_KEY in Railway environment."
-                    logger.error(f"❌ {error_msg}")
-                    raise serializers.ValidationError(error_msg)
-                
-                import resend
-                resend.api_key = resend_api_key
-                
-                logger.info(f"📤 Sending via Resend API to {email}...")
-                logger.info(f"📧 Subject: {subject}")
-                
-                # Prepare email parameters
-                params = {
-                    "from": settings.DEFAULT_FROM_EMAIL,
-                    "to": [email],
-                    "subject": subject,
-                    "html": html_message,
-                    "text": text_message,
-                }
-                
-                logger.info(f"📦 Email params prepared: from={params['from']}, to={params['to']}")
-                
-                # Send email using Resend API
-                response = resend.Emails.send(params)
-                logger.info(f"✅✅✅ SUCCESS! Resend API response: {response} ✅✅✅")
-                logger.info(f"📬 Email sent successfully to {email} via Resend")
-                
-            else:
-                # Use Django SMTP backend (for local development)
-                from django.core.mail import EmailMultiAlternatives
-                import socket
-                
-                logger.info(f"📤 Sending via SMTP to {email}...")
-                logger.info(f"🔌 SMTP Config: HOST={settings.EMAIL_HOST}, PORT={settings.EMAIL_PORT}")
-                logger.info(f"👤 USER={settings.EMAIL_HOST_USER}, TLS={getattr(settings, 'EMAIL_USE_TLS', False)}")
-                
-                # Set socket timeout to prevent hanging
-                socket.setdefaulttimeout(30)
-                
-                email_message = EmailMultiAlternatives(
-                    subject=subject,
-                    body=text_message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to=[email]
-                )
-                
-                email_message.attach_alternative(html_message, "text/html")
-                email_message.send(fail_silently=False)
-                
-                logger.info(f"✅✅✅ SUCCESS! SMTP email sent to {email} ✅✅✅")
-            
-            # Return success message
-            return {
-                'message': 'Password reset email sent successfully! Please check your inbox and spam folder.'
-            }
-                    
-        except Exception as e:
-            import traceback
-            error_msg = str(e)
-            logger.error(f"❌ Email send failed: {error_msg}")
-            logger.error(f"❌ Error type: {type(e).__name__}")
-            logger.error(f"❌ Full error trace:\n{traceback.format_exc()}")
-            
-            # Log detailed diagnostic info
-            logger.error(f"\n{'='*60}")
-            logger.error(f"EMAIL CONFIGURATION DEBUG:")
-            logger.error(f"USE_RESEND: {use_resend}")
-            logger.error(f"RESEND_API_KEY set: {bool(resend_api_key)}")
-            logger.error(f"EMAIL_HOST: {getattr(settings, 'EMAIL_HOST', 'NOT SET')}")
-            logger.error(f"EMAIL_PORT: {getattr(settings, 'EMAIL_PORT', 'NOT SET')}")
-            logger.error(f"EMAIL_HOST_USER: {getattr(settings, 'EMAIL_HOST_USER', 'NOT SET')}")
-            logger.error(f"EMAIL_HOST_PASSWORD set: {bool(getattr(settings, 'EMAIL_HOST_PASSWORD', None))}")
-            logger.error(f"DEFAULT_FROM_EMAIL: {getattr(settings, 'DEFAULT_FROM_EMAIL', 'NOT SET')}")
-            logger.error(f"{'='*60}\n")
-            
-            # Provide specific error guidance
-            if 'api' in error_msg.lower() or 'resend' in error_msg.lower():
-                logger.error(f"🔐 RESEND API ERROR - Check RESEND_API_KEY in Railway environment")
-                raise serializers.ValidationError(
-                    "Email service error. Please ensure Resend API is properly configured."
-                )
-            elif 'authentication' in error_msg.lower() or '535' in error_msg or '534' in error_msg:
-                logger.error(f"🔐 SMTP AUTHENTICATION FAILED - Wrong password or app password not enabled")
-                raise serializers.ValidationError(
-                    "Email authentication failed. Please check SMTP credentials."
-                )
-            elif 'connection refused' in error_msg.lower() or 'errno 111' in error_msg:
-                logger.error(f"🚫 CONNECTION REFUSED - SMTP port blocked by Railway!")
-                logger.error(f"💡 SOLUTION: Set USE_RESEND=True and RESEND_API_KEY in Railway")
-                raise serializers.ValidationError(
-                    "SMTP connection blocked. Please use Resend API for Railway deployment."
-                )
-            elif 'timeout' in error_msg.lower() or 'timed out' in error_msg.lower():
-                logger.error(f"⏱️ TIMEOUT - SMTP blocked by Railway firewall!")
-                logger.error(f"💡 SOLUTION: Set USE_RESEND=True and RESEND_API_KEY in Railway")
-                raise serializers.ValidationError(
-                    "Email service timeout. SMTP is blocked on Railway. Please use Resend API."
-                )
-            else:
-                # Generic error
-                logger.error(f"❌ Unexpected error sending password reset email")
-                raise serializers.ValidationError(
-                    f"Failed to send password reset email: {error_msg}"
-                )
+        return {
+            'message': 'Password reset email sent successfully! Please check your inbox and spam folder.'
+        }
 
 
 class PasswordResetConfirmSerializer(serializers.Serializer):
@@ -0,0 +1,78 @@
+"""
+Model signal handlers that keep MemberSummary rows in step with writes,
+drop cached dashboards the writes make stale, record loan and payment
+deletes for the report builder, and authentication counters for /metrics
+"""
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.db.models.signals import post_init, post_save, post_delete
+
+from .models import Account, Borrower, Deposit, Loan, Payment, RepaymentSchedule, ReportDeletion, ShareTransaction
+from .utils.dashboard_cache import invalidate_dashboard
+from .utils.member_summary import snapshot, apply_change
+from .utils import metrics
+
+SUMMARY_SENDERS = (Account, Deposit, Loan, Payment, ShareTransaction)
+
+
+def _remember_state(sender, instance, **kwargs):
+    instance._summary_state = snapshot(instance)
+
+
+def _apply_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = None if created else getattr(instance, '_summary_state', None)
+    new_state = snapshot(instance)
+    apply_change(sender.__name__, old_state, new_state)
+    instance._summary_state = new_state
+
+
+def _apply_delete(sender, instance, **kwargs):
+    apply_change(sender.__name__, getattr(instance, '_summary_state', None), None)
+
+
+for _sender in SUMMARY_SENDERS:
+    post_init.connect(_remember_state, sender=_sender, dispatch_uid=f'summary_init_{_sender.__name__}')
+    post_save.connect(_apply_save, sender=_sender, dispatch_uid=f'summary_save_{_sender.__name__}')
+    post_delete.connect(_apply_delete, sender=_sender, dispatch_uid=f'summary_delete_{_sender.__name__}')
+
+
+# Writes shown on the dashboard that no view or service invalidates itself
+DASHBOARD_OWNERS = {
+    Payment: lambda payment: Borrower.objects.filter(pk=payment.borrower_id).values_list('user_id', flat=True).first(),
+    ShareTransaction: lambda share: share.user_id,
+    RepaymentSchedule: lambda installment: (
+        Loan.objects.filter(pk=installment.loan_id).values_list('borrower__user_id', flat=True).first()
+    ),
+}
+
+
+def _invalidate_dashboard(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_dashboard(DASHBOARD_OWNERS[sender](instance))
+
+
+for _sender in DASHBOARD_OWNERS:
+    post_save.connect(_invalidate_dashboard, sender=_sender, dispatch_uid=f'dashboard_save_{_sender.__name__}')
+    post_delete.connect(_invalidate_dashboard, sender=_sender, dispatch_uid=f'dashboard_delete_{_sender.__name__}')
+
+
+def _record_report_deletion(sender, instance, **kwargs):
+    ReportDeletion.objects.create(borrower_id=instance.borrower_id)
+
+
+for _sender in (Loan, Payment):
+    post_delete.connect(_record_report_deletion, sender=_sender, dispatch_uid=f'report_delete_{_sender.__name__}')
+
+
+def _count_login(sender, **kwargs):
+    metrics.AUTH_EVENTS.inc(event='login', outcome='success')
+
+
+def _count_login_failure(sender, **kwargs):
+    metrics.AUTH_EVENTS.inc(event='login', outcome='failure')
+
+
+user_logged_in.connect(_count_login, dispatch_uid='metrics_user_logged_in')
+user_login_failed.connect(_count_login_failure, dispatch_uid='metrics_user_login_failed')
@@ -0,0 +1,174 @@
+"""
+Background job handlers
+
+Each handler takes JSON-serializable keyword arguments and is queued with
+api.jobs.enqueue(). Raising an exception schedules a retry.
+"""
+from .jobs import job, current_job, save_progress
+from . import mailer
+from .utils import email_templates
+from .webhooks import MAX_ATTEMPTS as MAX_WEBHOOK_ATTEMPTS
+from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@job(max_attempts=3)
+def send_otp_email(user_id, purpose):
+    """
+    Email the user's current OTP code.
+
+    The code is read when the job runs rather than stored in the job payload,
+    so a superseded or already used code is never sent.
+    """
+    from .models import CustomUser
+
+    user = CustomUser.objects.filter(pk=user_id).only('email', 'otp_code', 'language').first()
+    if user is None or not user.otp_code:
+        logger.info(f"Skipping {purpose} OTP email for user {user_id}: no active code")
+        return
+
+    subject, text, html = email_templates.render('otp', {'otp': user.otp_code, 'purpose': purpose}, language=user.language)
+    mailer.send([mailer.build_message(user.email, subject, text, html=html)])
+    logger.info(f"✅ {purpose} OTP email sent to {user.email}")
+
+
+@job()
+def send_password_reset_email(user_id):
+    """
+    Email a password reset link through Resend when configured, SMTP otherwise.
+
+    The token is generated here rather than passed in the job payload, so a
+    working reset link is never stored in the job table.
+    """
+    from django.conf import settings
+    from django.contrib.auth.tokens import PasswordResetTokenGenerator
+    from django.utils.encoding import force_bytes
+    from django.utils.http import urlsafe_base64_encode
+    from .models import CustomUser
+
+    user = CustomUser.objects.filter(pk=user_id).first()
+    if user is None or not user.email:
+        logger.info(f"Skipping password reset email for user {user_id}: no such user or email")
+        return
+
+    token = PasswordResetTokenGenerator().make_token(user)
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    frontend_url = getattr(settings, 'FRONTEND_URL', None) or 'https://somasave.com'
+
+    subject, text, html = email_templates.render('password_reset', {
+        'name': user.get_full_name() or user.username,
+        'reset_link': f"{frontend_url}/reset-password/{uid}/{token}",
+    }, language=user.language)
+    mailer.send([mailer.build_message(user.email, subject, text, html=html)])
+    logger.info(f"📬 Password reset email sent to {user.email} via {mailer.transport()}")
+
+
+@job()
+def send_deposit_confirmation_email(deposit_id, balance):
+    """Email a member that their deposit was credited, if they want transaction alerts"""
+    from django.conf import settings
+    from .models import Deposit
+
+    deposit = Deposit.objects.select_related('user').filter(pk=deposit_id).first()
+    if deposit is None:
+        return
+    user = deposit.user
+    if not (user.email and user.email_notifications and user.transaction_alerts):
+        logger.info(f"Skipping deposit confirmation email for user {user.pk}: alerts are off")
+        return
+
+    subject, text, html = email_templates.render('deposit_confirmation', {
+        'name': user.get_full_name() or user.username,
+        'amount': f'{deposit.amount:,.0f}',
+        'balance': f'{Decimal(balance):,.0f}',
+        'reference': deposit.tx_ref,
+        'transactions_url': f"{getattr(settings, 'FRONTEND_URL', None) or 'https://somasave.com'}/member-portal/transactions",
+    }, language=user.language)
+    mailer.send([mailer.build_message(user.email, subject, text, html=html)])
+    logger.info(f"📬 Deposit confirmation email sent to {user.email}")
+
+
+@job()
+def send_emails(messages):
+    """
+    Deliver a batch of emails over one warm connection.
+
+    Args:
+        messages: List of {'to', 'subject', 'text', 'html'} dicts ('html' optional)
+    """
+    try:
+        sent = mailer.send(
+            mailer.build_message(message['to'], message['subject'], message['text'], html=message.get('html'))
+            for message in messages
+        )
+    except mailer.TransientEmailError as e:
+        # Retry only what was not delivered, so recipients never get the same email twice
+        if e.processed:
+            save_progress({'messages': messages[e.processed:]})
+        raise
+    logger.info(f"📬 Sent {sent} of {len(messages)} emails via {mailer.transport()}")
+
+
+@job(max_attempts=1)
+def send_user_push(user_id, title, body, url=None, icon=None):
+    """
+    Push a notification to all of a user's active devices.
+
+    Not retried: delivery failures are recorded on the PushNotification row and
+    expired subscriptions are deactivated by the fan-out itself.
+    """
+    from .utils.push_notifications import send_bulk_notification
+
+    results = send_bulk_notification([user_id], title=title, body=body, icon=icon, url=url)
+    logger.info(f"Push to user {user_id}: {results['sent']} sent, {results['failed']} failed")
+
+
+@job(max_attempts=1)
+def send_broadcast_push(notification_id):
+    """
+    Push a staff broadcast to every active member.
+
+    Not retried, like send_user_push; the outcome is recorded on the
+    broadcast's own PushNotification row (the one without a user).
+    """
+    from django.utils import timezone
+    from .models import CustomUser, PushNotification
+    from .utils.push_notifications import send_bulk_notification
+
+    notification = PushNotification.objects.filter(pk=notification_id, status='PENDING').first()
+    if notification is None:
+        logger.info(f"Skipping broadcast {notification_id}: not pending")
+        return
+
+    results = send_bulk_notification(
+        CustomUser.objects.filter(is_active=True),
+        title=notification.title, body=notification.body, url=notification.url, icon=notification.icon
+    )
+    delivered = results['sent'] > 0
+    PushNotification.objects.filter(pk=notification_id).update(
+        status='SENT' if delivered else 'FAILED', sent_at=timezone.now() if delivered else None
+    )
+    logger.info(f"Broadcast {notification_id}: {results['sent']} sent, {results['failed']} failed")
+
+
+@job()
+def upload_profile_image(user_id):
+    """Upload a member's pending profile image to Cloudinary (see api/profile_images.py)"""
+    from .profile_images import upload_pending
+
+    claimed = current_job()
+    upload_pending(user_id, final_attempt=claimed is None or claimed.attempts >= claimed.max_attempts)
+
+
+@job(max_attempts=MAX_WEBHOOK_ATTEMPTS)
+def process_webhook_event(event_id):
+    """Apply a stored Relworx callback (see api/webhooks.py)"""
+    from .webhooks import process_event, record_failure
+
+    try:
+        process_event(event_id)
+    except Exception as e:
+        record_failure(event_id, e)
+        raise
@@ -1,3 +1,2000 @@
-from django.test import TestCase
+from datetime import timedelta
+import time
+from decimal import Decimal
+import hashlib
+import hmac
+from io import BytesIO
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import (
+    CustomUser, Account, Deposit, ShareTransaction, LoginActivity,
+    Borrower, Loan, Payment, RepaymentSchedule, Report, University, Course,
+    PushSubscription, PushNotification, BackgroundJob, MemberSummary, LedgerEntry, LedgerTransaction,
+    WebhookEvent, ReportRun, ReportDeletion, ProfileImageUpload
+)
+from .jobs import job, enqueue, claim, execute, run_pending
+from .relworx import RelworxPaymentGateway
+from .deposits import poll_pending_deposits, complete_deposit, due_deposits, reconcile_deposits
+from .loans import regenerate_schedules, sweep_loans
+from . import ledger, mailer, profile_images
+from .reports import build_reports
+from .utils import dashboard_cache, email_templates, metrics, profiling, sequences
+from .utils.amortization import build_schedule
+from .utils.member_summary import get_member_summary, rebuild_summaries
+from .utils.push_notifications import send_bulk_notification
+
+
+class ListEndpointQueryCountTests(TestCase):
+    """
+    Guard against N+1 queries: the number of queries a list endpoint runs
+    must not grow with the number of rows on the page.
+    """
+
+    endpoints = [
+        '/api/users/',
+        '/api/accounts/',
+        '/api/deposits/',
+        '/api/shares/',
+        '/api/login-activities/',
+        '/api/borrowers/',
+        '/api/loans/',
+        '/api/payments/',
+        '/api/repayment-schedules/',
+        '/api/reports/',
+        '/api/courses/',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            username='staff@somasave.com', email='staff@somasave.com',
+            password='StaffPass123', is_staff=True
+        )
+        cls.university = University.objects.create(name='Makerere University', code='MAK')
+        cls.course = Course.objects.create(name='Computer Science', university=cls.university)
+        cls.member_count = 0
+
+    def _seed_members(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            self.member_count += 1
+            n = self.member_count
+            user = CustomUser.objects.create_user(
+                username=f'member{n}@somasave.com', email=f'member{n}@somasave.com',
+                password='MemberPass123', first_name='Member', last_name=str(n),
+                student_id=f'STU{n:05d}', university=self.university, course=self.course
+            )
+            Account.objects.create(user=user, account_number=f'SACCO-{n:012d}', account_type='Savings Account')
+            Deposit.objects.create(user=user, tx_ref=f'SACCO_TEST_{n}', amount=Decimal('5000'), status='COMPLETED')
+            ShareTransaction.objects.create(user=user, number_of_shares=1, amount=Decimal('1000'), transaction_type='BUY', status='COMPLETED')
+            LoginActivity.objects.create(user=user, ip_address='127.0.0.1')
+            borrower = Borrower.objects.create(user=user, address='Kampala')
+            loan = Loan.objects.create(
+                borrower=borrower, loan_code=f'L{n:05d}', amount=Decimal('100000'),
+                interest_rate=Decimal('10'), start_date=now, due_date=now + timedelta(days=90)
+            )
+            Payment.objects.create(borrower=borrower, loan=loan, amount=Decimal('10000'), payment_status='COMPLETED')
+            RepaymentSchedule.objects.create(loan=loan, installment_number=1, due_date=now.date(), amount=Decimal('10000'))
+            Report.objects.create(borrower=borrower, total_loans=Decimal('100000'), total_payments=Decimal('10000'))
+            Course.objects.create(name=f'Course {n}', university=self.university)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200, url)
+        return len(context.captured_queries)
+
+    def test_list_query_count_is_independent_of_page_size(self):
+        self.client.force_login(self.staff)
+        # Take the session's first sliding-expiry refresh out of the counts
+        self.client.get('/api/auth/user/', secure=True)
+
+        self._seed_members(2)
+        small = {url: self._count_queries(url) for url in self.endpoints}
+
+        self._seed_members(8)
+        large = {url: self._count_queries(url) for url in self.endpoints}
+
+        for url in self.endpoints:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    small[url], large[url],
+                    f'{url} ran {small[url]} queries for 2 members but {large[url]} for 10'
+                )
+
+
+
+class ListEndpointPaginationTests(TestCase):
+    """Cursor pagination follows the model ordering and ?fields= trims the output"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            username='pager@somasave.com', email='pager@somasave.com',
+            password='StaffPass123', is_staff=True
+        )
+        now = timezone.now()
+        for n in range(5):
+            Deposit.objects.create(user=cls.staff, tx_ref=f'SACCO_PAGE_{n}', amount=Decimal('1000') * (n + 1))
+            # Deposits are ordered newest first; spread them out so the order is unambiguous
+            Deposit.objects.filter(tx_ref=f'SACCO_PAGE_{n}').update(created_at=now - timedelta(hours=n))
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def get(self, url):
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200, url)
+        return response.json()
+
+    def refs(self, page):
+        return [row['tx_ref'] for row in page['results']]
+
+    def test_pages_follow_model_ordering(self):
+        first = self.get('/api/deposits/?page_size=2')
+        second = self.get(first['next'])
+        third = self.get(second['next'])
+
+        self.assertNotIn('count', first)
+        self.assertIsNone(first['previous'])
+        self.assertIsNone(third['next'])
+        self.assertEqual(
+            self.refs(first) + self.refs(second) + self.refs(third),
+            [f'SACCO_PAGE_{n}' for n in range(5)]
+        )
+
+    def test_cursors_are_stable(self):
+        first = self.get('/api/deposits/?page_size=2')
+        second = self.get(first['next'])
+
+        # A newer deposit does not shift the rows behind an issued cursor
+        Deposit.objects.create(user=self.staff, tx_ref='SACCO_PAGE_NEW', amount=Decimal('500'))
+        self.assertEqual(self.get(first['next']), second)
+        self.assertEqual(self.refs(self.get(second['previous'])), ['SACCO_PAGE_0', 'SACCO_PAGE_1'])
+
+    def test_page_size_is_capped(self):
+        with mock.patch('api.pagination.ModelOrderingCursorPagination.max_page_size', 3):
+            page = self.get('/api/deposits/?page_size=100')
+        self.assertEqual(len(page['results']), 3)
+
+    def test_fields_limits_output(self):
+        page = self.get('/api/deposits/?fields=id,amount')
+        self.assertEqual({tuple(sorted(row)) for row in page['results']}, {('amount', 'id')})
+
+    def test_unknown_fields_are_ignored(self):
+        page = self.get('/api/deposits/?fields=tx_ref,no_such_field')
+        self.assertEqual([sorted(row) for row in page['results']], [['tx_ref']] * 5)
+
+        page = self.get('/api/deposits/?fields=no_such_field')
+        self.assertEqual(page['results'], [{}] * 5)
+
+    def test_fields_ignored_on_writes(self):
+        response = self.client.post(
+            '/api/deposits/?fields=id',
+            {'user': self.staff.pk, 'tx_ref': 'SACCO_PAGE_POST', 'amount': '700', 'status': 'PENDING'},
+            secure=True
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIn('tx_ref', response.json())
+
+
+TEST_VAPID_PRIVATE_KEY = 'Aer8VrDX6RLvnrQAme0OZPz0n97aCOnDXkoivxTuzIY'
+
+
+@override_settings(VAPID_PUBLIC_KEY='test', VAPID_PRIVATE_KEY=TEST_VAPID_PRIVATE_KEY, PUSH_FANOUT_WORKERS=4)
+class BulkNotificationTests(TestCase):
+    """Fan-out delivery of one notification to many subscriptions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(
+                username=f'push{i}@somasave.com', email=f'push{i}@somasave.com', password='MemberPass123'
+            )
+            for i in range(5)
+        ]
+        for user in cls.users:
+            for device in range(2):
+                PushSubscription.objects.create(
+                    user=user, endpoint=f'https://push.example.com/{user.pk}/{device}',
+                    p256dh_key='key', auth_key='auth'
+                )
+
+    def _fake_webpush(self, gone_user):
+        from pywebpush import WebPushException
+
+        def fake(subscription_info, **kwargs):
+            if f'/{gone_user.pk}/' in subscription_info['endpoint']:
+                raise WebPushException('Gone', response=mock.Mock(status_code=410))
+            return mock.Mock(status_code=201)
+        return fake
+
+    def test_bulk_send_uses_constant_queries_and_deactivates_expired(self):
+        gone_user = self.users[0]
+
+        with mock.patch('api.utils.push_notifications.webpush', side_effect=self._fake_webpush(gone_user)) as fake:
+            with CaptureQueriesContext(connection) as queries:
+                results = send_bulk_notification(CustomUser.objects.all(), 'Title', 'Body')
+
+        self.assertEqual(fake.call_count, 10)
+        self.assertEqual((results['total'], results['sent'], results['failed']), (10, 8, 2))
+        self.assertEqual(results['expired'], 2)
+        self.assertLessEqual(len(queries), 6)
+
+        # A single signed VAPID token is reused for every endpoint on the same push service
+        authorizations = {call.kwargs['headers']['Authorization'] for call in fake.call_args_list}
+        self.assertEqual(len(authorizations), 1)
+
+        self.assertFalse(PushSubscription.objects.filter(user=gone_user, is_active=True).exists())
+        self.assertEqual(PushSubscription.objects.filter(is_active=True).count(), 8)
+        self.assertEqual(PushNotification.objects.get(user=gone_user).status, 'FAILED')
+        self.assertEqual(PushNotification.objects.filter(status='SENT', sent_at__isnull=False).count(), 4)
+
+    @override_settings(PUSH_FANOUT_CHUNK_SIZE=3)
+    def test_chunks_do_not_split_a_users_devices(self):
+        with mock.patch('api.utils.push_notifications.webpush', return_value=mock.Mock(status_code=201)):
+            results = send_bulk_notification(CustomUser.objects.all(), 'Title', 'Body')
+
+        self.assertEqual(results['sent'], 10)
+        for user in self.users:
+            self.assertEqual(PushNotification.objects.filter(user=user).count(), 1)
+
+    def test_broadcast_is_queued(self):
+        staff = CustomUser.objects.create_user(
+            username='broadcaster@somasave.com', email='broadcaster@somasave.com', password='StaffPass123', is_staff=True
+        )
+        self.client.force_login(staff)
+
+        with mock.patch('api.utils.push_notifications.webpush', return_value=mock.Mock(status_code=201)) as fake:
+            response = self.client.post(
+                '/api/push-notifications/broadcast/', {'title': 'AGM', 'body': 'Tomorrow'}, secure=True
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(fake.call_count, 0)
+
+            broadcast = PushNotification.objects.get(pk=response.json()['notification_id'])
+            self.assertEqual((broadcast.user, broadcast.status), (None, 'PENDING'))
+
+            run_pending()
+
+        self.assertEqual(fake.call_count, 10)
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.status, 'SENT')
+        self.assertEqual(PushNotification.objects.filter(user__isnull=False, status='SENT').count(), 5)
+
+    def test_webpush_time_is_recorded_once_per_delivery(self):
+        for workers in (1, 16):
+            with self.subTest(workers=workers), override_settings(PUSH_FANOUT_WORKERS=workers):
+                with mock.patch('api.utils.push_notifications.webpush', return_value=mock.Mock(status_code=201)):
+                    with profiling.profile_request() as (profile, profiler):
+                        send_bulk_notification(CustomUser.objects.all(), 'Title', 'Body')
+
+                calls, _ = profile.external['webpush']
+                self.assertEqual(calls, 10)
+
+
+_flaky_calls = []
+
+
+@job(name='test_flaky', max_attempts=2)
+def _flaky_job(fail):
+    _flaky_calls.append(fail)
+    if fail:
+        raise RuntimeError('boom')
+
+
+class BackgroundJobTests(TestCase):
+    """Durable job queue: claiming, retries and the side effects moved onto it"""
+
+    def setUp(self):
+        _flaky_calls.clear()
+
+    def test_failed_job_is_retried_with_backoff_then_marked_failed(self):
+        queued = enqueue('test_flaky', {'fail': True})
+
+        self.assertEqual(run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('PENDING', 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('boom', queued.last_error)
+
+        # Not due yet, so nothing is claimed
+        self.assertEqual(claim('test-worker'), [])
+
+        BackgroundJob.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('FAILED', 2))
+        self.assertEqual(len(_flaky_calls), 2)
+
+    def test_expired_lease_is_reclaimed(self):
+        queued = enqueue('test_flaky', {'fail': False})
+        claim('crashed-worker')
+
+        # A second worker cannot take a leased job until the lease expires
+        self.assertEqual(claim('other-worker'), [])
+        BackgroundJob.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        [reclaimed] = claim('other-worker')
+        self.assertTrue(execute(reclaimed))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_by, queued.attempts), ('SUCCEEDED', 'other-worker', 2))
+
+    def test_login_otp_email_is_sent_by_worker(self):
+        user = CustomUser.objects.create_user(
+            username='otp@somasave.com', email='otp@somasave.com', password='MemberPass123', two_factor_auth=True
+        )
+
+        response = self.client.post('/api/auth/login/', {'identifier': user.email, 'password': 'MemberPass123'})
+        self.assertTrue(response.json()['requires_2fa'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(BackgroundJob.objects.filter(name='send_otp_email', status='PENDING').exists())
+
+        run_pending()
+        user.refresh_from_db()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(user.otp_code, mail.outbox[0].body)
+
+
+@override_settings(RELWORX_STATUS_RETRIES=2, RELWORX_BREAKER_THRESHOLD=4, RELWORX_BREAKER_RESET=30)
+class RelworxGatewayTests(TestCase):
+    """Retries and circuit breaking in the shared Relworx client"""
+
+    def setUp(self):
+        import requests
+        self.gateway = RelworxPaymentGateway()
+        self.request = mock.patch.object(
+            self.gateway.session, 'request', side_effect=requests.exceptions.ConnectTimeout('down')
+        ).start()
+        mock.patch('api.relworx.time.sleep').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_status_checks_are_retried_but_payment_requests_are_not(self):
+        result = self.gateway.check_request_status(customer_reference='TX1')
+        self.assertFalse(result['success'])
+        self.assertEqual(self.request.call_count, 3)
+
+        self.request.reset_mock()
+        result = self.gateway.request_payment('TX2', '+256700000000', 'UGX', 1000)
+        self.assertFalse(result['success'])
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_open_circuit_fails_fast_until_trial_succeeds(self):
+        self.gateway.check_request_status(customer_reference='TX1')
+        self.gateway.check_request_status(customer_reference='TX1')
+        self.assertEqual(self.gateway.breaker.state, 'open')
+
+        self.request.reset_mock()
+        result = self.gateway.check_request_status(customer_reference='TX1')
+        self.assertIn('temporarily unavailable', result['error'])
+        self.assertEqual(self.request.call_count, 0)
+
+        # After the reset timeout one trial request goes through and closes the circuit
+        self.gateway.breaker.opened_at -= 30
+        self.request.side_effect = None
+        self.request.return_value = mock.Mock(status_code=200, json=lambda: {'request_status': 'success'})
+        result = self.gateway.check_request_status(customer_reference='TX1')
+        self.assertTrue(result['success'])
+        self.assertEqual(self.gateway.breaker.state, 'closed')
+
+    def test_unexpected_error_ends_half_open_trial(self):
+        import requests
+
+        self.gateway.check_request_status(customer_reference='TX1')
+        self.gateway.check_request_status(customer_reference='TX1')
+        self.gateway.breaker.opened_at -= 30
+
+        self.request.side_effect = requests.exceptions.ChunkedEncodingError('truncated')
+        result = self.gateway.check_request_status(customer_reference='TX1')
+        self.assertFalse(result['success'])
+        self.assertFalse(self.gateway.breaker.trial_in_flight)
+        self.assertEqual(self.gateway.breaker.state, 'open')
+
+        # The next trial is let through once the reset timeout passes again
+        self.gateway.breaker.opened_at -= 30
+        self.request.side_effect = None
+        self.request.return_value = mock.Mock(status_code=200, json=lambda: {'request_status': 'success'})
+        self.assertTrue(self.gateway.check_request_status(customer_reference='TX1')['success'])
+        self.assertEqual(self.gateway.breaker.state, 'closed')
+
+
+class DepositReconciliationTests(TestCase):
+    """Pending deposits are settled by the poller; member polls stay local"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='saver@somasave.com', email='saver@somasave.com', password='MemberPass123'
+        )
+
+    def _deposit(self, tx_ref, age=0):
+        deposit = Deposit.objects.create(
+            user=self.member, tx_ref=tx_ref, amount=Decimal('5000'), status='PENDING',
+            next_check_at=timezone.now() - timedelta(seconds=1)
+        )
+        Deposit.objects.filter(pk=deposit.pk).update(created_at=timezone.now() - timedelta(seconds=age))
+        deposit.refresh_from_db()
+        return deposit
+
+    def _gateway(self, history, status='pending'):
+        gateway = mock.Mock()
+        gateway.get_transaction_history.return_value = {'success': True, 'data': {'transactions': history}}
+        gateway.check_request_status.return_value = {'success': True, 'data': {'request_status': status}}
+        return mock.patch('api.relworx.get_gateway', return_value=gateway)
+
+    def test_poll_settles_batch_from_one_history_call(self):
+        paid = self._deposit('SACCO_PAID')
+        declined = self._deposit('SACCO_DECLINED')
+        unknown = self._deposit('SACCO_UNKNOWN')
+        history = [
+            {'customer_reference': 'SACCO_PAID', 'status': 'success', 'provider_transaction_id': 'PRV1'},
+            {'customer_reference': 'SACCO_DECLINED', 'status': 'failed'},
+        ]
+
+        with self._gateway(history) as get_gateway:
+            stats = poll_pending_deposits(max_status_checks=0)
+
+        gateway = get_gateway.return_value
+        self.assertEqual(gateway.get_transaction_history.call_count, 1)
+        self.assertEqual(gateway.check_request_status.call_count, 0)
+        self.assertEqual((stats['COMPLETED'], stats['FAILED'], stats['PENDING']), (1, 1, 1))
+
+        paid.refresh_from_db()
+        declined.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual((paid.status, paid.transaction_id), ('COMPLETED', 'PRV1'))
+        self.assertEqual(declined.status, 'FAILED')
+        self.assertEqual(Account.objects.get(user=self.member, account_type='SAVINGS').balance, Decimal('5000'))
+
+        # Still pending: backed off and not due on the next pass
+        self.assertEqual(unknown.check_attempts, 1)
+        self.assertGreater(unknown.next_check_at, timezone.now())
+        with self._gateway([]) as get_gateway:
+            self.assertEqual(poll_pending_deposits()['checked'], 0)
+        get_gateway.assert_not_called()
+
+    def test_verify_reads_locally_until_deposit_is_stale(self):
+        self.client.force_login(self.member)
+        fresh = self._deposit('SACCO_FRESH')
+        stale = self._deposit('SACCO_STALE', age=600)
+
+        with self._gateway([], status='success') as get_gateway:
+            response = self.client.post('/api/payment-requests/verify-deposit/', {'tx_ref': fresh.tx_ref})
+            self.assertEqual(response.status_code, 202)
+            get_gateway.assert_not_called()
+
+            response = self.client.post('/api/payment-requests/verify-deposit/', {'tx_ref': stale.tx_ref})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['status'], 'COMPLETED')
+            self.assertEqual(get_gateway.return_value.check_request_status.call_count, 1)
+
+
+class AccountNumberAllocationTests(TransactionTestCase):
+    """Concurrent signups must never be handed the same account number"""
+
+    def setUp(self):
+        sequences.reset_blocks()
+
+    @skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers; run with DB_NAME set to load test on PostgreSQL')
+    def test_concurrent_registrations_get_unique_account_numbers(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connections
+
+        university = University.objects.create(name='Kyambogo University', code='KYU')
+
+        def register(n):
+            try:
+                response = self.client_class().post('/api/auth/register/', {
+                    'username': f'Member {n}',
+                    'email': f'intake{n}@somasave.com',
+                    'password': 'IntakePass123!',
+                    'confirm_password': 'IntakePass123!',
+                    'phone_number': f'+2567000{n:05d}',
+                    'student_id': f'STU{n:05d}',
+                    'university': university.id,
+                    'year_of_study': 1,
+                })
+                return response.status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(register, range(40)))
+
+        self.assertEqual(statuses, [201] * 40)
+        numbers = list(Account.objects.values_list('account_number', flat=True))
+        self.assertEqual(len(numbers), 40)
+        self.assertEqual(len(set(numbers)), 40)
+        self.assertTrue(all(number.startswith('SACCO-') and len(number) == 18 for number in numbers))
+
+    @override_settings(SEQUENCE_BLOCK_SIZE=5)
+    def test_concurrent_allocations_are_unique(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connections
+
+        def allocate_many(_):
+            try:
+                return [sequences.allocate_account_number() for _ in range(25)]
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            numbers = [number for batch in pool.map(allocate_many, range(8)) for number in batch]
+
+        self.assertEqual(len(numbers), 200)
+        self.assertEqual(len(set(numbers)), 200)
+
+    @override_settings(SEQUENCE_BLOCK_SIZE=5)
+    def test_allocator_reserves_blocks_instead_of_counting(self):
+        with CaptureQueriesContext(connection) as queries:
+            numbers = [sequences.allocate_account_number() for _ in range(10)]
+
+        self.assertEqual(len(set(numbers)), 10)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertFalse(any('clients_portal_account' in query['sql'] for query in queries.captured_queries))
+
+
+# One test process, so the in-memory session cache is shared by every "worker"
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class SessionWriteTests(TestCase):
+    """Authenticated requests read the session from cache and only write it when stale"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='session@somasave.com', email='session@somasave.com', password='MemberPass123'
+        )
+
+    def session_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries.captured_queries if 'django_session' in q['sql']]
+
+    def test_session_is_not_written_on_every_request(self):
+        response = self.client.post('/api/auth/login/', {'identifier': self.member.email, 'password': 'MemberPass123'})
+        self.assertEqual(response.status_code, 200)
+
+        # Fresh session: served from cache, nothing written
+        self.assertEqual(self.session_queries('/api/auth/user/'), [])
+        self.assertEqual(self.session_queries('/api/auth/user/'), [])
+
+    @override_settings(SESSION_REFRESH_INTERVAL=60)
+    def test_stale_session_expiry_is_refreshed_once(self):
+        from django.contrib.sessions.models import Session
+
+        self.client.post('/api/auth/login/', {'identifier': self.member.email, 'password': 'MemberPass123'})
+        session_key = self.client.cookies['sessionid'].value
+        expire_date = Session.objects.get(session_key=session_key).expire_date
+
+        with mock.patch('api.middleware.time.time', return_value=time.time() + 120):
+            writes = self.session_queries('/api/auth/user/')
+            self.assertTrue(any(sql.startswith('UPDATE') for sql in writes))
+            self.assertEqual(self.session_queries('/api/auth/user/'), [])
+
+        self.assertGreater(Session.objects.get(session_key=session_key).expire_date, expire_date)
+
+    def test_logout_removes_session_from_cache_and_database(self):
+        from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+        from django.contrib.sessions.models import Session
+        from django.core.cache import caches
+
+        self.client.post('/api/auth/login/', {'identifier': self.member.email, 'password': 'MemberPass123'})
+        session_key = self.client.cookies['sessionid'].value
+        self.assertIsNotNone(caches['sessions'].get(KEY_PREFIX + session_key))
+
+        response = self.client.post('/api/auth/logout/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(caches['sessions'].get(KEY_PREFIX + session_key))
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 403)
+
+    def test_process_local_session_cache_falls_back_to_database(self):
+        from django.conf import settings
+
+        if settings.SESSION_CACHE_SHARED:
+            self.skipTest('A shared session cache is configured')
+        with mock.patch.dict(os.environ, {'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db'}):
+            from somasave_backend import settings as project_settings
+            import importlib
+            reloaded = importlib.reload(project_settings)
+        self.assertEqual(reloaded.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+
+
+class RequestTracingTests(TestCase):
+    """Authentication and dashboard requests log nothing unless sampled, and never raw secrets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='trace@somasave.com', email='trace@somasave.com', password='MemberPass123'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.member)
+
+    @override_settings(REQUEST_TRACE_SAMPLE_RATES={})
+    def test_unsampled_requests_write_nothing(self):
+        with mock.patch('builtins.print') as printed, self.assertNoLogs('api.trace', 'INFO'):
+            self.assertEqual(self.client.get('/api/dashboard/stats/').status_code, 200)
+            self.assertEqual(self.client.get('/api/auth/user/').status_code, 200)
+        printed.assert_not_called()
+
+    @override_settings(REQUEST_TRACE_SAMPLE_RATES={'dashboard-stats': 1.0})
+    def test_sampled_trace_is_redacted(self):
+        session_key = self.client.cookies['sessionid'].value
+
+        with self.assertLogs('api.trace', 'INFO') as logs:
+            self.assertEqual(self.client.get('/api/dashboard/stats/').status_code, 200)
+
+        output = '\n'.join(logs.output)
+        self.assertIn('"session_fp"', output)
+        self.assertIn('dashboard', output)
+        self.assertNotIn(session_key, output)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_CPROFILE_TOP=1, PROFILING_CPROFILE_SAMPLE_RATE=1.0)
+class RequestProfilingTests(TestCase):
+    """Profiling middleware aggregates wall time, SQL and outbound calls per view"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='profiled@somasave.com', email='profiled@somasave.com', password='MemberPass123'
+        )
+        cls.staff = CustomUser.objects.create_user(
+            username='ops@somasave.com', email='ops@somasave.com', password='StaffPass123', is_staff=True
+        )
+
+    def setUp(self):
+        profiling.reset_stats()
+        self.addCleanup(profiling.reset_stats)
+
+    def test_stats_are_grouped_by_view(self):
+        self.client.force_login(self.member)
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/dashboard/stats/').status_code, 200)
+        self.assertEqual(self.client.get('/api/profiling/stats/').status_code, 403)
+
+        self.client.force_login(self.staff)
+        stats = self.client.get('/api/profiling/stats/', {'profiles': '1'}).json()
+
+        dashboard = stats['views']['dashboard-stats']
+        self.assertEqual(dashboard['requests'], 2)
+        self.assertGreater(dashboard['max_queries'], 0)
+        self.assertEqual(dashboard['statuses'], {'200': 2})
+        self.assertEqual(len(stats['slowest_profiled']), 1)
+        self.assertIn('cumulative', stats['slowest_profiled'][0]['profile'])
+
+    def test_outbound_calls_and_duplicate_queries_are_attributed(self):
+        with profiling.profile_request() as (profile, profiler):
+            with profiling.external_call('relworx'):
+                time.sleep(0.01)
+            list(CustomUser.objects.filter(pk=self.member.pk))
+            list(CustomUser.objects.filter(pk=self.member.pk))
+        profiling.record('verify-deposit', profile, 200, profiler)
+
+        view = profiling.get_stats()['views']['verify-deposit']
+        self.assertEqual(view['duplicate_queries'], 1)
+        self.assertEqual(view['last_repeated_statements'][0]['count'], 2)
+        self.assertGreaterEqual(view['external']['relworx']['max_ms'], 10)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_middleware_records_nothing(self):
+        self.client.force_login(self.member)
+        self.client.get('/api/dashboard/stats/')
+        self.assertEqual(profiling.get_stats()['views'], {})
+
+
+class MetricsEndpointTests(TestCase):
+    """/metrics renders Prometheus text and sums snapshots from every worker process"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='metered@somasave.com', email='metered@somasave.com', password='MemberPass123'
+        )
+        cls.staff = CustomUser.objects.create_user(
+            username='sre@somasave.com', email='sre@somasave.com', password='StaffPass123', is_staff=True
+        )
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_requests_and_auth_are_exported(self):
+        self.client.post('/api/auth/login/', {'identifier': self.member.email, 'password': 'wrong'})
+        self.client.post('/api/auth/login/', {'identifier': self.member.email, 'password': 'MemberPass123'})
+        self.client.get('/api/dashboard/stats/')
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+
+        self.assertIn('# TYPE somasave_http_request_duration_seconds histogram', body)
+        self.assertIn('somasave_http_requests_total{route="dashboard-stats",method="GET",status="200"} 1', body)
+        self.assertIn('somasave_http_request_duration_seconds_count{route="login",method="POST"} 2', body)
+        self.assertIn('somasave_auth_events_total{event="login",outcome="failure"} 1', body)
+        self.assertIn('somasave_auth_events_total{event="login",outcome="success"} 1', body)
+        self.assertRegex(body, r'somasave_db_queries_total\{route="dashboard-stats"\} [1-9]')
+
+    def test_deposit_transitions_are_counted(self):
+        from .deposits import fail_deposit
+
+        deposit = Deposit.objects.create(user=self.member, tx_ref='SACCO_METRIC', amount=Decimal('1000'), status='PENDING')
+        fail_deposit(deposit)
+        fail_deposit(deposit)
+
+        self.assertIn(
+            'somasave_deposit_transitions_total{source="PENDING",target="FAILED"} 1',
+            metrics.render()
+        )
+
+    def test_rejected_payment_request_fails_deposit(self):
+        self.client.force_login(self.member)
+        failure = {'success': False, 'error': 'Insufficient balance'}
+        with mock.patch('api.relworx.RelworxPaymentGateway.request_payment', return_value=failure), \
+                mock.patch('api.utils.dashboard_cache.invalidate_dashboard') as invalidate:
+            response = self.client.post('/api/payment-requests/initiate-deposit/', {
+                'amount': 5000, 'phone_number': '+256700000000',
+            })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Deposit.objects.get(user=self.member).status, 'FAILED')
+        invalidate.assert_called_with(self.member.pk)
+        self.assertIn('somasave_deposit_transitions_total{source="PENDING",target="FAILED"} 1', metrics.render())
+
+    def test_snapshots_from_other_workers_are_summed(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            with open(os.path.join(directory, f'{exited.pid}.json'), 'w') as handle:
+                json.dump({'pid': exited.pid, 'values': [
+                    ['somasave_push_deliveries_total', ['expired'], 3],
+                    ['somasave_worker_requests_in_progress', [], 4],
+                ]}, handle)
+
+            metrics.PUSH_DELIVERIES.inc(result='expired')
+            metrics.WORKER_REQUESTS_IN_PROGRESS.set(1)
+            body = metrics.render()
+
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+
+        # Counters of exited workers are kept; their gauges are not
+        self.assertIn('somasave_push_deliveries_total{result="expired"} 4', body)
+        self.assertIn('somasave_worker_requests_in_progress 1', body)
+
+
+    def test_dead_worker_snapshots_are_archived(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        alive = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        self.addCleanup(alive.wait)
+        self.addCleanup(alive.kill)
+        buckets = len(metrics.EMAIL_SEND_SECONDS.buckets) + 2
+
+        def latency(count, total):
+            return [count] + [0] * (buckets - 2) + [total]
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            for pid, deliveries, in_progress, seconds in ((exited.pid, 3, 4, 0.5), (alive.pid, 2, 5, 0.25)):
+                with open(os.path.join(directory, f'{pid}.json'), 'w') as handle:
+                    json.dump({'pid': pid, 'values': [
+                        ['somasave_push_deliveries_total', ['expired'], deliveries],
+                        ['somasave_worker_requests_in_progress', [], in_progress],
+                        ['somasave_email_send_duration_seconds', ['smtp', 'success'], latency(1, seconds)],
+                    ]}, handle)
+
+            first = metrics.collect()
+            # The exited worker's snapshot is folded into the archive and removed
+            self.assertFalse(os.path.exists(os.path.join(directory, f'{exited.pid}.json')))
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{alive.pid}.json')))
+            self.assertTrue(os.path.exists(os.path.join(directory, 'archive.json')))
+            second = metrics.collect()
+
+        for totals in (first, second):
+            self.assertEqual(totals[('somasave_push_deliveries_total', ('expired',))], 5)
+            # Only the live worker's gauge counts
+            self.assertEqual(totals[('somasave_worker_requests_in_progress', ())], 5)
+            self.assertEqual(totals[('somasave_email_send_duration_seconds', ('smtp', 'success'))], latency(2, 0.75))
+
+
+class LedgerPostingTests(TestCase):
+    """Balances move only through balanced, idempotent ledger postings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='ledger@somasave.com', email='ledger@somasave.com', password='MemberPass123'
+        )
+        cls.account = Account.objects.create(
+            user=cls.member, account_number='SAV-LEDGER', account_type='SAVINGS', balance=Decimal('0.00')
+        )
+
+    def test_deposit_is_credited_once_per_tx_ref(self):
+        MemberSummary.objects.create(user=self.member)
+        deposit = Deposit.objects.create(
+            user=self.member, tx_ref='SACCO_LEDGER', amount=Decimal('25000'), status='PENDING'
+        )
+
+        account, completed = complete_deposit(deposit, transaction_id='PRV9', notify=False)
+        self.assertTrue(completed)
+        self.assertEqual(account.balance, Decimal('25000.00'))
+
+        # A replayed posting (e.g. webhook and poller both settling) changes nothing
+        posting, created = ledger.post_deposit(deposit, self.account)
+        self.assertFalse(created)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('25000.00'))
+        self.assertEqual(MemberSummary.objects.get(user=self.member).total_savings, Decimal('25000.00'))
+
+        entries = LedgerEntry.objects.filter(transaction=posting)
+        self.assertEqual(sum(entry.amount for entry in entries), 0)
+        self.assertEqual(entries.get(account=self.account).balance_after, Decimal('25000.00'))
+        self.assertEqual(ledger.book_balance(ledger.CLEARING_BOOK), Decimal('-25000.00'))
+        self.assertEqual(ledger.find_drift([self.account.pk]), [])
+
+    def test_unbalanced_posting_is_rejected(self):
+        with self.assertRaises(ledger.UnbalancedPosting):
+            ledger.post('BAD-1', 'ADJUSTMENT', [(self.account, Decimal('100')), (ledger.CLEARING_BOOK, Decimal('-90'))])
+
+        self.assertFalse(LedgerTransaction.objects.filter(reference='BAD-1').exists())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('0.00'))
+
+    def test_balance_cannot_be_written_through_the_api(self):
+        self.client.force_login(self.member)
+        url = f'/api/accounts/{self.account.pk}/'
+
+        for method in ('patch', 'put', 'delete'):
+            with self.subTest(method=method):
+                response = getattr(self.client, method)(
+                    url, {'balance': '1000000'}, content_type='application/json', secure=True
+                )
+                self.assertEqual(response.status_code, 405)
+
+        self.assertEqual(self.client.get(url, secure=True).json()['balance'], '0.00')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('0.00'))
+
+    def test_direct_balance_edits_show_up_as_drift(self):
+        ledger.post('ADJ-1', 'ADJUSTMENT', [(self.account, Decimal('500')), (ledger.CLEARING_BOOK, Decimal('-500'))])
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal('900'))
+
+        drift = ledger.find_drift([self.account.pk])
+        self.assertEqual(drift, [{'account_id': self.account.pk, 'balance': Decimal('900.00'), 'ledger_total': Decimal('500.00')}])
+
+
+
+class MemberSummaryTests(TestCase):
+    """Incrementally maintained member summaries always equal a fresh rebuild"""
+
+    fields = (
+        'total_savings', 'active_loans_count', 'active_loans_amount', 'total_repayments',
+        'dividends_ytd', 'dividends_year', 'deposits_30d', 'window_date',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='summary@somasave.com', email='summary@somasave.com', password='MemberPass123'
+        )
+        cls.borrower = Borrower.objects.create(user=cls.member, address='Kampala')
+
+    def setUp(self):
+        rebuild_summaries([self.member.pk])
+
+    def summary(self):
+        return MemberSummary.objects.filter(user=self.member).values(*self.fields).get()
+
+    def assertSummaryMatchesRebuild(self):
+        maintained = self.summary()
+        rebuild_summaries([self.member.pk])
+        self.assertEqual(maintained, self.summary())
+
+    def make_loan(self, code, status='PENDING', amount='30000'):
+        start = timezone.now()
+        return Loan.objects.create(
+            borrower=self.borrower, loan_code=code, amount=Decimal(amount), interest_rate=Decimal('0'),
+            start_date=start, due_date=start + timedelta(days=90), loan_status=status
+        )
+
+    def test_account_create_update_delete(self):
+        account = Account.objects.create(
+            user=self.member, account_number='SAV-SUMMARY', account_type='SAVINGS', balance=Decimal('1000')
+        )
+        self.assertEqual(self.summary()['total_savings'], Decimal('1000.00'))
+        self.assertSummaryMatchesRebuild()
+
+        account.balance = Decimal('4500')
+        account.save()
+        self.assertEqual(self.summary()['total_savings'], Decimal('4500.00'))
+        self.assertSummaryMatchesRebuild()
+
+        account.delete()
+        self.assertEqual(self.summary()['total_savings'], Decimal('0.00'))
+        self.assertSummaryMatchesRebuild()
+
+    def test_ledger_posting_updates_summary(self):
+        account = Account.objects.create(
+            user=self.member, account_number='SAV-SUMMARY', account_type='SAVINGS', balance=Decimal('0')
+        )
+        deposit = Deposit.objects.create(
+            user=self.member, tx_ref='SACCO_SUMMARY', amount=Decimal('25000'), status='PENDING'
+        )
+
+        complete_deposit(deposit, transaction_id='PRV-SUMMARY', notify=False)
+        ledger.post('ADJ-SUMMARY', 'ADJUSTMENT', [(account, Decimal('-5000')), (ledger.CLEARING_BOOK, Decimal('5000'))])
+
+        summary = self.summary()
+        self.assertEqual(summary['total_savings'], Decimal('20000.00'))
+        self.assertEqual(summary['deposits_30d'], Decimal('25000.00'))
+        self.assertSummaryMatchesRebuild()
+
+    def test_loan_status_changes_and_delete(self):
+        loan = self.make_loan('SUM00001')
+        self.assertEqual(self.summary()['active_loans_count'], 0)
+        self.assertSummaryMatchesRebuild()
+
+        loan.loan_status = 'APPROVED'
+        loan.save()
+        self.assertEqual(self.summary()['active_loans_count'], 1)
+        self.assertEqual(self.summary()['active_loans_amount'], Decimal('30000.00'))
+        self.assertSummaryMatchesRebuild()
+
+        loan.amount = Decimal('45000')
+        loan.loan_status = 'DISBURSED'
+        loan.save()
+        self.assertEqual(self.summary()['active_loans_amount'], Decimal('45000.00'))
+        self.assertSummaryMatchesRebuild()
+
+        other = self.make_loan('SUM00002', status='DISBURSED', amount='10000')
+        loan.loan_status = 'COMPLETED'
+        loan.save()
+        self.assertEqual(self.summary()['active_loans_count'], 1)
+        self.assertEqual(self.summary()['active_loans_amount'], Decimal('10000.00'))
+        self.assertSummaryMatchesRebuild()
+
+        other.delete()
+        self.assertEqual(self.summary()['active_loans_count'], 0)
+        self.assertSummaryMatchesRebuild()
+
+    def test_payments_and_dividends(self):
+        loan = self.make_loan('SUM00003', status='DISBURSED')
+        payment = Payment.objects.create(
+            borrower=self.borrower, loan=loan, amount=Decimal('7000'), payment_status='PENDING'
+        )
+        self.assertEqual(self.summary()['total_repayments'], Decimal('0.00'))
+
+        payment.payment_status = 'COMPLETED'
+        payment.save()
+        dividend = ShareTransaction.objects.create(
+            user=self.member, number_of_shares=0, amount=Decimal('1200'), transaction_type='DIVIDEND', status='COMPLETED'
+        )
+        summary = self.summary()
+        self.assertEqual(summary['total_repayments'], Decimal('7000.00'))
+        self.assertEqual(summary['dividends_ytd'], Decimal('1200.00'))
+        self.assertSummaryMatchesRebuild()
+
+        payment.delete()
+        dividend.delete()
+        self.assertEqual(self.summary()['total_repayments'], Decimal('0.00'))
+        self.assertEqual(self.summary()['dividends_ytd'], Decimal('0.00'))
+        self.assertSummaryMatchesRebuild()
+
+    def test_stale_window_is_rebuilt_on_read(self):
+        Deposit.objects.create(user=self.member, tx_ref='SACCO_OLD', amount=Decimal('8000'), status='COMPLETED')
+        # The deposit has since aged out of the 30-day window and the summary is from yesterday
+        Deposit.objects.filter(tx_ref='SACCO_OLD').update(created_at=timezone.now() - timedelta(days=31))
+        yesterday = timezone.localdate() - timedelta(days=1)
+        MemberSummary.objects.filter(user=self.member).update(window_date=yesterday)
+        self.assertEqual(self.summary()['deposits_30d'], Decimal('8000.00'))
+
+        summary = get_member_summary(self.member)
+
+        self.assertEqual(summary.window_date, timezone.localdate())
+        self.assertEqual(summary.deposits_30d, Decimal('0.00'))
+
+    def test_missing_summary_is_built_on_read(self):
+        MemberSummary.objects.filter(user=self.member).delete()
+        Account.objects.create(
+            user=self.member, account_number='SAV-SUMMARY', account_type='SAVINGS', balance=Decimal('300')
+        )
+        # Without a row, signals leave nothing behind to drift
+        self.assertFalse(MemberSummary.objects.filter(user=self.member).exists())
+
+        self.assertEqual(get_member_summary(self.member).total_savings, Decimal('300.00'))
+
+
+
+@override_settings(DASHBOARD_CACHE_ENABLED=True)
+class DashboardCacheTests(TestCase):
+    """Writes behind the dashboard drop the member's cached payload"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='dashboard@somasave.com', email='dashboard@somasave.com', password='MemberPass123'
+        )
+        cls.borrower = Borrower.objects.create(user=cls.member, address='Kampala')
+        start = timezone.now() - timedelta(days=45)
+        cls.loan = Loan.objects.create(
+            borrower=cls.borrower, loan_code='DSH00001', amount=Decimal('20000'), interest_rate=Decimal('0'),
+            start_date=start, due_date=start + timedelta(days=60), loan_status='DISBURSED'
+        )
+        cls.installment = RepaymentSchedule.objects.create(
+            loan=cls.loan, installment_number=1, due_date=(start + timedelta(days=30)).date(), amount=Decimal('20000')
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(self.member)
+
+    def stats(self):
+        response = self.client.get('/api/dashboard/stats/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['stats']
+
+    def assertWriteInvalidates(self, write):
+        self.stats()
+        self.assertIsNotNone(caches['default'].get(dashboard_cache._payload_key(self.member.pk)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+
+        self.assertIsNone(caches['default'].get(dashboard_cache._payload_key(self.member.pk)))
+
+    def test_payment_write_invalidates_cached_payload(self):
+        self.assertEqual(self.stats()['total_repayments'], '0.00')
+
+        self.assertWriteInvalidates(lambda: Payment.objects.create(
+            borrower=self.borrower, loan=self.loan, amount=Decimal('5000'), payment_status='COMPLETED'
+        ))
+
+        self.assertEqual(self.stats()['total_repayments'], '5000.00')
+
+    def test_share_transaction_write_invalidates_cached_payload(self):
+        self.assertWriteInvalidates(lambda: ShareTransaction.objects.create(
+            user=self.member, number_of_shares=0, amount=Decimal('900'), transaction_type='DIVIDEND', status='COMPLETED'
+        ))
+
+        self.assertEqual(self.stats()['dividends'], '900.00')
+
+    def test_installment_write_invalidates_cached_payload(self):
+        def mark_paid():
+            self.installment.status = 'PAID'
+            self.installment.save()
+
+        self.assertWriteInvalidates(mark_paid)
+
+    def test_loan_sweep_invalidates_members_with_changed_installments(self):
+        self.assertWriteInvalidates(sweep_loans)
+
+        self.installment.refresh_from_db()
+        self.assertEqual(self.installment.status, 'OVERDUE')
+
+    def test_cache_requires_a_shared_backend(self):
+        from somasave_backend import settings as project_settings
+        import importlib
+
+        environ = {'DASHBOARD_CACHE_ENABLED': 'True', 'CACHE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with mock.patch.dict(os.environ, environ):
+            self.assertFalse(importlib.reload(project_settings).DASHBOARD_CACHE_ENABLED)
+
+        environ['CACHE_BACKEND'] = 'django.core.cache.backends.redis.RedisCache'
+        with mock.patch.dict(os.environ, environ):
+            self.assertTrue(importlib.reload(project_settings).DASHBOARD_CACHE_ENABLED)
+        importlib.reload(project_settings)
+
+
+@override_settings(RELWORX_WEBHOOK_KEY='test-webhook-key')
+class WebhookInboxTests(TestCase):
+    """Webhooks are stored and acknowledged, then settled exactly once by the job queue"""
+
+    url = '/api/payment-requests/relworx-webhook/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='hooked@somasave.com', email='hooked@somasave.com', password='MemberPass123'
+        )
+
+    def setUp(self):
+        self.deposit = Deposit.objects.create(
+            user=self.member, tx_ref='SACCO_HOOK', amount=Decimal('7000'), status='PENDING'
+        )
+
+    def deliver(self, payment_status='success'):
+        data = {'status': payment_status, 'customer_reference': 'SACCO_HOOK', 'internal_reference': 'INT_HOOK'}
+        timestamp = str(int(time.time()))
+        signed = f'http://testserver{self.url}{timestamp}' + ''.join(f'{k}{v}' for k, v in sorted(data.items()))
+        signature = hmac.new(b'test-webhook-key', signed.encode(), hashlib.sha256).hexdigest()
+
+        gateway = RelworxPaymentGateway()
+        with mock.patch('api.relworx.get_gateway', return_value=gateway):
+            return self.client.post(self.url, data, HTTP_RELWORX_SIGNATURE=f't={timestamp},v={signature}')
+
+    def balance(self):
+        account = Account.objects.filter(user=self.member, account_type='SAVINGS').first()
+        return account.balance if account else Decimal('0')
+
+    def test_acknowledges_before_settling(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.deliver()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('clients_portal_account' in q['sql'] for q in queries.captured_queries))
+
+        self.deposit.refresh_from_db()
+        self.assertEqual(self.deposit.status, 'PENDING')
+        self.assertEqual(WebhookEvent.objects.get().status, 'RECEIVED')
+
+        run_pending()
+
+        self.deposit.refresh_from_db()
+        self.assertEqual(self.deposit.status, 'COMPLETED')
+        self.assertEqual(WebhookEvent.objects.get().status, 'PROCESSED')
+        self.assertEqual(self.balance(), Decimal('7000.00'))
+
+    def test_retried_delivery_and_replay_credit_once(self):
+        self.deliver()
+        self.deliver()
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.deliveries, 2)
+        self.assertEqual(BackgroundJob.objects.filter(name='process_webhook_event').count(), 1)
+
+        run_pending()
+        call_command('replay_webhooks', reference='SACCO_HOOK', stdout=mock.Mock())
+
+        self.assertEqual(self.balance(), Decimal('7000.00'))
+        self.assertEqual(LedgerTransaction.objects.filter(reference='SACCO_HOOK').count(), 1)
+        self.assertEqual(WebhookEvent.objects.get().status, 'IGNORED')
+
+    def test_statuses_match_the_poller(self):
+        for payment_status, expected in (('Successful', 'COMPLETED'), ('declined', 'FAILED'), ('pending', 'PENDING')):
+            with self.subTest(payment_status=payment_status):
+                Deposit.objects.filter(pk=self.deposit.pk).update(status='PENDING')
+                self.deliver(payment_status)
+                run_pending()
+
+                self.deposit.refresh_from_db()
+                self.assertEqual(self.deposit.status, expected)
+
+    def test_bad_signature_is_not_stored(self):
+        response = self.client.post(
+            self.url, {'status': 'success', 'customer_reference': 'SACCO_HOOK'}, HTTP_RELWORX_SIGNATURE='t=1,v=forged'
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+class DepositReconciliationCommandTests(TestCase):
+    """reconcile_deposits settles and reports from one history payload"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = CustomUser.objects.create_user(
+            username='reconcile@somasave.com', email='reconcile@somasave.com', password='MemberPass123'
+        )
+
+    def history_fixture(self, transactions):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        self.addCleanup(os.unlink, handle.name)
+        json.dump({'transactions': transactions}, handle)
+        handle.close()
+        return handle.name
+
+    def test_settles_and_reports_discrepancies(self):
+        def deposit(tx_ref, status, amount='5000'):
+            return Deposit.objects.create(user=self.member, tx_ref=tx_ref, amount=Decimal(amount), status=status)
+
+        deposit('SACCO_R_PAID', 'PENDING')
+        deposit('SACCO_R_DECLINED', 'PENDING')
+        deposit('SACCO_R_SHORT', 'PENDING', amount='9000')
+        deposit('SACCO_R_CONFLICT', 'FAILED')
+        deposit('SACCO_R_DONE', 'COMPLETED')
+        deposit('SACCO_R_LOST', 'PENDING')
+        deposit('SACCO_R_NEW', 'PENDING')
+        # Relworx lists a deposit shortly after it is initiated, so only older ones count as lost
+        Deposit.objects.filter(tx_ref='SACCO_R_LOST').update(created_at=timezone.now() - timedelta(hours=1))
+        path = self.history_fixture([
+            {'customer_reference': 'SACCO_R_PAID', 'status': 'success', 'amount': 5000, 'provider_transaction_id': 'P1'},
+            {'customer_reference': 'SACCO_R_DECLINED', 'status': 'failed', 'amount': 5000},
+            {'customer_reference': 'SACCO_R_SHORT', 'status': 'success', 'amount': 8000},
+            {'customer_reference': 'SACCO_R_CONFLICT', 'status': 'success', 'amount': 5000},
+            {'customer_reference': 'SACCO_R_DONE', 'status': 'success', 'amount': 5000},
+            {'customer_reference': 'SACCO_R_STRAY', 'status': 'success', 'amount': 100},
+        ])
+        output = path + '.report'
+        self.addCleanup(lambda: os.path.exists(output) and os.unlink(output))
+
+        with mock.patch('api.utils.dashboard_cache.invalidate_dashboard') as invalidate:
+            call_command('reconcile_deposits', history_file=path, output=output, stdout=mock.Mock())
+        invalidate.assert_called_with(self.member.pk)
+
+        statuses = dict(Deposit.objects.values_list('tx_ref', 'status'))
+        self.assertEqual(statuses['SACCO_R_PAID'], 'COMPLETED')
+        self.assertEqual(statuses['SACCO_R_DECLINED'], 'FAILED')
+        self.assertEqual(statuses['SACCO_R_SHORT'], 'PENDING')
+        self.assertEqual(Account.objects.get(user=self.member).balance, Decimal('5000.00'))
+
+        with open(output) as handle:
+            report = json.load(handle)
+        self.assertEqual(report['matched'], 5)
+        self.assertEqual(report['unchanged'], 1)
+        self.assertEqual([m['tx_ref'] for m in report['amount_mismatches']], ['SACCO_R_SHORT'])
+        self.assertEqual([c['tx_ref'] for c in report['conflicts']], ['SACCO_R_CONFLICT'])
+        self.assertEqual(report['orphans'], ['SACCO_R_STRAY'])
+        self.assertEqual(report['local_orphans'], ['SACCO_R_LOST'])
+        self.assertEqual(report['completed'], ['SACCO_R_PAID'])
+        self.assertEqual(report['failed'], ['SACCO_R_DECLINED'])
+
+    def test_reports_only_deposits_it_settled(self):
+        Deposit.objects.create(user=self.member, tx_ref='SACCO_R_RACE', amount=Decimal('5000'), status='PENDING')
+        history = {'transactions': [{'customer_reference': 'SACCO_R_RACE', 'status': 'success', 'amount': 5000}]}
+
+        def settled_elsewhere(deposit, **kwargs):
+            # The webhook settles the deposit between the history scan and this call
+            complete_deposit(Deposit.objects.get(pk=deposit.pk), transaction_id='WEBHOOK', notify=False)
+            return complete_deposit(deposit, **kwargs)
+
+        with mock.patch('api.deposits.complete_deposit', side_effect=settled_elsewhere):
+            report = reconcile_deposits(history)
+
+        self.assertEqual(report['completed'], [])
+        self.assertEqual(Account.objects.get(user=self.member).balance, Decimal('5000.00'))
+
+    def test_dry_run_uses_gateway_and_bulk_queries(self):
+        Deposit.objects.bulk_create([
+            Deposit(user=self.member, tx_ref=f'SACCO_BULK_{n}', amount=Decimal('1000'), status='PENDING')
+            for n in range(1200)
+        ])
+        history = [
+            {'customer_reference': f'SACCO_BULK_{n}', 'status': 'failed', 'amount': 1000}
+            for n in range(1200)
+        ]
+        gateway = mock.Mock()
+        gateway.get_transaction_history.return_value = {'success': True, 'data': {'transactions': history}}
+
+        with mock.patch('api.relworx.get_gateway', return_value=gateway), \
+                CaptureQueriesContext(connection) as queries:
+            call_command('reconcile_deposits', dry_run=True, stdout=mock.Mock())
+        # Two chunks of matching deposits and the pending deposits missing from the history
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(Deposit.objects.filter(status='PENDING').count(), 1200)
+
+        with mock.patch('api.relworx.get_gateway', return_value=gateway), \
+                CaptureQueriesContext(connection) as queries:
+            call_command('reconcile_deposits', stdout=mock.Mock())
+        # Plus one locking select and one update for all failures, inside a savepoint
+        self.assertEqual(len(queries), 8)
+        self.assertEqual(Deposit.objects.filter(status='FAILED').count(), 1200)
+
+
+class RepaymentScheduleTests(TestCase):
+    """Amortization schedules add up exactly and are generated in bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            username='loans-staff@somasave.com', email='loans-staff@somasave.com',
+            password='StaffPass123', is_staff=True
+        )
+        user = CustomUser.objects.create_user(
+            username='loans-member@somasave.com', email='loans-member@somasave.com', password='MemberPass123'
+        )
+        cls.borrower = Borrower.objects.create(user=user, address='Kampala')
+        cls.loan_count = 0
+
+    def make_loans(self, count, **fields):
+        start = timezone.now()
+        loans = []
+        for _ in range(count):
+            self.loan_count += 1
+            loans.append(Loan(
+                borrower=self.borrower, loan_code=f'S{self.loan_count:05d}', amount=Decimal('1000000'),
+                interest_rate=Decimal('12'), start_date=start, due_date=start + timedelta(days=365),
+                loan_status='APPROVED', **fields
+            ))
+        return Loan.objects.bulk_create(loans)
+
+    def test_reducing_balance_schedule(self):
+        start = timezone.datetime(2025, 1, 31)
+        installments = build_schedule(Decimal('1000000'), Decimal('12'), start, start.replace(year=2026))
+
+        self.assertEqual(len(installments), 12)
+        self.assertEqual(installments[0].due_date.isoformat(), '2025-02-28')
+        self.assertEqual(installments[-1].due_date.isoformat(), '2026-01-31')
+        self.assertEqual(sum(i.principal for i in installments), Decimal('1000000.00'))
+        self.assertEqual(installments[-1].balance_after, Decimal('0.00'))
+        # 1% a month annuity: 88,848.79 a month
+        self.assertEqual(installments[0].amount, Decimal('88848.79'))
+        self.assertEqual(installments[0].interest, Decimal('10000.00'))
+        self.assertEqual(
+            sum(i.amount for i in installments),
+            sum(i.principal + i.interest for i in installments)
+        )
+
+    def test_flat_weekly_schedule(self):
+        start = timezone.datetime(2025, 1, 1)
+        installments = build_schedule(
+            Decimal('100000'), Decimal('26'), start, start + timedelta(days=30), frequency='WEEKLY', method='FLAT'
+        )
+
+        self.assertEqual(len(installments), 5)
+        self.assertEqual([i.due_date.day for i in installments], [8, 15, 22, 29, 31])
+        # 0.5% a week on the original principal for 5 weeks
+        self.assertEqual(sum(i.interest for i in installments), Decimal('2500.00'))
+        self.assertEqual(sum(i.amount for i in installments), Decimal('102500.00'))
+        self.assertEqual({i.interest for i in installments}, {Decimal('500.00')})
+
+    def test_approve_creates_schedule(self):
+        loan, = self.make_loans(1)
+        Loan.objects.filter(pk=loan.pk).update(loan_status='PENDING')
+        self.client.force_login(self.staff)
+
+        response = self.client.post(f'/api/loans/{loan.pk}/approve/', secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loan.repayment_schedules.count(), 12)
+        self.client.post(f'/api/loans/{loan.pk}/approve/', secure=True)
+        self.assertEqual(loan.repayment_schedules.count(), 12)
+
+    def test_approve_rejects_unschedulable_loan(self):
+        loan, = self.make_loans(1)
+        Loan.objects.filter(pk=loan.pk).update(loan_status='PENDING', amount=Decimal('0'))
+        self.client.force_login(self.staff)
+
+        response = self.client.post(f'/api/loans/{loan.pk}/approve/', secure=True)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Loan amount must be positive'})
+        loan.refresh_from_db()
+        self.assertEqual(loan.loan_status, 'PENDING')
+        self.assertFalse(loan.repayment_schedules.exists())
+
+    def test_batch_queries_do_not_grow_with_loans(self):
+        def run(loans):
+            ids = [loan.pk for loan in loans]
+            with CaptureQueriesContext(connection) as queries:
+                report = regenerate_schedules(Loan.objects.filter(pk__in=ids))
+            self.assertEqual(report['loans'], len(loans))
+            # INSERTs are split by the backend's parameter limit, not per loan
+            return len([q for q in queries if not q['sql'].startswith('INSERT')])
+
+        self.assertEqual(run(self.make_loans(10)), run(self.make_loans(100)))
+
+    def test_batch_keeps_paid_schedules(self):
+        paid, unpaid = self.make_loans(2, repayment_frequency='WEEKLY')
+        RepaymentSchedule.objects.create(loan=paid, installment_number=1, due_date=timezone.now().date(),
+                                         amount=Decimal('5000'), status='PAID')
+        RepaymentSchedule.objects.create(loan=unpaid, installment_number=1, due_date=timezone.now().date(),
+                                         amount=Decimal('5000'))
+
+        report = regenerate_schedules(Loan.objects.filter(pk__in=[paid.pk, unpaid.pk]))
+
+        self.assertEqual(report['skipped_paid'], 1)
+        self.assertEqual(paid.repayment_schedules.count(), 1)
+        self.assertEqual(unpaid.repayment_schedules.count(), 53)
+
+
+class LoanSweepTests(TestCase):
+    """sweep_loans matches payments to installments and closes paid loans"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username='sweep@somasave.com', email='sweep@somasave.com', password='MemberPass123'
+        )
+        cls.borrower = Borrower.objects.create(user=cls.user, address='Kampala')
+
+    def make_loan(self, code, installments=3):
+        start = timezone.now() - timedelta(days=90)
+        loan = Loan.objects.create(
+            borrower=self.borrower, loan_code=code, amount=Decimal('30000'), interest_rate=Decimal('0'),
+            start_date=start, due_date=start + timedelta(days=90), loan_status='DISBURSED'
+        )
+        RepaymentSchedule.objects.bulk_create([
+            RepaymentSchedule(loan=loan, installment_number=n, due_date=(start + timedelta(days=30 * n)).date(),
+                              amount=Decimal('10000'))
+            for n in range(1, installments + 1)
+        ])
+        return loan
+
+    def pay(self, loan, amount, status='COMPLETED'):
+        Payment.objects.create(borrower=self.borrower, loan=loan, amount=Decimal(amount), payment_status=status)
+
+    def statuses(self, loan):
+        return list(loan.repayment_schedules.order_by('installment_number').values_list('status', flat=True))
+
+    def test_partial_payment_and_overdue(self):
+        loan = self.make_loan('SW00001')
+        self.pay(loan, '15000')
+        self.pay(loan, '50000', status='FAILED')
+        today = timezone.localdate() - timedelta(days=15)
+
+        counts = sweep_loans(today)
+
+        self.assertEqual(self.statuses(loan), ['PAID', 'OVERDUE', 'PENDING'])
+        self.assertEqual(counts, {'paid': 1, 'overdue': 1, 'completed': 0})
+
+        self.pay(loan, '5000')
+        self.assertEqual(sweep_loans(today), {'paid': 1, 'overdue': 0, 'completed': 0})
+        self.assertEqual(self.statuses(loan), ['PAID', 'PAID', 'PENDING'])
+
+    def test_completes_fully_paid_loans(self):
+        paid_off = self.make_loan('SW00002')
+        self.make_loan('SW00003')
+        self.pay(paid_off, '30000')
+        summary_before = MemberSummary.objects.count()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = sweep_loans()
+
+        self.assertEqual(counts['completed'], 1)
+        self.assertEqual(Loan.objects.get(pk=paid_off.pk).loan_status, 'COMPLETED')
+        self.assertEqual(Loan.objects.filter(loan_status='DISBURSED').count(), 1)
+        self.assertEqual(MemberSummary.objects.count(), summary_before + 1)
+        self.assertEqual(MemberSummary.objects.get(user=self.user).active_loans_count, 1)
+        self.assertEqual(sweep_loans()['completed'], 0)
+
+    def test_query_count_is_constant(self):
+        for n in range(20):
+            loan = self.make_loan(f'SW1{n:04d}')
+            self.pay(loan, '30000')
+
+        with CaptureQueriesContext(connection) as queries:
+            counts = sweep_loans()
+
+        self.assertEqual(counts['completed'], 20)
+        self.assertLess(len(queries), 15)
+
+
+class ReportBuilderTests(TestCase):
+    """build_reports snapshots totals and only revisits borrowers with new activity"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrowers = []
+        for n in range(3):
+            user = CustomUser.objects.create_user(
+                username=f'report{n}@somasave.com', email=f'report{n}@somasave.com', password='MemberPass123'
+            )
+            cls.borrowers.append(Borrower.objects.create(user=user, address='Kampala'))
+        now = timezone.now()
+        cls.loan = Loan.objects.create(
+            borrower=cls.borrowers[0], loan_code='RP00001', amount=Decimal('50000'), interest_rate=Decimal('12'),
+            start_date=now, due_date=now + timedelta(days=90), loan_status='DISBURSED'
+        )
+        Loan.objects.create(
+            borrower=cls.borrowers[0], loan_code='RP00002', amount=Decimal('90000'), interest_rate=Decimal('12'),
+            start_date=now, due_date=now + timedelta(days=90), loan_status='REJECTED'
+        )
+        Payment.objects.create(borrower=cls.borrowers[0], loan=cls.loan, amount=Decimal('7000'), payment_status='COMPLETED')
+        Payment.objects.create(borrower=cls.borrowers[0], loan=cls.loan, amount=Decimal('3000'), payment_status='FAILED')
+
+    def latest(self, borrower):
+        return Report.objects.filter(borrower=borrower).order_by('-id').first()
+
+    def test_first_run_is_full(self):
+        with CaptureQueriesContext(connection) as queries:
+            run = build_reports()
+
+        self.assertTrue(run.full)
+        self.assertEqual(run.borrowers, 3)
+        report = self.latest(self.borrowers[0])
+        self.assertEqual(report.total_loans, Decimal('50000.00'))
+        self.assertEqual(report.total_payments, Decimal('7000.00'))
+        self.assertEqual(self.latest(self.borrowers[1]).total_loans, Decimal('0.00'))
+        # Four for run bookkeeping, borrower ids, one aggregate per metric, one insert
+        self.assertEqual(len(queries), 8)
+
+    def test_incremental_run_only_snapshots_changed_borrowers(self):
+        build_reports()
+        self.assertEqual(build_reports().borrowers, 0)
+
+        Payment.objects.create(borrower=self.borrowers[0], loan=self.loan, amount=Decimal('5000'), payment_status='COMPLETED')
+        run = build_reports()
+
+        self.assertFalse(run.full)
+        self.assertEqual(run.borrowers, 1)
+        self.assertEqual(Report.objects.filter(borrower=self.borrowers[0]).count(), 2)
+        self.assertEqual(Report.objects.filter(borrower=self.borrowers[1]).count(), 1)
+        self.assertEqual(self.latest(self.borrowers[0]).total_payments, Decimal('12000.00'))
+        self.assertEqual(ReportRun.objects.count(), 3)
+
+    def test_incremental_run_picks_up_deletes(self):
+        now = timezone.now()
+        Loan.objects.create(
+            borrower=self.borrowers[2], loan_code='RP00003', amount=Decimal('10000'), interest_rate=Decimal('12'),
+            start_date=now, due_date=now + timedelta(days=90), loan_status='DISBURSED'
+        )
+        build_reports()
+        Payment.objects.filter(borrower=self.borrowers[0], payment_status='COMPLETED').delete()
+        # A member deleted with their loans leaves no borrower to snapshot
+        self.borrowers[2].user.delete()
+        self.assertTrue(ReportDeletion.objects.exists())
+
+        run = build_reports()
+
+        self.assertEqual(run.borrowers, 1)
+        self.assertEqual(self.latest(self.borrowers[0]).total_payments, Decimal('0.00'))
+        self.assertEqual(self.latest(self.borrowers[0]).total_loans, Decimal('50000.00'))
+
+        self.assertEqual(build_reports().borrowers, 0)
+        self.assertFalse(ReportDeletion.objects.exists())
+
+
+class DatabaseSettingsTests(TestCase):
+    """Production never falls back to SQLite because DB_NAME is missing"""
+
+    def load_settings(self, argv, **environ):
+        from django.core.exceptions import ImproperlyConfigured
+        from somasave_backend import settings as project_settings
+        import importlib
+
+        self.addCleanup(importlib.reload, project_settings)
+        with mock.patch.dict(os.environ, environ), mock.patch.object(sys, 'argv', argv):
+            for name in ('DB_NAME', 'DB_ENGINE'):
+                if name not in environ:
+                    os.environ.pop(name, None)
+            try:
+                return importlib.reload(project_settings).DATABASES['default']['ENGINE']
+            except ImproperlyConfigured as e:
+                return e
+
+    def test_missing_db_name_is_an_error(self):
+        self.assertIn('DB_NAME is not set', str(self.load_settings(['manage.py', 'runserver'])))
+
+    def test_sqlite_is_opt_in(self):
+        self.assertEqual(
+            self.load_settings(['manage.py', 'runserver'], DB_ENGINE='sqlite'), 'django.db.backends.sqlite3'
+        )
+        self.assertEqual(self.load_settings(['manage.py', 'test']), 'django.db.backends.sqlite3')
+        self.assertEqual(
+            self.load_settings(['manage.py', 'test'], DB_NAME='somasave'), 'django.db.backends.postgresql'
+        )
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    EXPLAIN the portal's most frequent filters on a seeded dataset and fail
+    if any of them reads a whole table. PostgreSQL is told to avoid
+    sequential scans so the check reflects whether an index can serve the
+    query, not the planner's preference on a small table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'plan{n}@somasave.com', email=f'plan{n}@somasave.com', student_id=f'PLN{n:05d}')
+            for n in range(200)
+        ])
+        cls.user = users[0]
+        Deposit.objects.bulk_create([
+            Deposit(user=user, tx_ref=f'SACCO_PLAN_{user.pk}_{n}', amount=Decimal('1000'),
+                    status=('COMPLETED', 'PENDING', 'FAILED')[n % 3], next_check_at=now)
+            for user in users for n in range(5)
+        ])
+        ShareTransaction.objects.bulk_create([
+            ShareTransaction(user=user, number_of_shares=1, amount=Decimal('100'),
+                             transaction_type=('BUY', 'DIVIDEND')[n % 2], status='COMPLETED')
+            for user in users for n in range(4)
+        ])
+        LoginActivity.objects.bulk_create([LoginActivity(user=user, ip_address='127.0.0.1') for user in users])
+        PushSubscription.objects.bulk_create([
+            PushSubscription(user=user, endpoint=f'https://push.example.com/{user.pk}', p256dh_key='k', auth_key='a')
+            for user in users
+        ])
+        borrowers = Borrower.objects.bulk_create([Borrower(user=user, address='Kampala') for user in users])
+        cls.borrower = borrowers[0]
+        loans = Loan.objects.bulk_create([
+            Loan(borrower=borrower, loan_code=f'PL{borrower.pk:05d}', amount=Decimal('10000'), interest_rate=Decimal('12'),
+                 start_date=now, due_date=now + timedelta(days=30), loan_status='DISBURSED')
+            for borrower in borrowers
+        ])
+        RepaymentSchedule.objects.bulk_create([
+            RepaymentSchedule(loan=loan, installment_number=1, due_date=now.date(), amount=Decimal('10000'))
+            for loan in loans
+        ])
+
+    def hot_queries(self):
+        user, now = self.user, timezone.now()
+        return {
+            'deposits_30d': Deposit.objects.filter(user=user, status='COMPLETED', created_at__gte=now - timedelta(days=30)),
+            'recent_deposits': Deposit.objects.filter(user=user, status='COMPLETED').order_by('-created_at')[:5],
+            'due_deposits': due_deposits(now)[:200],
+            'dividends_ytd': ShareTransaction.objects.filter(user=user, transaction_type='DIVIDEND', timestamp__year=now.year),
+            'active_loans': Loan.objects.filter(borrower=self.borrower, loan_status__in=('APPROVED', 'DISBURSED')),
+            'push_subscriptions': PushSubscription.objects.filter(user=user, is_active=True),
+            'login_history': LoginActivity.objects.filter(user=user).order_by('-login_time')[:20],
+            'user_by_email': CustomUser.objects.filter(email=user.email),
+            'overdue_installments': RepaymentSchedule.objects.filter(status='PENDING', due_date__lt=now.date()),
+        }
+
+    def sequential_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            return [line for line in plan.splitlines() if 'Seq Scan' in line]
+        # SQLite: "SCAN <table>" reads every row; index scans say "USING ... INDEX"
+        return [line for line in plan.splitlines() if 'SCAN' in line and 'INDEX' not in line]
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertEqual(self.sequential_scans(plan), [], f'{name} plan:\n{plan}')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server standing in for Zoho in tests. Records every
+    accepted message and how many connections were opened.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, reject=(), defer=()):
+        self.messages = []
+        self.connections = 0
+        self.reject = set(reject)
+        self.defer = set(defer)
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 sink ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 sink')
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip('<> ')
+                if address in self.server.reject:
+                    self.reply('550 no such user')
+                elif address in self.server.defer:
+                    self.reply('451 try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 ok')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                while (chunk := self.rfile.readline()) not in (b'.\r\n', b''):
+                    data.append(chunk)
+                self.server.messages.append((recipients, b''.join(data).decode()))
+                recipients = []
+                self.reply('250 queued')
+            else:
+                # MAIL, RSET, NOOP
+                self.reply('250 ok')
+
+
+class MailerTests(TestCase):
+    """Email jobs share one warm SMTP connection per worker thread"""
+
+    def setUp(self):
+        self.sink = SMTPSink(reject=['bounce@example.com'])
+        self.addCleanup(self.sink.stop)
+        self.addCleanup(mailer.close)
+        overrides = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.sink.port, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, USE_RESEND=False, RESEND_API_KEY=None, EMAIL_BATCH_SIZE=2,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_jobs_reuse_one_connection_and_batch(self):
+        user = CustomUser.objects.create_user(
+            username='otp-mail@somasave.com', email='otp-mail@somasave.com', password='MemberPass123', otp_code='123456'
+        )
+        enqueue('send_otp_email', {'user_id': user.pk, 'purpose': 'login'})
+        enqueue('send_emails', {'messages': [
+            {'to': f'member{n}@example.com', 'subject': 'Statement', 'text': f'Hello {n}', 'html': f'<p>Hello {n}</p>'}
+            for n in range(5)
+        ]})
+
+        self.assertEqual(run_pending(), 2)
+
+        self.assertEqual(len(self.sink.messages), 6)
+        self.assertEqual(self.sink.connections, 1)
+        self.assertIn('123456', self.sink.messages[0][1])
+        self.assertEqual(self.sink.messages[-1][0], ['member4@example.com'])
+        self.assertEqual(BackgroundJob.objects.filter(status='SUCCEEDED').count(), 2)
+
+    def test_retry_skips_delivered_messages(self):
+        self.sink.defer.add('member3@example.com')
+        queued = enqueue('send_emails', {'messages': [
+            {'to': f'member{n}@example.com', 'subject': 'AGM', 'text': f'Hello {n}'} for n in range(5)
+        ]})
+
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'PENDING')
+        self.assertEqual([m['to'] for m in queued.payload['messages']], ['member3@example.com', 'member4@example.com'])
+
+        self.sink.defer.clear()
+        BackgroundJob.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        run_pending()
+
+        delivered = [recipients[0] for recipients, _ in self.sink.messages]
+        self.assertEqual(delivered, [f'member{n}@example.com' for n in range(5)])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'SUCCEEDED')
+
+    @override_settings(USE_RESEND=True, RESEND_API_KEY='re_test')
+    def test_resend_failure_reports_delivered_batches(self):
+        import resend
+
+        outage = resend.exceptions.ResendError(503, 'service_unavailable', 'down', 'retry')
+        messages = [mailer.build_message(f'member{n}@example.com', 'AGM', 'Hello') for n in range(5)]
+        with mock.patch('resend.Batch.send', side_effect=[{'data': []}, outage]) as batch:
+            with self.assertRaises(mailer.TransientEmailError) as failure:
+                mailer.send(messages)
+
+        self.assertEqual(batch.call_count, 2)
+        self.assertEqual(failure.exception.processed, 2)
+
+    def test_dropped_connection_is_reopened(self):
+        mailer.send([mailer.build_message('a@example.com', 'One', 'First')])
+        # The session ends underneath the cached backend, as when the server drops an idle client
+        mailer._local.smtp.connection.quit()
+
+        mailer.send([mailer.build_message('b@example.com', 'Two', 'Second')])
+
+        self.assertEqual(len(self.sink.messages), 2)
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_permanent_rejection_is_not_retried(self):
+        sent = mailer.send([mailer.build_message('bounce@example.com', 'Hi', 'Text')])
+        self.assertEqual(sent, 0)
+
+    def test_unreachable_server_is_transient(self):
+        with override_settings(EMAIL_PORT=1):
+            with self.assertRaises(mailer.TransientEmailError):
+                mailer.send([mailer.build_message('a@example.com', 'Hi', 'Text')])
+
+
+@override_settings(USE_RESEND=False, RESEND_API_KEY=None, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EmailTemplateTests(TestCase):
+    """Emails render from templates compiled once, in the member's language"""
+
+    def test_templates_are_compiled_once(self):
+        email_templates.load()
+        with mock.patch('django.template.loaders.filesystem.Loader.get_contents',
+                        side_effect=AssertionError('template read from disk')):
+            for language in ('en', 'sw', 'lg'):
+                for name in ('password_reset', 'deposit_confirmation', 'broadcast'):
+                    email_templates.render(name, {'name': 'Ann'}, language=language)
+
+    def test_translation_with_english_fallback(self):
+        context = {'otp': '654321', 'purpose': 'login'}
+        swahili = email_templates.render('otp', context, language='sw')
+        luganda = email_templates.render('otp', context, language='lg')
+
+        self.assertIn('Nambari', swahili.subject)
+        self.assertIn('654321', swahili.text)
+        self.assertEqual(luganda.subject, 'SomaSave SACCO - Login Verification Code')
+        self.assertEqual(email_templates.render('password_reset', {'name': 'Ann'}, language='sw').subject,
+                         'SomaSave SACCO - Password Reset Request')
+
+    @override_settings(EMAIL_HOST_PASSWORD='secret', FRONTEND_URL='https://portal.example.com')
+    def test_password_reset_email(self):
+        from .serializers import PasswordResetRequestSerializer
+
+        user = CustomUser.objects.create_user(
+            username='reset@somasave.com', email='reset@somasave.com', password='MemberPass123',
+            first_name='<Ann>', last_name='Byaru',
+        )
+        serializer = PasswordResetRequestSerializer(data={'email': 'reset@somasave.com'})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        # Only the user id is queued: the reset token never reaches the job table
+        self.assertEqual(BackgroundJob.objects.get(name='send_password_reset_email').payload, {'user_id': user.pk})
+        run_pending()
+
+        email = mail.outbox[0]
+        html = email.alternatives[0][0]
+        self.assertEqual(email.subject, 'SomaSave SACCO - Password Reset Request')
+        self.assertIn('Hello <Ann> Byaru,', email.body)
+        self.assertIn('&lt;Ann&gt; Byaru', html)
+        self.assertIn(f'© {timezone.now().year} SomaSave SACCO', html)
+
+        link = next(line for line in email.body.splitlines() if line.startswith('https://portal.example.com/reset-password/'))
+        uid, token = link.rsplit('/', 2)[-2:]
+        self.assertEqual(uid, urlsafe_base64_encode(force_bytes(user.pk)))
+        self.assertTrue(PasswordResetTokenGenerator().check_token(user, token))
+        self.assertNotIn(token, json.dumps(list(BackgroundJob.objects.values_list('payload', flat=True))))
+
+    def test_deposit_confirmation_respects_alerts(self):
+        alerted = CustomUser.objects.create_user(
+            username='alerts@somasave.com', email='alerts@somasave.com', password='MemberPass123', language='sw'
+        )
+        muted = CustomUser.objects.create_user(
+            username='muted@somasave.com', email='muted@somasave.com', password='MemberPass123',
+            transaction_alerts=False,
+        )
+        for n, user in enumerate((alerted, muted)):
+            complete_deposit(Deposit.objects.create(user=user, tx_ref=f'EMAIL-{n}', amount=Decimal('25000'), status='PENDING'))
+
+        run_pending()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['alerts@somasave.com'])
+        self.assertIn('Amana ya UGX 25,000', mail.outbox[0].subject)
+        self.assertIn('Salio jipya: UGX 25,000', mail.outbox[0].body)
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_broadcast_renders_personalized_batches(self):
+        for n in range(5):
+            CustomUser.objects.create_user(
+                username=f'campaign{n}@somasave.com', email=f'campaign{n}@somasave.com', password='MemberPass123',
+                first_name=f'Member{n}',
+            )
+        CustomUser.objects.create_user(
+            username='optout@somasave.com', email='optout@somasave.com', password='MemberPass123',
+            email_notifications=False,
+        )
+
+        call_command('broadcast_email', title='AGM', message='See you there', yes=True, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(BackgroundJob.objects.filter(name='send_emails').count(), 3)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertIn('Hello Member4', mail.outbox[-1].body)
+        self.assertEqual(mail.outbox[-1].subject, 'AGM')
+
+    def test_render_throughput(self):
+        context = {'title': 'AGM', 'message': 'See you there', 'url': 'https://somasave.com'}
+        started = time.perf_counter()
+        for n in range(1000):
+            email_templates.message('broadcast', f'member{n}@example.com', {**context, 'name': f'Member {n}'})
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+
+class ProfileImagePipelineTests(TestCase):
+    """Profile PATCHes downsize the image locally and leave the Cloudinary upload to a job"""
+
+    def setUp(self):
+        self.member = CustomUser.objects.create_user(
+            username='avatar@somasave.com', email='avatar@somasave.com', password='MemberPass123'
+        )
+        self.client.force_login(self.member)
+
+    def _photo(self, size=(3000, 2000), format='JPEG'):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', size, (16, 185, 129)).save(buffer, format)
+        buffer.seek(0)
+        buffer.name = f'photo.{format.lower()}'
+        return buffer
+
+    def _patch(self, data):
+        from django.test.client import MULTIPART_CONTENT, BOUNDARY, encode_multipart
+
+        return self.client.patch(
+            '/api/users/update-profile/', encode_multipart(BOUNDARY, data), content_type=MULTIPART_CONTENT
+        )
+
+    def test_patch_returns_before_upload(self):
+        from django.core.files.uploadedfile import TemporaryUploadedFile
+        from PIL import Image
+
+        with mock.patch('cloudinary.uploader.upload') as upload, \
+                mock.patch.object(profile_images, 'downsize', wraps=profile_images.downsize) as downsize:
+            response = self._patch({'first_name': 'Ann', 'profile_image': self._photo()})
+
+        self.assertEqual(response.status_code, 200)
+        upload.assert_not_called()
+        self.assertIsInstance(downsize.call_args.args[0], TemporaryUploadedFile)
+        self.assertEqual(response.json()['profile_image_status'], 'PENDING')
+        self.assertEqual(response.json()['first_name'], 'Ann')
+
+        pending = ProfileImageUpload.objects.get(user=self.member)
+        with Image.open(BytesIO(bytes(pending.image))) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (800, 533)))
+        self.assertTrue(BackgroundJob.objects.filter(name='upload_profile_image').exists())
+
+    def test_job_uploads_idempotently(self):
+        self._patch({'profile_image': self._photo()})
+        enqueue('upload_profile_image', {'user_id': self.member.pk})  # A duplicate delivery
+
+        secure_url = f'https://res.cloudinary.com/demo/image/upload/v2/somasave/profiles/user_{self.member.pk}.jpg'
+        with mock.patch('cloudinary.uploader.upload', return_value={'secure_url': secure_url}) as upload:
+            self.assertEqual(run_pending(), 2)
+
+        upload.assert_called_once()
+        self.assertEqual(upload.call_args.kwargs['public_id'], f'user_{self.member.pk}')
+        self.assertTrue(upload.call_args.kwargs['overwrite'])
+        self.member.refresh_from_db()
+        self.assertEqual((self.member.profile_image, self.member.profile_image_status), (secure_url, 'READY'))
+        self.assertFalse(ProfileImageUpload.objects.exists())
+
+    def test_rejected_by_cloudinary(self):
+        import cloudinary.exceptions
+
+        self._patch({'profile_image': self._photo(size=(300, 300), format='PNG')})
+        with mock.patch('cloudinary.uploader.upload', side_effect=cloudinary.exceptions.BadRequest('Invalid image')):
+            run_pending()
+
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.profile_image_status, 'FAILED')
+        self.assertEqual(BackgroundJob.objects.get(name='upload_profile_image').status, 'SUCCEEDED')
+
+    def test_last_failed_attempt_marks_upload_failed(self):
+        import cloudinary.exceptions
+
+        self._patch({'profile_image': self._photo(size=(300, 300))})
+        queued = BackgroundJob.objects.get(name='upload_profile_image')
+
+        with mock.patch('cloudinary.uploader.upload', side_effect=cloudinary.exceptions.Error('Timed out')):
+            for attempt in range(queued.max_attempts):
+                BackgroundJob.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+                run_pending()
+
+                self.member.refresh_from_db()
+                if attempt < queued.max_attempts - 1:
+                    self.assertEqual(self.member.profile_image_status, 'PENDING')
+                    self.assertTrue(ProfileImageUpload.objects.exists())
+
+        self.assertEqual(self.member.profile_image_status, 'FAILED')
+        self.assertFalse(ProfileImageUpload.objects.exists())
+        self.assertEqual(BackgroundJob.objects.get(pk=queued.pk).status, 'FAILED')
+
+    def test_invalid_upload_is_rejected_locally(self):
+        not_an_image = BytesIO(b'%PDF-1.4 not an image')
+        not_an_image.name = 'cv.pdf'
+
+        response = self._patch({'first_name': 'Changed', 'profile_image': not_an_image})
+
+        self.assertEqual(response.status_code, 400)
+        self.member.refresh_from_db()
+        self.assertNotEqual(self.member.first_name, 'Changed')
+        self.assertFalse(BackgroundJob.objects.filter(name='upload_profile_image').exists())
@@ -5,7 +5,7 @@ from .views import (
     LoginActivityViewSet, BorrowerViewSet, LoanViewSet, PaymentViewSet,
     RepaymentScheduleViewSet, ReportViewSet, NationalIDVerificationViewSet,
     UniversityViewSet, CourseViewSet, PushSubscriptionViewSet, PushNotificationViewSet,
-    RegisterView, LoginView, LogoutView, CurrentUserView, DashboardStatsView,
+    RegisterView, LoginView, LogoutView, CurrentUserView, DashboardStatsView, DashboardCacheStatsView, ProfilingStatsView,
     PasswordResetRequestView, PasswordResetConfirmView, TestEmailConfigView,
     InitiateDepositView, VerifyDepositView, RelworxWebhookView
 )
@@ -36,6 +36,8 @@ urlpatterns = [
     path('auth/password-reset/', PasswordResetRequestView.as_view(), name='password-reset-request'),
     path('auth/password-reset-confirm/', PasswordResetConfirmView.as_view(), name='password-reset-confirm'),
     path('dashboard/stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('dashboard/cache-stats/', DashboardCacheStatsView.as_view(), name='dashboard-cache-stats'),
+    path('profiling/stats/', ProfilingStatsView.as_view(), name='profiling-stats'),
     path('test/email-config/', TestEmailConfigView.as_view(), name='test-email-config'),
     path('payment-requests/initiate-deposit/', InitiateDepositView.as_view(), name='initiate-deposit'),
     path('payment-requests/verify-deposit/', VerifyDepositView.as_view(), name='verify-deposit'),
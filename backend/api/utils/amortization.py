@@ -0,0 +1,141 @@
+"""
+Loan amortization schedules
+
+Pure functions: no database access. Amounts are Decimal and rounded to the
+shilling cent with ROUND_HALF_UP at every step; the final installment takes
+the rounding remainder so the principal parts always add up to the loan
+amount exactly.
+
+Interest rates are yearly percentages (e.g. 12 for 12% per annum):
+- REDUCING: equal installments (annuity); each period's interest is charged
+  on the outstanding balance
+- FLAT: interest on the original principal for the whole term, spread evenly
+"""
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+import math
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+PERIODS_PER_YEAR = {
+    'WEEKLY': 52,
+    'MONTHLY': 12,
+}
+
+
+@dataclass(frozen=True)
+class Installment:
+    number: int
+    due_date: date
+    amount: Decimal
+    principal: Decimal
+    interest: Decimal
+    balance_after: Decimal
+
+
+def _cents(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _as_date(value):
+    return value.date() if hasattr(value, 'date') else value
+
+
+def add_months(day, months):
+    """Same day of the month `months` later, clamped to the end of shorter months"""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, monthrange(year, month)[1]))
+
+
+def due_dates(start, end, frequency):
+    """
+    Installment due dates from one period after `start` up to `end`.
+
+    The number of periods is rounded up so the loan is repaid by `end`; the
+    last installment falls due on `end` itself.
+    """
+    start, end = _as_date(start), _as_date(end)
+
+    if frequency == 'WEEKLY':
+        periods = max(1, math.ceil((end - start).days / 7))
+        dates = [start + timedelta(weeks=n) for n in range(1, periods + 1)]
+    elif frequency == 'MONTHLY':
+        periods = (end.year - start.year) * 12 + end.month - start.month
+        if add_months(start, periods) < end:
+            periods += 1
+        periods = max(1, periods)
+        dates = [add_months(start, n) for n in range(1, periods + 1)]
+    else:
+        raise ValueError(f"Unsupported repayment frequency: {frequency}")
+
+    dates[-1] = max(end, start + timedelta(days=1))
+    return dates
+
+
+def _reducing(principal, period_rate, dates):
+    periods = len(dates)
+    if period_rate == 0:
+        payment = _cents(principal / periods)
+    else:
+        growth = (1 + period_rate) ** periods
+        payment = _cents(principal * period_rate * growth / (growth - 1))
+
+    balance = principal
+    schedule = []
+    for number, due in enumerate(dates, start=1):
+        interest = _cents(balance * period_rate)
+        principal_part = balance if number == periods else min(balance, payment - interest)
+        balance -= principal_part
+        schedule.append(Installment(number, due, principal_part + interest, principal_part, interest, balance))
+    return schedule
+
+
+def _flat(principal, period_rate, dates):
+    periods = len(dates)
+    total_interest = _cents(principal * period_rate * periods)
+    principal_part = _cents(principal / periods)
+    interest_part = _cents(total_interest / periods)
+
+    balance = principal
+    interest_left = total_interest
+    schedule = []
+    for number, due in enumerate(dates, start=1):
+        if number == periods:
+            principal_part, interest_part = balance, interest_left
+        balance -= principal_part
+        interest_left -= interest_part
+        schedule.append(Installment(number, due, principal_part + interest_part, principal_part, interest_part, balance))
+    return schedule
+
+
+def build_schedule(principal, annual_rate, start, end, frequency='MONTHLY', method='REDUCING'):
+    """
+    Compute a loan's installments.
+
+    Args:
+        principal: Loan amount
+        annual_rate: Yearly interest rate in percent
+        start: Disbursement/start date (date or datetime)
+        end: Final due date (date or datetime)
+        frequency: 'MONTHLY' or 'WEEKLY'
+        method: 'REDUCING' or 'FLAT'
+
+    Returns:
+        list[Installment]
+    """
+    principal = _cents(Decimal(str(principal)))
+    if principal <= 0:
+        raise ValueError("Loan amount must be positive")
+
+    dates = due_dates(start, end, frequency)
+    period_rate = Decimal(str(annual_rate)) / 100 / PERIODS_PER_YEAR[frequency]
+
+    if method == 'REDUCING':
+        return _reducing(principal, period_rate, dates)
+    if method == 'FLAT':
+        return _flat(principal, period_rate, dates)
+    raise ValueError(f"Unsupported interest method: {method}")
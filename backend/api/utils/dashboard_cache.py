@@ -0,0 +1,116 @@
+"""
+Per-user cache for the member dashboard payload
+
+Payloads are stored with Django's cache framework in a backend shared by
+every process (file, Redis, memcached); settings turn the cache off under a
+per-process backend, where an invalidation from the job worker would never
+reach the web workers. Entries are dropped when the data behind them
+changes: deposit completion, loan approval and profile updates call
+invalidate_dashboard(), and api.signals calls it for payment, share and
+repayment schedule writes. Hit/miss counters are kept in the same cache so they
+are shared by every worker using a shared backend.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'dashboard:v1'
+STATS_KEYS = ('hits', 'misses', 'invalidations')
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _enabled():
+    return getattr(settings, 'DASHBOARD_CACHE_ENABLED', True)
+
+
+def _payload_key(user_id):
+    return f'{KEY_PREFIX}:user:{user_id}'
+
+
+def _stats_key(name):
+    return f'{KEY_PREFIX}:stats:{name}'
+
+
+def _count(name):
+    cache = _cache()
+    key = _stats_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter missing or evicted; add() avoids clobbering a concurrent writer
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_dashboard_payload(user, builder):
+    """
+    Return the cached dashboard payload for a user, building it on a miss.
+
+    Args:
+        user: The authenticated CustomUser
+        builder: Callable returning the payload dict when it is not cached
+
+    Returns:
+        dict: Dashboard payload
+    """
+    if not _enabled():
+        return builder()
+
+    cache = _cache()
+    key = _payload_key(user.pk)
+    payload = cache.get(key)
+
+    if payload is not None:
+        _count('hits')
+        return payload
+
+    _count('misses')
+    payload = builder()
+    cache.set(key, payload, timeout=getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60))
+    return payload
+
+
+def invalidate_dashboard(user_id):
+    """
+    Drop a user's cached dashboard once the current transaction commits.
+
+    Deferring to on_commit stops a concurrent request from re-caching the
+    pre-commit state. Outside a transaction the entry is dropped immediately.
+    """
+    if not _enabled() or user_id is None:
+        return
+
+    def _drop():
+        _cache().delete(_payload_key(user_id))
+        _count('invalidations')
+        logger.debug(f"Dashboard cache invalidated for user {user_id}")
+
+    transaction.on_commit(_drop)
+
+
+def get_cache_stats():
+    """
+    Return hit/miss/invalidation counters and the hit rate.
+
+    Returns:
+        dict: Counter values plus 'hit_rate' as a percentage
+    """
+    values = _cache().get_many([_stats_key(name) for name in STATS_KEYS])
+    stats = {name: values.get(_stats_key(name), 0) for name in STATS_KEYS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0.0
+    stats['enabled'] = _enabled()
+    stats['timeout'] = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60)
+    return stats
+
+
+def reset_cache_stats():
+    """Reset the shared counters"""
+    _cache().delete_many([_stats_key(name) for name in STATS_KEYS])
@@ -0,0 +1,139 @@
+"""
+Precompiled email templates
+
+Every outgoing email (password reset, OTP, deposit confirmation, broadcast)
+lives under api/templates/emails/<name>/ as subject.txt, body.txt and an
+optional body.html. load() (called from ApiConfig.ready) compiles all of them
+once per process with Django's cached loader, so sending an email only
+renders an already parsed template.
+
+Translations sit in api/templates/emails/<language>/<name>/ and are picked
+by CustomUser.language ('en', 'sw', 'lg'); any part without a translation
+falls back to the English one. Subject and text parts are rendered without
+autoescaping, HTML parts with it.
+
+Usage:
+    from api.utils import email_templates
+    subject, text, html = email_templates.render('otp', {'otp': '123456', 'purpose': 'login'}, language='sw')
+"""
+from collections import namedtuple
+from pathlib import Path
+from django.template import Context, Engine
+from django.utils import timezone, translation
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / 'templates' / 'emails'
+DEFAULT_LANGUAGE = 'en'
+PARTS = ('subject.txt', 'body.txt', 'body.html')
+
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'text', 'html'])
+
+
+# A private engine so email templates (and base.html, which they extend) are
+# parsed once and never collide with the site's own template directories
+_engine = Engine(
+    dirs=[str(TEMPLATE_DIR)],
+    loaders=[('django.template.loaders.cached.Loader', ['django.template.loaders.filesystem.Loader'])],
+)
+
+# (name, language) -> (subject, text, html) compiled Template objects
+_registry = {}
+_lock = threading.Lock()
+
+
+def template_names():
+    """Email names: directories holding a subject.txt"""
+    return sorted(path.parent.name for path in TEMPLATE_DIR.glob('*/subject.txt'))
+
+
+def languages():
+    """Translated languages: directories holding other email directories"""
+    return sorted(
+        path.name for path in TEMPLATE_DIR.iterdir()
+        if path.is_dir() and not (path / 'subject.txt').exists()
+    )
+
+
+def _compile(name, language):
+    compiled = []
+    for part in PARTS:
+        candidates = [f'{name}/{part}']
+        if language != DEFAULT_LANGUAGE:
+            candidates.insert(0, f'{language}/{name}/{part}')
+        for candidate in candidates:
+            if (TEMPLATE_DIR / candidate).exists():
+                compiled.append(_engine.get_template(candidate))
+                break
+        else:
+            if part == 'body.html':
+                compiled.append(None)
+            else:
+                raise FileNotFoundError(f"Email template '{name}' has no {part}")
+    return tuple(compiled)
+
+
+def load():
+    """
+    Compile every template in every language.
+
+    Returns:
+        int: Number of (template, language) entries registered
+    """
+    registry = {}
+    for name in template_names():
+        for language in [DEFAULT_LANGUAGE, *languages()]:
+            registry[(name, language)] = _compile(name, language)
+
+    with _lock:
+        _registry.clear()
+        _registry.update(registry)
+    logger.debug(f"Compiled {len(registry)} email templates")
+    return len(registry)
+
+
+def _templates(name, language):
+    if not _registry:
+        load()
+    language = (language or DEFAULT_LANGUAGE).lower()
+    if (name, language) not in _registry:
+        language = DEFAULT_LANGUAGE
+    if (name, language) not in _registry:
+        raise KeyError(f"Unknown email template: {name}")
+    return language, _registry[(name, language)]
+
+
+def render(name, context, language=None):
+    """
+    Render an email in the recipient's language.
+
+    Args:
+        name: Template name ('password_reset', 'otp', 'deposit_confirmation', 'broadcast')
+        context: Template variables; 'year' is added when missing
+        language: CustomUser.language, falls back to English
+
+    Returns:
+        RenderedEmail: subject (one line), text, html (None without body.html)
+    """
+    language, (subject, text, html) = _templates(name, language)
+    context = Context({'year': timezone.now().year, **context}, autoescape=False)
+
+    with translation.override(language):
+        rendered_subject = ' '.join(subject.render(context).split())
+        rendered_text = text.render(context).strip() + '\n'
+        rendered_html = None
+        if html is not None:
+            context.autoescape = True
+            rendered_html = html.render(context)
+    return RenderedEmail(rendered_subject, rendered_text, rendered_html)
+
+
+def message(name, to, context, language=None):
+    """A send_emails job payload ({'to', 'subject', 'text', 'html'}) for one recipient"""
+    subject, text, html = render(name, context, language)
+    payload = {'to': to, 'subject': subject, 'text': text}
+    if html is not None:
+        payload['html'] = html
+    return payload
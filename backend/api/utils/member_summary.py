@@ -0,0 +1,244 @@
+"""
+Precomputed member dashboard summaries
+
+Every write to Account, Deposit, Loan, Payment or ShareTransaction applies a
+delta to the owning member's MemberSummary row inside the same transaction
+(see api/signals.py). The dashboard then reads a single row by primary key.
+The rolling 30-day deposit window and the year-to-date dividends cannot be
+maintained by deltas alone, so a summary is rebuilt when it is first read on
+a new day.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Sum, Count
+from django.utils import timezone
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_LOAN_STATUSES = ('APPROVED', 'DISBURSED')
+DEPOSIT_WINDOW_DAYS = 30
+REBUILD_BATCH_SIZE = 2000
+
+ZERO = Decimal('0.00')
+
+
+def _window_start():
+    return timezone.now() - timedelta(days=DEPOSIT_WINDOW_DAYS)
+
+
+def _account_deltas(state):
+    return {'total_savings': Decimal(str(state.get('balance') or 0))}
+
+
+def _deposit_deltas(state):
+    created_at = state.get('created_at') or timezone.now()
+    if state.get('status') == 'COMPLETED' and created_at >= _window_start():
+        return {'deposits_30d': Decimal(str(state.get('amount') or 0))}
+    return {}
+
+
+def _loan_deltas(state):
+    if state.get('loan_status') in ACTIVE_LOAN_STATUSES:
+        return {
+            'active_loans_count': 1,
+            'active_loans_amount': Decimal(str(state.get('amount') or 0)),
+        }
+    return {}
+
+
+def _payment_deltas(state):
+    if state.get('payment_status') == 'COMPLETED':
+        return {'total_repayments': Decimal(str(state.get('amount') or 0))}
+    return {}
+
+
+def _share_deltas(state):
+    timestamp = state.get('timestamp') or timezone.now()
+    if state.get('transaction_type') == 'DIVIDEND' and timestamp.year == timezone.now().year:
+        return {'dividends_ytd': Decimal(str(state.get('amount') or 0))}
+    return {}
+
+
+# model name -> (owner attribute, tracked attributes, delta function)
+TRACKED_MODELS = {
+    'Account': ('user_id', ('user_id', 'balance'), _account_deltas),
+    'Deposit': ('user_id', ('user_id', 'amount', 'status', 'created_at'), _deposit_deltas),
+    'Loan': ('borrower_id', ('borrower_id', 'amount', 'loan_status'), _loan_deltas),
+    'Payment': ('borrower_id', ('borrower_id', 'amount', 'payment_status'), _payment_deltas),
+    'ShareTransaction': ('user_id', ('user_id', 'amount', 'transaction_type', 'timestamp'), _share_deltas),
+}
+
+
+def snapshot(instance):
+    """
+    Capture the tracked field values of a model instance.
+
+    Reads straight from the instance __dict__ so deferred fields never
+    trigger a query while rows are being loaded.
+    """
+    attrs = TRACKED_MODELS[type(instance).__name__][1]
+    return {attr: instance.__dict__.get(attr) for attr in attrs}
+
+
+def _resolve_user_id(model_name, owner_id):
+    if owner_id is None:
+        return None
+    owner_attr = TRACKED_MODELS[model_name][0]
+    if owner_attr == 'borrower_id':
+        from ..models import Borrower
+        return Borrower.objects.filter(pk=owner_id).values_list('user_id', flat=True).first()
+    return owner_id
+
+
+def apply_change(model_name, old_state, new_state):
+    """
+    Apply the difference between two snapshots to the affected summaries.
+
+    Args:
+        model_name: Name of the tracked model ('Account', 'Loan', ...)
+        old_state: Snapshot before the write, or None for inserts
+        new_state: Snapshot after the write, or None for deletes
+    """
+    owner_attr, _, delta_fn = TRACKED_MODELS[model_name]
+    changes = {}
+
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if not state:
+            continue
+        deltas = delta_fn(state)
+        if not deltas:
+            continue
+        owner = changes.setdefault(state.get(owner_attr), {})
+        for field, value in deltas.items():
+            owner[field] = owner.get(field, 0) + sign * value
+
+    for owner_id, deltas in changes.items():
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            continue
+        user_id = _resolve_user_id(model_name, owner_id)
+        if user_id is not None:
+            apply_deltas(user_id, **deltas)
+
+
+def apply_deltas(user_id, **deltas):
+    """
+    Add deltas to a member's summary with a single UPDATE.
+
+    Members without a summary row are skipped; theirs is built in full on
+    first read.
+    """
+    from ..models import MemberSummary
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    MemberSummary.objects.filter(user_id=user_id).update(**updates)
+
+
+def _grouped(queryset, group_field, user_ids, **aggregates):
+    if user_ids is not None:
+        queryset = queryset.filter(**{f'{group_field}__in': user_ids})
+    return {
+        row.pop(group_field): row
+        for row in queryset.values(group_field).annotate(**aggregates).order_by()
+    }
+
+
+def _build_summaries(user_ids=None):
+    """Compute summaries with one grouped aggregate query per metric"""
+    from ..models import (
+        CustomUser, MemberSummary, Account, Deposit, Loan, Payment, ShareTransaction
+    )
+
+    today = timezone.localdate()
+
+    savings = _grouped(Account.objects.all(), 'user_id', user_ids, total=Sum('balance'))
+    loans = _grouped(
+        Loan.objects.filter(loan_status__in=ACTIVE_LOAN_STATUSES),
+        'borrower__user_id', user_ids, count=Count('id'), total=Sum('amount')
+    )
+    repayments = _grouped(
+        Payment.objects.filter(payment_status='COMPLETED'),
+        'borrower__user_id', user_ids, total=Sum('amount')
+    )
+    dividends = _grouped(
+        ShareTransaction.objects.filter(transaction_type='DIVIDEND', timestamp__year=today.year),
+        'user_id', user_ids, total=Sum('amount')
+    )
+    deposits = _grouped(
+        Deposit.objects.filter(status='COMPLETED', created_at__gte=_window_start()),
+        'user_id', user_ids, total=Sum('amount')
+    )
+
+    if user_ids is None:
+        user_ids = list(CustomUser.objects.values_list('id', flat=True).order_by('id'))
+
+    for user_id in user_ids:
+        loan_row = loans.get(user_id, {})
+        yield MemberSummary(
+            user_id=user_id,
+            total_savings=savings.get(user_id, {}).get('total') or ZERO,
+            active_loans_count=loan_row.get('count') or 0,
+            active_loans_amount=loan_row.get('total') or ZERO,
+            total_repayments=repayments.get(user_id, {}).get('total') or ZERO,
+            dividends_ytd=dividends.get(user_id, {}).get('total') or ZERO,
+            dividends_year=today.year,
+            deposits_30d=deposits.get(user_id, {}).get('total') or ZERO,
+            window_date=today,
+            updated_at=timezone.now(),
+        )
+
+
+def rebuild_summaries(user_ids=None):
+    """
+    Recompute summaries from the source tables and upsert them.
+
+    Args:
+        user_ids: Iterable of user IDs to rebuild, or None for every member
+
+    Returns:
+        int: Number of summaries written
+    """
+    from ..models import MemberSummary
+
+    if user_ids is not None:
+        user_ids = list(user_ids)
+
+    fields = [
+        'total_savings', 'active_loans_count', 'active_loans_amount', 'total_repayments',
+        'dividends_ytd', 'dividends_year', 'deposits_30d', 'window_date', 'updated_at'
+    ]
+    written = 0
+    batch = []
+
+    for summary in _build_summaries(user_ids):
+        batch.append(summary)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            MemberSummary.objects.bulk_create(batch, update_conflicts=True, unique_fields=['user'], update_fields=fields)
+            written += len(batch)
+            batch = []
+
+    if batch:
+        MemberSummary.objects.bulk_create(batch, update_conflicts=True, unique_fields=['user'], update_fields=fields)
+        written += len(batch)
+
+    return written
+
+
+def get_member_summary(user):
+    """
+    Return the member's summary, rebuilding it if it is missing or its
+    rolling window is from a previous day.
+    """
+    from ..models import MemberSummary
+
+    today = timezone.localdate()
+    summary = MemberSummary.objects.filter(user_id=user.pk).first()
+
+    if summary is None or summary.window_date != today or summary.dividends_year != today.year:
+        logger.debug(f"Rebuilding member summary for user {user.pk}")
+        rebuild_summaries([user.pk])
+        summary = MemberSummary.objects.get(user_id=user.pk)
+
+    return summary
@@ -0,0 +1,443 @@
+"""
+Prometheus text-format metrics without an external client library
+
+Counters, gauges and histograms are kept in process memory and rendered in
+the Prometheus exposition format at /metrics. Under gunicorn every worker is
+its own process, so when METRICS_MULTIPROC_DIR is set each process also
+writes a snapshot of its values to `<dir>/<pid>.json` (at most every
+METRICS_FLUSH_INTERVAL seconds, and on exit); the worker that serves the
+scrape sums every snapshot. Counters and histograms of exited workers are
+kept so totals never go backwards: the scrape folds them into
+`<dir>/archive.json` and deletes the dead worker's snapshot, so recycled
+workers (gunicorn max_requests) do not pile up files. Gauges only count
+live processes. Empty the directory when the service (re)starts.
+
+All metrics are declared at the bottom of this module so every process
+renders the same families.
+
+Usage:
+    from api.utils import metrics
+    metrics.DEPOSIT_TRANSITIONS.inc(source='PENDING', target='COMPLETED')
+    with metrics.EMAIL_SEND_SECONDS.time(transport='smtp'):
+        ...
+"""
+from contextlib import contextmanager
+from django.conf import settings
+import atexit
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: snapshots are summed but never archived
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = 'archive.lock'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.RLock()
+_families = {}
+_values = {}
+_last_flush = [0.0]
+
+
+def _key(name, labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Metric {name} expects labels {labelnames}, got {sorted(labels)}")
+    return (name, tuple(str(labels[label]) for label in labelnames))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _families[name] = self
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _key(self.name, self.labelnames, labels)
+        with _lock:
+            _values[key] = _values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge summed over live processes"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = _key(self.name, self.labelnames, labels)
+        with _lock:
+            _values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = _key(self.name, self.labelnames, labels)
+        with _lock:
+            _values[key] = _values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _key(self.name, self.labelnames, labels)
+        with _lock:
+            # Per-bucket (non-cumulative) counts, then +Inf, then sum
+            state = _values.get(key)
+            if state is None:
+                state = _values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block; an `outcome` label is filled in if declared"""
+        started = time.perf_counter()
+        outcome = 'success'
+        try:
+            yield
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            if 'outcome' in self.labelnames and 'outcome' not in labels:
+                labels['outcome'] = outcome
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def _snapshot():
+    with _lock:
+        return [
+            [name, list(labels), list(value) if isinstance(value, list) else value]
+            for (name, labels), value in _values.items()
+        ]
+
+
+def _multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', '')
+
+
+def _write_json(directory, filename, data):
+    """Atomically replace `<directory>/<filename>`"""
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as handle:
+        json.dump(data, handle)
+    os.replace(tmp_path, os.path.join(directory, filename))
+
+
+def _read_json(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def flush(force=True):
+    """Write this process's values for other workers to aggregate"""
+    directory = _multiproc_dir()
+    if not directory:
+        return
+
+    now = time.monotonic()
+    if not force and now - _last_flush[0] < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        return
+    _last_flush[0] = now
+
+    try:
+        _write_json(directory, f'{os.getpid()}.json', {'pid': os.getpid(), 'values': _snapshot()})
+    except OSError as e:
+        logger.warning(f"Could not write metrics snapshot: {e}")
+
+
+def maybe_flush():
+    """Flush if METRICS_FLUSH_INTERVAL has passed since the last write"""
+    flush(force=False)
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(totals, name, labels, value, include_gauges):
+    family = _families.get(name)
+    if family is None or (family.kind == 'gauge' and not include_gauges):
+        return
+    key = (name, tuple(labels))
+    current = totals.get(key)
+    if isinstance(value, list):
+        if current is None or len(current) != len(value):
+            totals[key] = list(value)
+        else:
+            totals[key] = [a + b for a, b in zip(current, value)]
+    else:
+        totals[key] = (current or 0) + value
+
+
+def _snapshot_paths(directory):
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json') and entry.name[:-5].isdigit():
+            yield entry.path
+
+
+@contextmanager
+def _archive_lock(directory):
+    with open(os.path.join(directory, LOCK_FILE), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _archive_dead(directory):
+    """
+    Fold snapshots of exited processes into the archive and delete them.
+
+    Returns:
+        list: Archived [name, labels, value] entries
+    """
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    if fcntl is None:
+        return (_read_json(archive_path) or {}).get('values', [])
+
+    with _archive_lock(directory):
+        archived = (_read_json(archive_path) or {}).get('values', [])
+        dead = []
+        for path in _snapshot_paths(directory):
+            data = _read_json(path)
+            if data is not None and not _pid_alive(data.get('pid', 0)):
+                dead.append((path, data))
+        if not dead:
+            return archived
+
+        totals = {}
+        for name, labels, value in archived:
+            _merge(totals, name, labels, value, include_gauges=False)
+        for _, data in dead:
+            for name, labels, value in data.get('values', []):
+                _merge(totals, name, labels, value, include_gauges=False)
+
+        archived = [[name, list(labels), value] for (name, labels), value in totals.items()]
+        try:
+            _write_json(directory, ARCHIVE_FILE, {'values': archived})
+            for path, _ in dead:
+                os.unlink(path)
+        except OSError as e:
+            logger.warning(f"Could not archive metrics snapshots: {e}")
+        return archived
+
+
+def collect():
+    """
+    Current values across all processes.
+
+    Returns:
+        dict: (name, label values) -> number, or per-bucket list for histograms
+    """
+    directory = _multiproc_dir()
+    if not directory:
+        with _lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+
+    flush()
+    totals = {}
+    for name, labels, value in _archive_dead(directory):
+        _merge(totals, name, labels, value, include_gauges=False)
+    for path in _snapshot_paths(directory):
+        data = _read_json(path)
+        if data is None:
+            continue
+        include_gauges = _pid_alive(data.get('pid', 0))
+        for name, labels, value in data.get('values', []):
+            _merge(totals, name, labels, value, include_gauges)
+    return totals
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    totals = collect()
+    by_family = {}
+    for (name, labels), value in totals.items():
+        by_family.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, family in sorted(_families.items()):
+        lines.append(f'# HELP {name} {family.documentation}')
+        lines.append(f'# TYPE {name} {family.kind}')
+
+        for labels, value in sorted(by_family.get(name, [])):
+            if family.kind != 'histogram':
+                lines.append(f'{name}{_format_labels(family.labelnames, labels)} {_format_value(value)}')
+                continue
+
+            cumulative = 0
+            bounds = [_format_value(float(bound)) for bound in family.buckets] + ['+Inf']
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                le = _format_labels(family.labelnames, labels, ('le', bound))
+                lines.append(f'{name}_bucket{le} {cumulative}')
+            plain = _format_labels(family.labelnames, labels)
+            lines.append(f'{name}_sum{plain} {_format_value(float(value[-1]))}')
+            lines.append(f'{name}_count{plain} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Forget this process's values (tests)"""
+    with _lock:
+        _values.clear()
+
+
+atexit.register(flush)
+
+
+# ---------------------------------------------------------------------------
+# Metric catalogue
+# ---------------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'somasave_http_request_duration_seconds',
+    'Request latency by route (URL name) and method.',
+    ('route', 'method'),
+)
+HTTP_REQUESTS = Counter(
+    'somasave_http_requests_total',
+    'Requests by route, method and status code.',
+    ('route', 'method', 'status'),
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    'somasave_http_request_db_queries',
+    'Database queries run per request, by route.',
+    ('route',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+DB_QUERIES = Counter(
+    'somasave_db_queries_total',
+    'Database queries run while serving requests, by route.',
+    ('route',),
+)
+WORKER_REQUESTS_IN_PROGRESS = Gauge(
+    'somasave_worker_requests_in_progress',
+    'Requests currently being served, summed over live worker processes.',
+)
+WORKER_BUSY_SECONDS = Counter(
+    'somasave_worker_busy_seconds_total',
+    'Seconds worker processes spent serving requests; rate() over the worker count gives saturation.',
+)
+WORKER_PROCESSES = Gauge(
+    'somasave_worker_processes',
+    'Live processes that have served a request.',
+)
+WEBHOOK_SECONDS = Histogram(
+    'somasave_webhook_duration_seconds',
+    'Relworx webhook acknowledgement time by result.',
+    ('result',),
+)
+WEBHOOK_EVENTS = Counter(
+    'somasave_webhook_events_total',
+    'Webhook inbox events by outcome (processed, ignored, failed, duplicate delivery).',
+    ('result',),
+)
+WEBHOOK_PROCESSING_LAG = Histogram(
+    'somasave_webhook_processing_lag_seconds',
+    'Time from webhook receipt to its effects being applied.',
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
+DEPOSIT_TRANSITIONS = Counter(
+    'somasave_deposit_transitions_total',
+    'Deposit state changes.',
+    ('source', 'target'),
+)
+DEPOSIT_VERIFICATIONS = Counter(
+    'somasave_deposit_verifications_total',
+    'Member deposit verification polls, by whether Relworx was asked.',
+    ('mode',),
+)
+LOAN_SWEEP_CHANGES = Counter(
+    'somasave_loan_sweep_changes_total',
+    'Rows changed by sweep_loans (installments paid or overdue, loans completed).',
+    ('change',),
+)
+PUSH_DELIVERIES = Counter(
+    'somasave_push_deliveries_total',
+    'Web push delivery attempts by result (sent, failed, expired).',
+    ('result',),
+)
+EMAIL_SEND_SECONDS = Histogram(
+    'somasave_email_send_duration_seconds',
+    'Email delivery latency per SMTP message / Resend batch by transport and outcome (success, error, rejected).',
+    ('transport', 'outcome'),
+)
+EMAIL_CONNECTIONS = Counter(
+    'somasave_email_connections_total',
+    'SMTP connections / Resend HTTP sessions opened by job workers (low means connections are reused).',
+    ('transport',),
+)
+PROFILE_IMAGE_UPLOADS = Counter(
+    'somasave_profile_image_uploads_total',
+    'Profile images uploaded to Cloudinary by the background job (ready, failed).',
+    ('outcome',),
+)
+AUTH_EVENTS = Counter(
+    'somasave_auth_events_total',
+    'Authentication events (login success/failure, session authentication).',
+    ('event', 'outcome'),
+)
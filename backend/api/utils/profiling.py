@@ -0,0 +1,295 @@
+"""
+Per-request profiling: wall time, SQL and outbound HTTP per view
+
+RequestProfilingMiddleware (enabled with PROFILING_ENABLED) times every
+request, counts its SQL queries through a connection execute wrapper and
+collects the time spent in third-party calls wrapped in external_call().
+Results are aggregated per resolved view name into in-process histograms,
+readable by staff at /api/profiling/stats/. Each worker process keeps its
+own numbers.
+
+With PROFILING_CPROFILE_TOP > 0, a sample of requests
+(PROFILING_CPROFILE_SAMPLE_RATE) also runs under cProfile and the slowest N
+are kept, and written to PROFILING_CPROFILE_DIR when set.
+
+Usage:
+    with external_call('relworx'):
+        response = session.post(...)
+"""
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+import cProfile
+import heapq
+import io
+import itertools
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_current = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """Measurements for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = {}
+        self.external = {}
+        # Push fan-out threads record outbound calls concurrently
+        self._external_lock = threading.Lock()
+
+    def record_query(self, sql, params, elapsed):
+        self.sql_count += 1
+        self.sql_time += elapsed
+        key = (sql, repr(params))
+        self.statements[key] = self.statements.get(key, 0) + 1
+
+    def record_external(self, service, elapsed):
+        with self._external_lock:
+            calls, seconds = self.external.get(service, (0, 0.0))
+            self.external[service] = (calls + 1, seconds + elapsed)
+
+    @property
+    def duplicate_queries(self):
+        """Queries that repeated an earlier statement with identical parameters"""
+        return sum(count - 1 for count in self.statements.values())
+
+    def repeated_statements(self, limit=5):
+        """Most repeated identical statements, for spotting N+1 patterns"""
+        repeated = [(count, sql) for (sql, _), count in self.statements.items() if count > 1]
+        return [{'sql': sql, 'count': count} for count, sql in heapq.nlargest(limit, repeated)]
+
+
+@contextmanager
+def external_call(service):
+    """Attribute the wrapped block's time to an outbound service on the current request"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record_external(service, time.perf_counter() - started)
+
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        for index, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        """Upper bucket bound containing the given fraction of observations"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= target:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else round(self.max, 2)
+        return round(self.max, 2)
+
+    def as_dict(self):
+        labels = [f'<={bound}ms' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms']
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 2),
+            'avg_ms': round(self.total / self.count, 2) if self.count else 0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max, 2),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class _ViewStats:
+    def __init__(self):
+        self.wall = _Histogram()
+        self.sql = _Histogram()
+        self.queries = 0
+        self.max_queries = 0
+        self.duplicates = 0
+        self.statuses = {}
+        self.external = {}
+        self.repeated = []
+
+    def add(self, profile, status_code):
+        self.wall.observe(profile.wall)
+        self.sql.observe(profile.sql_time)
+        self.queries += profile.sql_count
+        self.max_queries = max(self.max_queries, profile.sql_count)
+        self.duplicates += profile.duplicate_queries
+        self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+        for service, (calls, seconds) in profile.external.items():
+            histogram = self.external.setdefault(service, _Histogram())
+            histogram.observe(seconds)
+        if profile.duplicate_queries:
+            self.repeated = profile.repeated_statements()
+
+    def as_dict(self):
+        requests = self.wall.count
+        return {
+            'requests': requests,
+            'wall': self.wall.as_dict(),
+            'sql_time': self.sql.as_dict(),
+            'avg_queries': round(self.queries / requests, 2) if requests else 0,
+            'max_queries': self.max_queries,
+            'duplicate_queries': self.duplicates,
+            'last_repeated_statements': self.repeated,
+            'statuses': {str(code): count for code, count in sorted(self.statuses.items())},
+            'external': {service: histogram.as_dict() for service, histogram in sorted(self.external.items())},
+        }
+
+
+_lock = threading.Lock()
+_views = {}
+_slowest = []
+_tiebreak = itertools.count()
+
+
+def record(view_name, profile, status_code, profiler=None):
+    """Fold a finished request into the per-view aggregates"""
+    with _lock:
+        stats = _views.get(view_name)
+        if stats is None:
+            stats = _views[view_name] = _ViewStats()
+        stats.add(profile, status_code)
+
+        if profiler is None:
+            return
+        entry = (profile.wall, next(_tiebreak), view_name, profiler)
+        limit = getattr(settings, 'PROFILING_CPROFILE_TOP', 0)
+        if len(_slowest) < limit:
+            heapq.heappush(_slowest, entry)
+        elif _slowest and entry[0] > _slowest[0][0]:
+            heapq.heapreplace(_slowest, entry)
+        else:
+            return
+
+    _dump(view_name, profile.wall, profiler)
+
+
+def _dump(view_name, wall, profiler):
+    directory = getattr(settings, 'PROFILING_CPROFILE_DIR', '')
+    if not directory:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        filename = f"{view_name.replace(':', '_')}-{int(wall * 1000)}ms-{int(time.time())}.prof"
+        profiler.dump_stats(os.path.join(directory, filename))
+    except OSError as e:
+        logger.warning(f"Could not write cProfile output for {view_name}: {e}")
+
+
+def _format_profile(profiler, lines=25):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(lines)
+    return stream.getvalue()
+
+
+def get_stats(include_profiles=False):
+    """Snapshot of the per-view aggregates, slowest views first"""
+    with _lock:
+        views = {name: stats.as_dict() for name, stats in _views.items()}
+        slowest = sorted(_slowest, reverse=True)
+
+    result = {
+        'pid': os.getpid(),
+        # Views that cost the most wall time in total first
+        'views': dict(sorted(views.items(), key=lambda item: item[1]['wall']['total_ms'], reverse=True)),
+        'slowest_profiled': [
+            {'view': view_name, 'wall_ms': round(wall * 1000, 2)}
+            for wall, _, view_name, _ in slowest
+        ],
+    }
+    if include_profiles:
+        for entry, (_, _, _, profiler) in zip(result['slowest_profiled'], slowest):
+            entry['profile'] = _format_profile(profiler)
+    return result
+
+
+def reset_stats():
+    with _lock:
+        _views.clear()
+        _slowest.clear()
+
+
+def _should_cprofile():
+    if getattr(settings, 'PROFILING_CPROFILE_TOP', 0) <= 0:
+        return False
+    return random.random() < getattr(settings, 'PROFILING_CPROFILE_SAMPLE_RATE', 0.1)
+
+
+def view_name_for(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+@contextmanager
+def profile_request():
+    """
+    Profile the enclosed request handling.
+
+    Yields:
+        tuple: (RequestProfile, cProfile.Profile or None)
+    """
+    profile = RequestProfile()
+    token = _current.set(profile)
+
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            profile.record_query(sql, params, time.perf_counter() - started)
+
+    profiler = cProfile.Profile() if _should_cprofile() else None
+    try:
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(wrapper))
+            if profiler is not None:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Another profiler is already active on this thread
+                    profiler = None
+            try:
+                yield profile, profiler
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        profile.wall = time.perf_counter() - profile.started
+        _current.reset(token)
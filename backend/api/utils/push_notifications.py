@@ -1,13 +1,152 @@
 """
 Push notification utilities using pywebpush library
+
+Bulk sends go through PushFanout, which delivers to many endpoints
+concurrently over a shared HTTP connection pool. The payload is serialized
+once per broadcast and VAPID headers are signed once per push service
+rather than once per subscription.
 """
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass
+from urllib.parse import urlparse
 from pywebpush import webpush, WebPushException
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+import requests
+from .profiling import external_call
+from . import metrics
+import threading
 import json
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_ICON = '/icon-192x192.png'
+
+# Push services answer 404/410 for subscriptions that will never work again
+EXPIRED_STATUS_CODES = (404, 410)
+
+# Signed VAPID tokens are valid for 12 hours; re-sign well before that
+VAPID_TOKEN_LIFETIME = 12 * 60 * 60
+VAPID_REFRESH_MARGIN = 60 * 60
+
+_session = None
+_session_lock = threading.Lock()
+_vapid = None
+_vapid_headers = {}
+_vapid_lock = threading.Lock()
+
+
+def get_push_session():
+    """Return the process-wide requests session used for push delivery"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = getattr(settings, 'PUSH_FANOUT_WORKERS', 16)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _get_vapid():
+    # Parsed once per configured key; callers hold _vapid_lock
+    global _vapid
+    private_key = getattr(settings, 'VAPID_PRIVATE_KEY', None)
+    if _vapid is None or _vapid[0] != private_key:
+        from py_vapid import Vapid
+        _vapid = (private_key, Vapid.from_string(private_key=private_key))
+        _vapid_headers.clear()
+    return _vapid[1]
+
+
+def get_vapid_headers(endpoint):
+    """
+    Return signed VAPID headers for the push service behind an endpoint.
+    
+    Headers are cached per audience (scheme + host), so a broadcast signs one
+    token per push service instead of one per subscription.
+    """
+    parsed = urlparse(endpoint)
+    audience = f"{parsed.scheme}://{parsed.netloc}"
+    now = int(time.time())
+    
+    with _vapid_lock:
+        vapid = _get_vapid()
+        cached = _vapid_headers.get(audience)
+        if cached and cached[0] - VAPID_REFRESH_MARGIN > now:
+            return cached[1]
+        
+        expires = now + VAPID_TOKEN_LIFETIME
+        claims = {
+            'sub': f"mailto:{getattr(settings, 'VAPID_ADMIN_EMAIL', 'admin@somasave.com')}",
+            'aud': audience,
+            'exp': expires,
+        }
+        headers = vapid.sign(claims)
+        _vapid_headers[audience] = (expires, headers)
+        return headers
+
+
+def vapid_configured():
+    if not getattr(settings, 'VAPID_PRIVATE_KEY', None) or not getattr(settings, 'VAPID_PUBLIC_KEY', None):
+        logger.error("VAPID keys not configured in settings")
+        return False
+    return True
+
+
+def build_payload(title, body, icon=None, badge=None, url=None, data=None, timestamp=None):
+    """Serialize a notification payload to the JSON string sent to the browser"""
+    payload = {
+        'title': title,
+        'body': body,
+        'icon': icon or DEFAULT_ICON,
+        'badge': badge or DEFAULT_ICON,
+        'url': url or '/',
+        'timestamp': int((timestamp or time.time()) * 1000),
+    }
+    
+    if data:
+        payload['data'] = data
+    
+    return json.dumps(payload)
+
+
+def deliver(subscription, payload):
+    """
+    Encrypt and POST a serialized payload to one subscription.
+    
+    Raises:
+        WebPushException: If the push service rejects the message
+    """
+    subscription_info = {
+        'endpoint': subscription.endpoint,
+        'keys': {
+            'p256dh': subscription.p256dh_key,
+            'auth': subscription.auth_key
+        }
+    }
+    
+    with external_call('webpush'):
+        return webpush(
+            subscription_info=subscription_info,
+            data=payload,
+            headers=get_vapid_headers(subscription.endpoint),
+            timeout=getattr(settings, 'PUSH_TIMEOUT', 10),
+            ttl=getattr(settings, 'PUSH_TTL', 24 * 60 * 60),
+            requests_session=get_push_session()
+        )
+
+
+def _status_code(exc):
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
 
 def send_push_notification(subscription, title, body, icon=None, badge=None, url=None, data=None):
     """
@@ -26,66 +165,135 @@ def send_push_notification(subscription, title, body, icon=None, badge=None, url
         bool: True if successful, False otherwise
     """
     try:
-        # Prepare notification payload
-        payload = {
-            'title': title,
-            'body': body,
-            'icon': icon or '/icon-192x192.png',
-            'badge': badge or '/icon-192x192.png',
-            'url': url or '/',
-            'timestamp': int(subscription.created_at.timestamp() * 1000),
-        }
-        
-        if data:
-            payload['data'] = data
-        
-        # Get VAPID keys from settings
-        vapid_private_key = getattr(settings, 'VAPID_PRIVATE_KEY', None)
-        vapid_public_key = getattr(settings, 'VAPID_PUBLIC_KEY', None)
-        vapid_claims = {
-            "sub": f"mailto:{getattr(settings, 'VAPID_ADMIN_EMAIL', 'admin@somasave.com')}"
-        }
-        
-        if not vapid_private_key or not vapid_public_key:
-            logger.error("VAPID keys not configured in settings")
+        if not vapid_configured():
             return False
         
-        # Prepare subscription info
-        subscription_info = {
-            'endpoint': subscription.endpoint,
-            'keys': {
-                'p256dh': subscription.p256dh_key,
-                'auth': subscription.auth_key
-            }
-        }
-        
-        # Send the notification
-        response = webpush(
-            subscription_info=subscription_info,
-            data=json.dumps(payload),
-            vapid_private_key=vapid_private_key,
-            vapid_claims=vapid_claims
-        )
+        deliver(subscription, build_payload(title, body, icon, badge, url, data))
+        metrics.PUSH_DELIVERIES.inc(result='sent')
         
         logger.info(f"Push notification sent successfully to subscription {subscription.id}")
         return True
     
     except WebPushException as e:
         logger.error(f"WebPush error for subscription {subscription.id}: {e}")
+        expired = _status_code(e) in EXPIRED_STATUS_CODES
+        metrics.PUSH_DELIVERIES.inc(result='expired' if expired else 'failed')
         
         # If subscription is invalid (410 Gone), mark as inactive
-        if e.response and e.response.status_code == 410:
+        if expired:
             subscription.is_active = False
-            subscription.save()
-            logger.info(f"Marked subscription {subscription.id} as inactive (410 Gone)")
+            subscription.save(update_fields=['is_active'])
+            logger.info(f"Marked subscription {subscription.id} as inactive ({_status_code(e)})")
         
         return False
     
     except Exception as e:
+        metrics.PUSH_DELIVERIES.inc(result='failed')
         logger.error(f"Failed to send push notification: {str(e)}", exc_info=True)
         return False
 
 
+@dataclass
+class PushResult:
+    """Outcome of delivering one notification to one subscription"""
+    subscription_id: int
+    user_id: int
+    success: bool
+    status_code: int = None
+    expired: bool = False
+    error: str = ''
+    
+    def as_dict(self):
+        return {
+            'subscription_id': self.subscription_id,
+            'user_id': self.user_id,
+            'success': self.success,
+            'status_code': self.status_code,
+            'expired': self.expired,
+            'error': self.error,
+        }
+
+
+class PushFanout:
+    """
+    Deliver one notification to many subscriptions concurrently.
+    
+    Delivery is network bound, so a bounded thread pool shares one pooled
+    requests session. Worker threads never touch the database; expired
+    subscriptions are deactivated with a single UPDATE once the batch is done.
+    """
+    
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or getattr(settings, 'PUSH_FANOUT_WORKERS', 16)
+    
+    def _deliver_one(self, subscription, payload):
+        try:
+            response = deliver(subscription, payload)
+            return PushResult(
+                subscription.id, subscription.user_id, True,
+                status_code=getattr(response, 'status_code', None)
+            )
+        except WebPushException as e:
+            status_code = _status_code(e)
+            logger.warning(f"WebPush error for subscription {subscription.id}: {e}")
+            return PushResult(
+                subscription.id, subscription.user_id, False,
+                status_code=status_code,
+                expired=status_code in EXPIRED_STATUS_CODES,
+                error=str(e)
+            )
+        except Exception as e:
+            logger.error(f"Error sending to subscription {subscription.id}: {str(e)}")
+            return PushResult(subscription.id, subscription.user_id, False, error=str(e))
+    
+    def send(self, subscriptions, title, body, icon=None, badge=None, url=None, data=None):
+        """
+        Deliver a notification to every subscription.
+        
+        Args:
+            subscriptions: Iterable of PushSubscription instances
+        
+        Returns:
+            list[PushResult]: One result per subscription, in input order
+        """
+        from ..models import PushSubscription
+        
+        subscriptions = list(subscriptions)
+        if not subscriptions:
+            return []
+        
+        if not vapid_configured():
+            return [
+                PushResult(sub.id, sub.user_id, False, error='VAPID keys not configured')
+                for sub in subscriptions
+            ]
+        
+        payload = build_payload(title, body, icon, badge, url, data)
+        workers = min(self.max_workers, len(subscriptions))
+        
+        if workers <= 1:
+            results = [self._deliver_one(sub, payload) for sub in subscriptions]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='push-fanout') as pool:
+                # Each delivery runs in a copy of the caller's context so deliver()
+                # attributes its webpush time to the current request profile
+                futures = [
+                    pool.submit(copy_context().run, self._deliver_one, sub, payload)
+                    for sub in subscriptions
+                ]
+                results = [future.result() for future in futures]
+        
+        for result in results:
+            metrics.PUSH_DELIVERIES.inc(result='sent' if result.success else 'expired' if result.expired else 'failed')
+        
+        expired_ids = [result.subscription_id for result in results if result.expired]
+        if expired_ids:
+            PushSubscription.objects.filter(pk__in=expired_ids).update(is_active=False)
+            logger.info(f"Marked {len(expired_ids)} expired subscriptions as inactive")
+        
+        return results
+
+
 def generate_vapid_keys():
     """
     Generate VAPID keys for web push notifications
@@ -110,67 +318,89 @@ def generate_vapid_keys():
     }
 
 
-def send_bulk_notification(users, title, body, icon=None, badge=None, url=None):
+def send_bulk_notification(users, title, body, icon=None, badge=None, url=None, data=None):
     """
     Send push notification to multiple users
     
+    Subscriptions are loaded in one joined query, notification records are
+    bulk-created, and delivery runs on a bounded thread pool (see PushFanout).
+    
     Args:
-        users: QuerySet or list of CustomUser instances
+        users: QuerySet or list of CustomUser instances (or IDs)
         title: Notification title
         body: Notification body text
         icon: URL to notification icon
         badge: URL to notification badge
         url: URL to open when notification is clicked
+        data: Additional data to send with notification
     
     Returns:
-        dict: Statistics about sent notifications
+        dict: Statistics about sent notifications, plus per-endpoint 'results'
     """
     from ..models import PushSubscription, PushNotification
+    from django.db.models import QuerySet
     from django.utils import timezone
     
-    total = 0
-    sent = 0
-    failed = 0
+    if isinstance(users, QuerySet):
+        user_filter = {'user__in': users.values('pk')}
+    else:
+        user_filter = {'user_id__in': [getattr(user, 'pk', user) for user in users]}
     
-    for user in users:
-        subscriptions = PushSubscription.objects.filter(user=user, is_active=True)
-        
-        if subscriptions.exists():
-            # Create notification record for this user
-            notification = PushNotification.objects.create(
-                user=user,
+    subscriptions = (
+        PushSubscription.objects
+        .filter(is_active=True, **user_filter)
+        .only('id', 'user_id', 'endpoint', 'p256dh_key', 'auth_key')
+        .order_by('user_id', 'id')
+    )
+    
+    fanout = PushFanout()
+    stats = {'total': 0, 'sent': 0, 'failed': 0, 'expired': 0, 'results': []}
+    chunk_size = getattr(settings, 'PUSH_FANOUT_CHUNK_SIZE', 1000)
+    chunk = []
+    
+    def flush(chunk):
+        # One notification record per user in this chunk
+        user_ids = list(dict.fromkeys(sub.user_id for sub in chunk))
+        notifications = PushNotification.objects.bulk_create([
+            PushNotification(
+                user_id=user_id,
                 title=title,
                 body=body,
-                icon=icon or '/icon-192x192.png',
-                badge=badge or '/icon-192x192.png',
+                icon=icon or DEFAULT_ICON,
+                badge=badge or DEFAULT_ICON,
                 url=url or '/',
                 status='PENDING'
-            )
-            
-            # Try to send to all subscriptions for this user
-            user_sent = False
-            for subscription in subscriptions:
-                total += 1
-                try:
-                    if send_push_notification(subscription, title, body, icon, badge, url):
-                        sent += 1
-                        user_sent = True
-                    else:
-                        failed += 1
-                except Exception as e:
-                    logger.error(f"Error sending to subscription {subscription.id}: {str(e)}")
-                    failed += 1
-            
-            # Update notification status
-            if user_sent:
-                notification.status = 'SENT'
-                notification.sent_at = timezone.now()
-            else:
-                notification.status = 'FAILED'
-            notification.save()
+            ) for user_id in user_ids
+        ])
+        
+        results = fanout.send(chunk, title, body, icon=icon, badge=badge, url=url, data=data)
+        
+        delivered_users = {result.user_id for result in results if result.success}
+        sent_ids = [n.pk for n in notifications if n.user_id in delivered_users]
+        failed_ids = [n.pk for n in notifications if n.user_id not in delivered_users]
+        
+        if sent_ids:
+            PushNotification.objects.filter(pk__in=sent_ids).update(status='SENT', sent_at=timezone.now())
+        if failed_ids:
+            PushNotification.objects.filter(pk__in=failed_ids).update(status='FAILED')
+        
+        stats['total'] += len(results)
+        stats['sent'] += sum(1 for result in results if result.success)
+        stats['failed'] += sum(1 for result in results if not result.success)
+        stats['expired'] += sum(1 for result in results if result.expired)
+        stats['results'].extend(result.as_dict() for result in results)
     
-    return {
-        'total': total,
-        'sent': sent,
-        'failed': failed
-    }
+    for subscription in subscriptions.iterator(chunk_size=chunk_size):
+        # Chunks end between users so each user gets a single notification record
+        if len(chunk) >= chunk_size and subscription.user_id != chunk[-1].user_id:
+            flush(chunk)
+            chunk = []
+        chunk.append(subscription)
+    if chunk:
+        flush(chunk)
+    
+    logger.info(
+        f"Bulk notification delivered: {stats['sent']} sent, {stats['failed']} failed "
+        f"({stats['expired']} expired) of {stats['total']}"
+    )
+    return stats
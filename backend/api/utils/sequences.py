@@ -0,0 +1,91 @@
+"""
+Gap-tolerant number sequences
+
+Account numbers used to be derived from Account.objects.count() + 1, which
+scans the table on every signup and hands out duplicates when two members
+register at the same time. Numbers now come from a sequence instead:
+
+- PostgreSQL: a native sequence (nextval), created by migration 0011.
+- Other databases: a hi/lo allocator. Each process reserves a block of
+  SEQUENCE_BLOCK_SIZE values with one locked UPDATE of NumberSequence and
+  hands them out from memory, so the table is touched once per block.
+
+Values are unique but not gapless: a restarted process abandons the rest of
+its block.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+import threading
+
+ACCOUNT_NUMBER_SEQUENCE = 'account_number'
+
+# Native PostgreSQL sequence backing each named sequence
+POSTGRES_SEQUENCES = {
+    ACCOUNT_NUMBER_SEQUENCE: 'api_account_number_seq',
+}
+
+_blocks = {}
+_lock = threading.Lock()
+
+
+def _reserve_block(name, size):
+    from ..models import NumberSequence
+
+    with transaction.atomic():
+        NumberSequence.objects.get_or_create(name=name)
+        sequence = NumberSequence.objects.select_for_update().get(name=name)
+        start = sequence.next_value
+        sequence.next_value = start + size
+        sequence.save(update_fields=['next_value'])
+    return [start, start + size]
+
+
+def next_value(name):
+    """
+    Return the next value of a named sequence.
+
+    Args:
+        name: Sequence name (e.g. ACCOUNT_NUMBER_SEQUENCE)
+
+    Returns:
+        int: A value never returned before for this sequence
+    """
+    if connection.vendor == 'postgresql' and name in POSTGRES_SEQUENCES:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s)", [POSTGRES_SEQUENCES[name]])
+            return cursor.fetchone()[0]
+
+    with _lock:
+        block = _blocks.get(name)
+        if block is None or block[0] >= block[1]:
+            block = _blocks[name] = _reserve_block(name, getattr(settings, 'SEQUENCE_BLOCK_SIZE', 20))
+        value = block[0]
+        block[0] += 1
+    return value
+
+
+def restart(name, value):
+    """
+    Make `value` the next value handed out by a sequence.
+
+    Needed after bulk-loading rows that were numbered outside the sequence.
+    Blocks already reserved by other processes are not affected.
+    """
+    from ..models import NumberSequence
+
+    NumberSequence.objects.update_or_create(name=name, defaults={'next_value': value})
+    if connection.vendor == 'postgresql' and name in POSTGRES_SEQUENCES:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT setval(%s, %s, false)", [POSTGRES_SEQUENCES[name], value])
+    reset_blocks()
+
+
+def reset_blocks():
+    """Forget reserved blocks (used by tests that recreate the database)"""
+    with _lock:
+        _blocks.clear()
+
+
+def allocate_account_number():
+    """Return a new unique SACCO-############ account number"""
+    return f"SACCO-{next_value(ACCOUNT_NUMBER_SEQUENCE):012d}"
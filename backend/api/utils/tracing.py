@@ -0,0 +1,129 @@
+"""
+Sampled, redacted request tracing
+
+Replaces the print() debugging that used to dump sessions, cookies and
+headers on every request. A trace event is only built when its request is
+sampled, so a disabled tracer costs one dict lookup per call.
+
+Sample rates come from settings.REQUEST_TRACE_SAMPLE_RATES, keyed by URL
+name (e.g. 'dashboard-stats') or tracer name (e.g. 'auth'); a URL name entry
+wins. Each tracer decides once per request, so all of its events for a
+sampled request are logged together. Events go to the `api.trace.<name>`
+logger as one JSON line each.
+
+Usage:
+    tracer = get_tracer('dashboard')
+    tracer.event(request, 'dashboard.request', origin=lambda: request.headers.get('Origin'))
+"""
+from django.conf import settings
+import hashlib
+import json
+import logging
+import random
+
+SENSITIVE_MARKERS = ('session', 'cookie', 'csrf', 'token', 'password', 'otp', 'secret', 'authorization', 'key')
+
+_SAMPLED_ATTR = '_trace_sampled'
+_tracers = {}
+
+
+def fingerprint(value):
+    """Short stable hash for correlating a secret (e.g. a session key) without logging it"""
+    if not value:
+        return None
+    return hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:12]
+
+
+def redact(fields):
+    """Replace values of sensitive-looking keys; keeps *_fp fingerprints and *_names lists"""
+    cleaned = {}
+    for key, value in fields.items():
+        lowered = key.lower()
+        if lowered.endswith('_fp') or lowered.endswith('_names'):
+            cleaned[key] = value
+        elif any(marker in lowered for marker in SENSITIVE_MARKERS):
+            cleaned[key] = '[redacted]'
+        elif isinstance(value, dict):
+            cleaned[key] = redact(value)
+        else:
+            cleaned[key] = value
+    return cleaned
+
+
+class _LazyEvent:
+    """Builds the JSON line only if a handler actually emits the record"""
+
+    def __init__(self, event, route, fields):
+        self.event = event
+        self.route = route
+        self.fields = fields
+
+    def __str__(self):
+        resolved = {
+            key: value() if callable(value) else value
+            for key, value in self.fields.items()
+        }
+        payload = {'event': self.event, 'route': self.route, **redact(resolved)}
+        return json.dumps(payload, default=str)
+
+
+def _route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # DRF wraps the Django request
+        match = getattr(getattr(request, '_request', None), 'resolver_match', None)
+    return match.url_name if match else None
+
+
+class RequestTracer:
+    """Emits sampled, redacted trace events for a component"""
+
+    def __init__(self, name):
+        self.name = name
+        self.logger = logging.getLogger(f'api.trace.{name}')
+
+    def sampled(self, request):
+        """Whether this request is traced; decided once and remembered on the request"""
+        rates = getattr(settings, 'REQUEST_TRACE_SAMPLE_RATES', None)
+        if not rates:
+            return False
+
+        target = getattr(request, '_request', request)
+        decision = getattr(target, _SAMPLED_ATTR, {}).get(self.name)
+        if decision is not None:
+            return decision
+
+        route = _route_name(request)
+        rate = rates[route] if route in rates else rates.get(self.name, 0.0)
+        decision = rate > 0 and (rate >= 1 or random.random() < rate)
+
+        sampled = getattr(target, _SAMPLED_ATTR, None)
+        if sampled is None:
+            sampled = {}
+            try:
+                setattr(target, _SAMPLED_ATTR, sampled)
+            except AttributeError:
+                return decision
+        sampled[self.name] = decision
+        return decision
+
+    def event(self, request, event, **fields):
+        """
+        Record a trace event if the request is sampled.
+
+        Args:
+            request: Django or DRF request
+            event: Event name, e.g. 'auth.authenticate'
+            **fields: Values or zero-argument callables, evaluated only when emitted
+        """
+        if not self.sampled(request):
+            return
+        self.logger.info('%s', _LazyEvent(event, _route_name(request), fields))
+
+
+def get_tracer(name):
+    """Return the shared tracer for a component"""
+    tracer = _tracers.get(name)
+    if tracer is None:
+        tracer = _tracers[name] = RequestTracer(name)
+    return tracer
@@ -1,8 +1,11 @@
 from django.shortcuts import render
+from django.http import HttpResponse
+from django.views import View
 from rest_framework import viewsets, status, views
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.contrib.auth import authenticate, login, logout
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -21,6 +24,13 @@ from .serializers import (
     PasswordResetConfirmSerializer, UserSettingsSerializer,
     PushSubscriptionSerializer, PushNotificationSerializer
 )
+from .utils.dashboard_cache import invalidate_dashboard
+from .jobs import enqueue
+from .utils.tracing import get_tracer, fingerprint
+from .utils.profiling import external_call
+from .utils import metrics
+from .deposits import check_deposit, fail_deposit, needs_remote_check, first_check_at
+from .profile_images import SpooledMultiPartParser
 
 # Create your views here.
 
@@ -28,23 +38,25 @@ class UniversityViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = University.objects.filter(is_active=True)
     serializer_class = UniversitySerializer
     permission_classes = [AllowAny]
+    pagination_class = None  # Small reference list used by the registration form
 
 
 class CourseViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Course.objects.filter(is_active=True)
+    queryset = Course.objects.filter(is_active=True).select_related('university')
     serializer_class = CourseSerializer
     permission_classes = [AllowAny]
+    pagination_class = None  # Small reference list used by the registration form
     
     def get_queryset(self):
         """Filter courses by university if provided"""
-        queryset = Course.objects.filter(is_active=True)
+        queryset = Course.objects.filter(is_active=True).select_related('university')
         university_id = self.request.query_params.get('university', None)
         if university_id:
             queryset = queryset.filter(university_id=university_id)
         return queryset
 
 class CustomUserViewSet(viewsets.ModelViewSet):
-    queryset = CustomUser.objects.all()
+    queryset = CustomUser.objects.select_related('university', 'course')
     serializer_class = CustomUserSerializer
     permission_classes = [IsAuthenticated]
     
@@ -54,23 +66,21 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['patch'], url_path='update-profile')
+    @action(detail=False, methods=['patch'], url_path='update-profile',
+            parser_classes=[SpooledMultiPartParser, FormParser, JSONParser])
     def update_profile(self, request):
-        """Update current user's profile with Cloudinary image upload support"""
-        import cloudinary.uploader
+        """
+        Update current user's profile.
+
+        A new profile_image is downsized here and uploaded to Cloudinary by a
+        background job; profile_image_status tracks it (see api/profile_images.py).
+        """
+        from .profile_images import InvalidImage, downsize, queue_upload
         import logging
         logger = logging.getLogger(__name__)
         
         user = request.user
-        logger.info(f"=== Profile Update Debug ===")
-        logger.info(f"User: {user.username}")
-        logger.info(f"Is authenticated: {user.is_authenticated}")
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Content-Type: {request.content_type}")
-        logger.info(f"CSRF token in headers: {request.META.get('HTTP_X_CSRFTOKEN', 'NOT FOUND')}")
-        logger.info(f"Request data keys: {list(request.data.keys())}")
-        logger.info(f"Request FILES keys: {list(request.FILES.keys())}")
-        logger.info(f"=============================")
+        logger.info(f"Profile update for {user.username}: fields {list(request.data.keys())}")
         
         # Use dict() for MultiValueDict to avoid copy() issues
         data = {}
@@ -78,45 +88,29 @@ class CustomUserViewSet(viewsets.ModelViewSet):
             if key != 'profile_image':  # Skip file field
                 data[key] = value
         
-        logger.info(f"Processing data fields: {list(data.keys())}")
+        serializer = self.get_serializer(user, data=data, partial=True)
+        if not serializer.is_valid():
+            logger.error(f"Serializer validation errors: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Handle profile image upload to Cloudinary
+        # Validate and shrink the image before anything is saved
+        image = None
         if 'profile_image' in request.FILES:
+            image_file = request.FILES['profile_image']
             try:
-                image_file = request.FILES['profile_image']
-                logger.info(f"Uploading image: {image_file.name}, size: {image_file.size} bytes")
-                
-                # Upload to Cloudinary
-                upload_result = cloudinary.uploader.upload(
-                    image_file,
-                    folder='somasave/profiles',
-                    public_id=f'user_{user.id}',
-                    overwrite=True,
-                    resource_type='image',
-                    transformation=[
-                        {'width': 400, 'height': 400, 'crop': 'fill', 'gravity': 'face'},
-                        {'quality': 'auto:good'}
-                    ]
-                )
-                # Store the secure URL
-                data['profile_image'] = upload_result['secure_url']
-                logger.info(f"Image uploaded successfully to: {upload_result['secure_url']}")
-            except Exception as e:
-                logger.error(f"Image upload failed: {str(e)}", exc_info=True)
-                return Response(
-                    {'error': f'Image upload failed: {str(e)}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        logger.info(f"Updating profile with data: {data}")
-        serializer = self.get_serializer(user, data=data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            logger.info(f"Profile updated successfully for user: {user.username}")
-            return Response(serializer.data)
-        
-        logger.error(f"Serializer validation errors: {serializer.errors}")
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                image = downsize(image_file)
+            except InvalidImage as e:
+                logger.warning(f"Profile image rejected for {user.username}: {e}")
+                return Response({'error': f'Image upload failed: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+            finally:
+                image_file.close()  # Removes the spooled temporary file
+        
+        serializer.save()
+        if image is not None:
+            queue_upload(user, image)
+        invalidate_dashboard(user.pk)
+        logger.info(f"Profile updated successfully for user: {user.username}")
+        return Response(serializer.data)
     
     @action(detail=False, methods=['get', 'patch'], url_path='settings')
     def user_settings(self, request):
@@ -217,40 +211,14 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         # Generate and send OTP
         import random
         from django.utils import timezone
-        from django.core.mail import send_mail
-        from django.conf import settings
         
         otp = ''.join([str(random.randint(0, 9)) for _ in range(6)])
         user.otp_code = otp
         user.otp_created_at = timezone.now()
         user.save()
         
-        # Send OTP via email
-        try:
-            print(f"=== Sending 2FA OTP Email ===")
-            print(f"To: {user.email}")
-            print(f"OTP: {otp}")
-            print(f"From: {settings.DEFAULT_FROM_EMAIL}")
-            print(f"Email Host: {settings.EMAIL_HOST}")
-            print(f"============================")
-            
-            send_mail(
-                subject='SomaSave SACCO - Enable 2FA Verification Code',
-                message=f'Your verification code is: {otp}\n\nThis code will expire in 10 minutes.\n\nIf you did not request this, please ignore this email.',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
-            
-            print(f"✅ Email sent successfully to {user.email}")
-        except Exception as e:
-            print(f"❌ Failed to send email: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return Response(
-                {'error': f'Failed to send OTP: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        # Email the OTP from a background worker
+        enqueue('send_otp_email', {'user_id': user.id, 'purpose': 'enable_2fa'})
         
         return Response({
             'message': 'OTP sent to your email',
@@ -358,31 +326,14 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         # Generate and send OTP
         import random
         from django.utils import timezone
-        from django.core.mail import send_mail
-        from django.conf import settings
         
         otp = ''.join([str(random.randint(0, 9)) for _ in range(6)])
         user.otp_code = otp
         user.otp_created_at = timezone.now()
         user.save()
         
-        # Send OTP via email
-        try:
-            print(f"=== Sending Login OTP Email ===\nTo: {user.email}\nOTP: {otp}")
-            send_mail(
-                subject='SomaSave SACCO - Login Verification Code',
-                message=f'Your login verification code is: {otp}\n\nThis code will expire in 10 minutes.\n\nIf you did not attempt to log in, please secure your account immediately.',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
-            print(f"✅ Login OTP sent successfully")
-        except Exception as e:
-            print(f"❌ Failed to send login OTP: {str(e)}")
-            return Response(
-                {'error': f'Failed to send OTP: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        # Email the OTP from a background worker
+        enqueue('send_otp_email', {'user_id': user.id, 'purpose': 'login'})
         
         return Response({
             'message': 'OTP sent to your email',
@@ -390,16 +341,18 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         })
 
 
-class AccountViewSet(viewsets.ModelViewSet):
+class AccountViewSet(viewsets.ReadOnlyModelViewSet):
+    # Opened at registration; balances move only through api/ledger.py postings
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         """Filter accounts by current user if not staff"""
+        queryset = Account.objects.select_related('user')
         if self.request.user.is_staff:
-            return Account.objects.all()
-        return Account.objects.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
 
 class DepositViewSet(viewsets.ModelViewSet):
@@ -409,9 +362,10 @@ class DepositViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter deposits by current user if not staff"""
+        queryset = Deposit.objects.select_related('user')
         if self.request.user.is_staff:
-            return Deposit.objects.all()
-        return Deposit.objects.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
 
 class ShareTransactionViewSet(viewsets.ModelViewSet):
@@ -421,9 +375,10 @@ class ShareTransactionViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter share transactions by current user if not staff"""
+        queryset = ShareTransaction.objects.select_related('user')
         if self.request.user.is_staff:
-            return ShareTransaction.objects.all()
-        return ShareTransaction.objects.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
 
 class LoginActivityViewSet(viewsets.ReadOnlyModelViewSet):
@@ -433,13 +388,14 @@ class LoginActivityViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Filter login activities by current user if not staff"""
+        queryset = LoginActivity.objects.select_related('user')
         if self.request.user.is_staff:
-            return LoginActivity.objects.all()
-        return LoginActivity.objects.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
 
 class BorrowerViewSet(viewsets.ModelViewSet):
-    queryset = Borrower.objects.all()
+    queryset = Borrower.objects.select_related('user__university', 'user__course')
     serializer_class = BorrowerSerializer
     permission_classes = [IsAuthenticated]
 
@@ -451,11 +407,12 @@ class LoanViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter loans by current user if not staff"""
+        queryset = Loan.objects.select_related('borrower__user')
         if self.request.user.is_staff:
-            return Loan.objects.all()
+            return queryset
         try:
             borrower = self.request.user.borrower_profile
-            return Loan.objects.filter(borrower=borrower)
+            return queryset.filter(borrower=borrower)
         except Borrower.DoesNotExist:
             return Loan.objects.none()
     
@@ -468,9 +425,19 @@ class LoanViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        from django.db import transaction
+        from .loans import create_schedule
+
         loan = self.get_object()
-        loan.loan_status = 'APPROVED'
-        loan.save()
+        try:
+            with transaction.atomic():
+                loan.loan_status = 'APPROVED'
+                loan.save()
+                create_schedule(loan)
+        except ValueError as e:
+            # Non-positive amount or unsupported repayment terms; nothing was saved
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        invalidate_dashboard(loan.borrower.user_id)
         
         serializer = self.get_serializer(loan)
         return Response(serializer.data)
@@ -483,11 +450,12 @@ class PaymentViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter payments by current user if not staff"""
+        queryset = Payment.objects.select_related('borrower__user')
         if self.request.user.is_staff:
-            return Payment.objects.all()
+            return queryset
         try:
             borrower = self.request.user.borrower_profile
-            return Payment.objects.filter(borrower=borrower)
+            return queryset.filter(borrower=borrower)
         except Borrower.DoesNotExist:
             return Payment.objects.none()
 
@@ -499,7 +467,7 @@ class RepaymentScheduleViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class ReportViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Report.objects.all()
+    queryset = Report.objects.select_related('borrower__user')
     serializer_class = ReportSerializer
     permission_classes = [IsAuthenticated]
 
@@ -565,31 +533,14 @@ class LoginView(views.APIView):
                     # OTP not provided, need to send OTP
                     import random
                     from django.utils import timezone
-                    from django.core.mail import send_mail
-                    from django.conf import settings
                     
                     otp_code = ''.join([str(random.randint(0, 9)) for _ in range(6)])
                     user.otp_code = otp_code
                     user.otp_created_at = timezone.now()
                     user.save()
                     
-                    # Send OTP via email
-                    try:
-                        print(f"=== Sending 2FA Login OTP ===\nTo: {user.email}\nOTP: {otp_code}")
-                        send_mail(
-                            subject='SomaSave SACCO - Login Verification Code',
-                            message=f'Your login verification code is: {otp_code}\n\nThis code will expire in 10 minutes.\n\nIf you did not attempt to log in, please secure your account immediately.',
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[user.email],
-                            fail_silently=False,
-                        )
-                        print(f"✅ 2FA Login OTP sent successfully")
-                    except Exception as e:
-                        print(f"❌ Failed to send 2FA login OTP: {str(e)}")
-                        return Response(
-                            {'error': f'Failed to send OTP: {str(e)}'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                        )
+                    # Email the OTP from a background worker
+                    enqueue('send_otp_email', {'user_id': user.id, 'purpose': 'login'})
                     
                     return Response({
                         'requires_2fa': True,
@@ -633,20 +584,19 @@ class LoginView(views.APIView):
             # Proceed with login
             login(request, user)
             
-            # Debug: Check session after login
-            print(f"=== Login Success Debug ===")
-            print(f"User logged in: {user.username}")
-            print(f"Session key after login: {request.session.session_key}")
-            print(f"Session data: {dict(request.session)}")
-            print(f"AUTH_USER_ID: {request.session.get('_auth_user_id')}")
-            print(f"Set-Cookie header check")
-            print(f"===========================")
+            get_tracer('login').event(
+                request, 'login.success',
+                user_id=user.pk,
+                session_fp=lambda: fingerprint(request.session.session_key),
+            )
             
-            # Ensure session is saved
-            request.session.save()
+            # Sliding expiry starts now; SessionMiddleware saves the session once on the way out
+            from .middleware import SESSION_REFRESHED_KEY
+            import time
+            request.session[SESSION_REFRESHED_KEY] = int(time.time())
             
             # Get user's accounts
-            accounts = Account.objects.filter(user=user)
+            accounts = Account.objects.filter(user=user).select_related('user')
             
             # Log successful login
             try:
@@ -719,15 +669,13 @@ class CurrentUserView(views.APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        # Add debug logging
-        print(f"=== CurrentUserView Debug ===")
-        print(f"User: {request.user}")
-        print(f"Is authenticated: {request.user.is_authenticated}")
-        print(f"Session key: {request.session.session_key}")
-        print(f"Session data: {dict(request.session)}")
-        print(f"=============================")
+        get_tracer('current-user').event(
+            request, 'current_user.request',
+            user_id=request.user.pk,
+            session_fp=lambda: fingerprint(request.session.session_key),
+        )
         
-        accounts = Account.objects.filter(user=request.user)
+        accounts = Account.objects.filter(user=request.user).select_related('user')
         
         return Response({
             'user': CustomUserSerializer(request.user).data,
@@ -740,49 +688,33 @@ class DashboardStatsView(views.APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        from django.db.models import Sum, Count, Q
-        from datetime import datetime, timedelta
-        from decimal import Decimal
+        get_tracer('dashboard').event(
+            request, 'dashboard.request',
+            user_id=request.user.pk,
+            session_fp=lambda: fingerprint(request.session.session_key),
+            cookie_names=lambda: sorted(request.COOKIES),
+            header_names=lambda: sorted(request.headers),
+            origin=lambda: request.headers.get('Origin'),
+            referer=lambda: request.headers.get('Referer'),
+        )
         
-        # Debug logging
-        print(f"=== Dashboard Request Debug ===")
-        print(f"User: {request.user}")
-        print(f"Is authenticated: {request.user.is_authenticated}")
-        print(f"Session key: {request.session.session_key}")
-        print(f"Session data: {dict(request.session)}")
-        print(f"Cookies received: {request.COOKIES}")
-        print(f"All headers: {request.headers}")
-        print(f"AUTH_USER_ID in session: {request.session.get('_auth_user_id')}")
-        print(f"Origin: {request.headers.get('Origin', 'No origin header')}")
-        print(f"Referer: {request.headers.get('Referer', 'No referer')}")
-        print(f"================================")
+        from .utils.dashboard_cache import get_dashboard_payload
+        payload = get_dashboard_payload(request.user, lambda: self.build_payload(request.user))
+        return Response(payload)
+    
+    def build_payload(self, user):
+        """Build the dashboard payload (cached per user by get())"""
+        from decimal import Decimal
         
-        user = request.user
+        # Aggregates come from the precomputed summary (single primary-key read)
+        from .utils.member_summary import get_member_summary
+        summary = get_member_summary(user)
         
-        # Get accounts and total balance
         accounts = Account.objects.filter(user=user)
-        total_savings = accounts.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
-        
-        # Get active loans
-        try:
-            borrower = user.borrower_profile
-            active_loans = Loan.objects.filter(
-                borrower=borrower,
-                loan_status__in=['APPROVED', 'DISBURSED']
-            )
-            active_loans_count = active_loans.count()
-            total_loan_amount = active_loans.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        except Borrower.DoesNotExist:
-            active_loans_count = 0
-            total_loan_amount = Decimal('0.00')
-        
-        # Calculate dividends (using share transactions or a dividend model)
-        current_year = datetime.now().year
-        dividends = ShareTransaction.objects.filter(
-            user=user,
-            timestamp__year=current_year,
-            transaction_type='DIVIDEND'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        total_savings = summary.total_savings
+        active_loans_count = summary.active_loans_count
+        total_loan_amount = summary.active_loans_amount
+        dividends = summary.dividends_ytd
         
         # Get recent transactions (deposits and payments) - only COMPLETED
         recent_deposits = Deposit.objects.filter(user=user, status='SUCCESS').order_by('-created_at')[:5]
@@ -797,44 +729,36 @@ class DashboardStatsView(views.APIView):
                 'icon': 'add_circle'
             })
         
-        # Add loan payments if borrower exists
-        try:
-            borrower = user.borrower_profile
-            recent_payments = Payment.objects.filter(borrower=borrower)[:3]
-            for payment in recent_payments:
-                recent_transactions.append({
-                    'type': 'Loan Repayment',
-                    'amount': '-' + str(payment.amount),
-                    'date': payment.payment_date.strftime('%b %d, %Y'),
-                    'status': payment.payment_status,
-                    'icon': 'remove_circle'
-                })
-        except Borrower.DoesNotExist:
-            pass
+        # Add loan payments (empty for members without a borrower profile)
+        recent_payments = Payment.objects.filter(borrower__user=user)[:3]
+        for payment in recent_payments:
+            recent_transactions.append({
+                'type': 'Loan Repayment',
+                'amount': '-' + str(payment.amount),
+                'date': payment.payment_date.strftime('%b %d, %Y'),
+                'status': payment.payment_status,
+                'icon': 'remove_circle'
+            })
         
         # Sort by date (most recent first)
         recent_transactions = sorted(recent_transactions, key=lambda x: x['date'], reverse=True)[:5]
         
         # Calculate savings growth percentage (last 30 days)
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        deposits_last_month = Deposit.objects.filter(
-            user=user,
-            created_at__gte=thirty_days_ago,
-            status='COMPLETED'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        deposits_last_month = summary.deposits_30d
         
         if total_savings > 0:
             growth_percentage = (deposits_last_month / total_savings * 100)
         else:
             growth_percentage = Decimal('0.00')
         
-        return Response({
+        return {
             'user': CustomUserSerializer(user).data,
             'stats': {
                 'total_savings': str(total_savings),
                 'active_loans_count': active_loans_count,
                 'total_loan_amount': str(total_loan_amount),
                 'dividends': str(dividends),
+                'total_repayments': str(summary.total_repayments),
                 'savings_growth': f"{growth_percentage:.1f}%"
             },
             'recent_transactions': recent_transactions,
@@ -843,7 +767,57 @@ class DashboardStatsView(views.APIView):
                 'account_type': acc.account_type,
                 'balance': str(acc.balance)
             } for acc in accounts]
-        })
+        }
+
+
+class DashboardCacheStatsView(views.APIView):
+    """Dashboard cache effectiveness counters (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        from .utils.dashboard_cache import get_cache_stats
+        return Response(get_cache_stats())
+    
+    def delete(self, request):
+        """Reset the counters"""
+        from .utils.dashboard_cache import reset_cache_stats
+        reset_cache_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MetricsView(View):
+    """Prometheus scrape endpoint (bearer METRICS_TOKEN, or a staff session)"""
+    
+    def get(self, request):
+        from django.conf import settings
+        from django.utils.crypto import constant_time_compare
+        
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if token:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            allowed = constant_time_compare(supplied, token)
+        else:
+            allowed = request.user.is_authenticated and request.user.is_staff
+        
+        if not allowed:
+            return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+        
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfilingStatsView(views.APIView):
+    """Per-view timing, SQL and outbound HTTP breakdown for this process (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        from .utils.profiling import get_stats
+        return Response(get_stats(include_profiles=request.query_params.get('profiles') == '1'))
+    
+    def delete(self, request):
+        """Reset the aggregates"""
+        from .utils.profiling import reset_stats
+        reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -962,7 +936,8 @@ class TestEmailConfigView(views.APIView):
             )
             
             email_message.attach_alternative(html_message, "text/html")
-            email_message.send(fail_silently=False)
+            with external_call('smtp'):
+                email_message.send(fail_silently=False)
             
             logger.info(f"Test email sent successfully to {test_email}")
             
@@ -995,7 +970,7 @@ class InitiateDepositView(views.APIView):
         import uuid
         import logging
         from django.utils import timezone
-        from .relworx import RelworxPaymentGateway
+        from .relworx import get_gateway
         
         logger = logging.getLogger(__name__)
         user = request.user
@@ -1051,8 +1026,10 @@ class InitiateDepositView(views.APIView):
             user=user,
             tx_ref=tx_ref,
             amount=amount,
-            status='PENDING'
+            status='PENDING',
+            next_check_at=first_check_at()
         )
+        metrics.DEPOSIT_TRANSITIONS.inc(source='NEW', target='PENDING')
         
         logger.info(f"Deposit initiated: {tx_ref} for user {user.username}, amount: {amount}")
         logger.info(f"=== RELWORX PAYMENT REQUEST DEBUG ===")
@@ -1063,8 +1040,8 @@ class InitiateDepositView(views.APIView):
         logger.info(f"User: {user.first_name} {user.last_name}")
         logger.info(f"=====================================")
         
-        # Initialize Relworx gateway and request payment
-        relworx = RelworxPaymentGateway()
+        # Request payment through the shared Relworx gateway
+        relworx = get_gateway()
         result = relworx.request_payment(
             reference=tx_ref,
             msisdn=phone_number,
@@ -1074,9 +1051,8 @@ class InitiateDepositView(views.APIView):
         )
         
         if not result['success']:
-            # Mark deposit as failed
-            deposit.status = 'FAILED'
-            deposit.save()
+            # Mark deposit as failed (counted and invalidated like every other transition)
+            fail_deposit(deposit)
             
             logger.error(f"Relworx payment request failed: {result.get('error')}")
             return Response({
@@ -1108,7 +1084,7 @@ class InitiateDepositView(views.APIView):
 
 
 class VerifyDepositView(views.APIView):
-    """Verify deposit payment status with Relworx"""
+    """Report deposit payment status, checking with Relworx only for long-pending deposits"""
     permission_classes = [IsAuthenticated]
     
     def options(self, request, *args, **kwargs):
@@ -1117,10 +1093,6 @@ class VerifyDepositView(views.APIView):
     
     def post(self, request):
         import logging
-        from decimal import Decimal
-        from django.utils import timezone
-        from django.db import transaction
-        from .relworx import RelworxPaymentGateway
         
         logger = logging.getLogger(__name__)
         user = request.user
@@ -1153,60 +1125,34 @@ class VerifyDepositView(views.APIView):
                     'status': deposit.status
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Check status with Relworx
-            relworx = RelworxPaymentGateway()
-            result = relworx.check_request_status(customer_reference=tx_ref)
+            # The webhook and the reconciliation poller settle deposits; only ask
+            # Relworx directly once a deposit has been pending for a while
+            payment_data = {}
+            remote = needs_remote_check(deposit)
+            metrics.DEPOSIT_VERIFICATIONS.inc(mode='remote' if remote else 'local')
+            if remote:
+                payment_data = check_deposit(deposit)
+                if payment_data is None:
+                    return Response({
+                        'error': 'Failed to verify payment status',
+                        'details': 'Payment provider did not respond'
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                logger.info(f"Payment status from Relworx: {deposit.status} for {tx_ref}")
             
-            if not result['success']:
+            if deposit.status == 'COMPLETED':
+                account = Account.objects.get(user=user, account_type='SAVINGS')
                 return Response({
-                    'error': 'Failed to verify payment status',
-                    'details': result.get('error')
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            payment_data = result['data']
-            payment_status = payment_data.get('request_status') or payment_data.get('status')
-            
-            logger.info(f"Payment status from Relworx: {payment_status} for {tx_ref}")
-            
-            # Update deposit based on status
-            if payment_status == 'success':
-                with transaction.atomic():
-                    # Update deposit record
-                    deposit.status = 'COMPLETED'
-                    deposit.transaction_id = payment_data.get('provider_transaction_id', deposit.transaction_id)
-                    deposit.save()
-                    
-                    # Get or create user's savings account
-                    account, created = Account.objects.get_or_create(
-                        user=user,
-                        account_type='SAVINGS',
-                        defaults={
-                            'account_number': f"SAV{user.id:06d}",
-                            'balance': Decimal('0.00')
-                        }
-                    )
-                    
-                    # Update account balance
-                    account.balance += Decimal(str(deposit.amount))
-                    account.save()
-                    
-                    logger.info(f"Deposit completed: {tx_ref}, amount: {deposit.amount}, new balance: {account.balance}")
-                    
-                    return Response({
-                        'message': 'Deposit successful',
-                        'tx_ref': tx_ref,
-                        'amount': float(deposit.amount),
-                        'new_balance': float(account.balance),
-                        'status': 'COMPLETED',
-                        'provider_transaction_id': payment_data.get('provider_transaction_id')
-                    })
+                    'message': 'Deposit successful',
+                    'tx_ref': tx_ref,
+                    'amount': float(deposit.amount),
+                    'new_balance': float(account.balance),
+                    'status': 'COMPLETED',
+                    'provider_transaction_id': payment_data.get('provider_transaction_id')
+                })
                     
-            elif payment_status in ['failed', 'cancelled']:
+            elif deposit.status == 'FAILED':
                 # Payment failed or cancelled
-                deposit.status = 'FAILED'
-                deposit.save()
-                
-                logger.warning(f"Deposit failed: {tx_ref}, status: {payment_status}")
+                logger.warning(f"Deposit failed: {tx_ref}")
                 
                 return Response({
                     'error': 'Payment failed or was cancelled',
@@ -1238,15 +1184,28 @@ class RelworxWebhookView(views.APIView):
     """Handle webhook callbacks from Relworx"""
     permission_classes = [AllowAny]  # Webhooks don't use authentication
     
+    # Response status -> result label on somasave_webhook_duration_seconds
+    METRIC_RESULTS = {200: 'accepted', 401: 'rejected'}
+    
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
         return super().dispatch(*args, **kwargs)
     
     def post(self, request):
+        import time
+        
+        started = time.perf_counter()
+        response = self.process(request)
+        metrics.WEBHOOK_SECONDS.observe(
+            time.perf_counter() - started,
+            result=self.METRIC_RESULTS.get(response.status_code, 'error')
+        )
+        return response
+    
+    def process(self, request):
         import logging
-        from decimal import Decimal
-        from django.db import transaction
-        from .relworx import RelworxPaymentGateway
+        from .relworx import get_gateway
+        from .webhooks import ingest
         
         logger = logging.getLogger(__name__)
         
@@ -1258,7 +1217,7 @@ class RelworxWebhookView(views.APIView):
             return Response({'error': 'Missing signature'}, status=status.HTTP_401_UNAUTHORIZED)
         
         # Parse signature header: "t=timestamp,v=signature"
-        parts = dict(part.split('=') for part in signature_header.split(','))
+        parts = dict(part.split('=', 1) for part in signature_header.split(',') if '=' in part)
         timestamp = parts.get('t')
         signature = parts.get('v')
         
@@ -1274,7 +1233,7 @@ class RelworxWebhookView(views.APIView):
         }
         
         # Verify signature
-        relworx = RelworxPaymentGateway()
+        relworx = get_gateway()
         webhook_url = request.build_absolute_uri()
         
         is_valid = relworx.verify_webhook_signature(
@@ -1288,84 +1247,17 @@ class RelworxWebhookView(views.APIView):
             logger.warning(f"Invalid webhook signature for {webhook_data.get('customer_reference')}")
             return Response({'error': 'Invalid signature'}, status=status.HTTP_401_UNAUTHORIZED)
         
-        logger.info(f"Valid webhook received: {webhook_data}")
-        
-        # Process the webhook
-        customer_reference = webhook_data.get('customer_reference')
-        payment_status = webhook_data.get('status')
-        internal_reference = webhook_data.get('internal_reference')
-        
+        # Store and acknowledge; settlement runs in the process_webhook_event job
         try:
-            # Find the deposit by customer reference (our tx_ref)
-            deposit = Deposit.objects.get(tx_ref=customer_reference)
-            
-            if deposit.status != 'PENDING':
-                # Already processed, acknowledge webhook
-                logger.info(f"Webhook for already processed transaction: {customer_reference}")
-                return Response({'success': True, 'message': 'Already processed'}, status=status.HTTP_200_OK)
-            
-            if payment_status == 'success':
-                with transaction.atomic():
-                    # Update deposit record
-                    deposit.status = 'COMPLETED'
-                    deposit.transaction_id = internal_reference or deposit.transaction_id
-                    deposit.save()
-                    
-                    # Get or create user's savings account
-                    account, created = Account.objects.get_or_create(
-                        user=deposit.user,
-                        account_type='SAVINGS',
-                        defaults={
-                            'account_number': f"SAV{deposit.user.id:06d}",
-                            'balance': Decimal('0.00')
-                        }
-                    )
-                    
-                    # Update account balance
-                    account.balance += Decimal(str(deposit.amount))
-                    account.save()
-                    
-                    logger.info(f"Webhook processed: {customer_reference}, amount: {deposit.amount}, new balance: {account.balance}")
-                    
-                    # Send push notification to user
-                    try:
-                        from .utils.push_notifications import send_push_notification
-                        subscriptions = PushSubscription.objects.filter(
-                            user=deposit.user,
-                            is_active=True
-                        )
-                        
-                        for subscription in subscriptions:
-                            try:
-                                send_push_notification(
-                                    subscription,
-                                    title='Deposit Confirmed! 🎉',
-                                    body=f'Your deposit of UGX {deposit.amount:,.0f} has been credited to your account',
-                                    url='/member-portal/transactions',
-                                    icon='/icon-192x192.png'
-                                )
-                            except Exception as e:
-                                logger.error(f"Failed to send push notification: {str(e)}")
-                    except Exception as e:
-                        logger.error(f"Push notification error: {str(e)}")
-                    
-                    # TODO: Send email notification to user
-                    
-            elif payment_status in ['failed', 'cancelled']:
-                deposit.status = 'FAILED'
-                deposit.save()
-                logger.info(f"Webhook: Payment failed for {customer_reference}")
-            
-            # Acknowledge webhook
-            return Response({'success': True}, status=status.HTTP_200_OK)
-            
-        except Deposit.DoesNotExist:
-            logger.error(f"Webhook: Deposit not found for reference {customer_reference}")
-            return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
-            
+            event, created = ingest(webhook_data, signature_timestamp=timestamp)
         except Exception as e:
             logger.error(f"Webhook error: {str(e)}", exc_info=True)
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({'error': 'Could not record webhook'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        if not created:
+            logger.info(f"Duplicate webhook delivery for {webhook_data.get('customer_reference')}")
+        
+        return Response({'success': True}, status=status.HTTP_200_OK)
 
 
 class PushSubscriptionViewSet(viewsets.ModelViewSet):
@@ -1528,6 +1420,9 @@ class PushNotificationViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Broadcast notification to all active users (staff only)
         
+        Delivery is queued as a send_broadcast_push job; the response is 202
+        with the broadcast's notification_id, whose status becomes SENT or FAILED.
+        
         POST data:
         {
             "title": "Upcoming Event",
@@ -1554,41 +1449,21 @@ class PushNotificationViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            from .utils.push_notifications import send_bulk_notification
-            
-            # Get all active users
-            users = CustomUser.objects.filter(is_active=True)
-            
-            # Send bulk notification
-            results = send_bulk_notification(
-                users=users,
-                title=title,
-                body=body,
-                url=url,
-                icon=icon
-            )
-            
-            # Create notification record (without specific user)
+        from django.db import transaction
+        
+        # The fan-out runs in the job worker; the broadcast's own record tracks its outcome
+        with transaction.atomic():
             notification = PushNotification.objects.create(
                 title=title,
                 body=body,
                 url=url,
                 icon=icon,
-                status='SENT' if results['sent'] > 0 else 'FAILED',
-                sent_at=timezone.now() if results['sent'] > 0 else None
+                status='PENDING'
             )
-            
-            return Response({
-                'message': 'Broadcast sent successfully',
-                'recipients': users.count(),
-                'sent': results['sent'],
-                'failed': results['failed'],
-                'notification_id': notification.id
-            })
+            enqueue('send_broadcast_push', {'notification_id': notification.id})
         
-        except Exception as e:
-            return Response(
-                {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        return Response({
+            'message': 'Broadcast queued',
+            'recipients': CustomUser.objects.filter(is_active=True).count(),
+            'notification_id': notification.id
+        }, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,177 @@
+"""
+Relworx webhook inbox
+
+RelworxWebhookView only verifies the signature, stores the callback as a
+WebhookEvent and queues a `process_webhook_event` job, then acknowledges.
+Nothing slow (deposit settlement, ledger posting, push) runs before the
+acknowledgement, so Relworx stops retrying on slow responses.
+
+Relworx retries deliver the same event again; the unique (provider,
+event_key) constraint turns those into a `deliveries` bump on the existing
+row. Processing locks the event row and every earlier unprocessed event for
+the same deposit, applies them in arrival order and marks them processed in
+the same transaction as their effects, so each event takes effect once.
+Settlement itself is idempotent (complete_deposit/fail_deposit only move
+PENDING deposits, ledger postings are keyed by tx_ref), so replaying events
+with `python manage.py replay_webhooks` is safe.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .utils import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROVIDER = 'relworx'
+# Processing attempts before an event is marked FAILED (and left for replay)
+MAX_ATTEMPTS = 5
+
+
+def event_key(payload):
+    """Identity of a Relworx callback; a retried delivery produces the same key"""
+    return ':'.join(str(payload.get(field) or '') for field in ('internal_reference', 'customer_reference', 'status'))[:255]
+
+
+def ingest(payload, signature_timestamp=''):
+    """
+    Store a verified callback and queue it for processing.
+
+    Returns:
+        tuple: (WebhookEvent, created) where created is False for a retried delivery
+    """
+    from .models import WebhookEvent
+    from .jobs import enqueue
+
+    key = event_key(payload)
+    try:
+        with transaction.atomic():
+            event = WebhookEvent.objects.create(
+                provider=PROVIDER,
+                event_key=key,
+                reference=payload.get('customer_reference') or '',
+                payload=payload,
+                signature_timestamp=signature_timestamp or '',
+            )
+            enqueue('process_webhook_event', {'event_id': event.pk})
+    except IntegrityError:
+        WebhookEvent.objects.filter(provider=PROVIDER, event_key=key).update(deliveries=F('deliveries') + 1)
+        metrics.WEBHOOK_EVENTS.inc(result='duplicate')
+        return WebhookEvent.objects.get(provider=PROVIDER, event_key=key), False
+
+    return event, True
+
+
+def _apply(event):
+    """Settle the deposit an event refers to; returns the event's final status"""
+    from .models import Deposit
+    from .deposits import complete_deposit, fail_deposit, normalize_status
+
+    payment_status = event.payload.get('status')
+    deposit = Deposit.objects.filter(tx_ref=event.reference).first()
+
+    if deposit is None:
+        event.last_error = f"No deposit with reference {event.reference}"
+        logger.error(f"Webhook: Deposit not found for reference {event.reference}")
+        return 'IGNORED'
+
+    if deposit.status != 'PENDING':
+        logger.info(f"Webhook for already processed transaction: {event.reference}")
+        return 'IGNORED'
+
+    # Same mapping as the poller and reconcile_deposits
+    outcome = normalize_status(payment_status)
+
+    if outcome == 'success':
+        account, completed = complete_deposit(deposit, transaction_id=event.payload.get('internal_reference'))
+        if completed:
+            logger.info(f"Webhook processed: {event.reference}, amount: {deposit.amount}, new balance: {account.balance}")
+        return 'PROCESSED'
+
+    if outcome == 'failed':
+        fail_deposit(deposit)
+        logger.info(f"Webhook: Payment failed for {event.reference}")
+        return 'PROCESSED'
+
+    logger.info(f"Webhook: status '{payment_status}' for {event.reference} needs no action")
+    return 'IGNORED'
+
+
+def process_event(event_id):
+    """
+    Process an event together with any earlier unprocessed events for the same deposit.
+
+    Returns:
+        int: Number of events processed
+    """
+    from .models import WebhookEvent
+
+    event = WebhookEvent.objects.filter(pk=event_id).only('provider', 'reference').first()
+    if event is None:
+        return 0
+
+    processed = 0
+    with transaction.atomic():
+        # Locked in id order: concurrent jobs for one deposit queue up behind each other
+        pending = list(
+            WebhookEvent.objects.select_for_update()
+            .filter(provider=event.provider, reference=event.reference, status='RECEIVED', pk__lte=event_id)
+            .order_by('pk')
+        )
+        now = timezone.now()
+        for pending_event in pending:
+            pending_event.attempts += 1
+            pending_event.status = _apply(pending_event)
+            pending_event.processed_at = now
+            pending_event.save(update_fields=['status', 'attempts', 'processed_at', 'last_error'])
+            metrics.WEBHOOK_EVENTS.inc(result=pending_event.status.lower())
+            metrics.WEBHOOK_PROCESSING_LAG.observe((now - pending_event.received_at).total_seconds())
+            processed += 1
+
+    return processed
+
+
+def record_failure(event_id, error):
+    """Note a processing error on the event; the job is retried until MAX_ATTEMPTS"""
+    from .models import WebhookEvent
+
+    events = WebhookEvent.objects.filter(pk=event_id, status='RECEIVED')
+    events.update(attempts=F('attempts') + 1, last_error=str(error)[:2000])
+    if events.filter(attempts__gte=MAX_ATTEMPTS).update(status='FAILED', processed_at=timezone.now()):
+        metrics.WEBHOOK_EVENTS.inc(result='failed')
+        logger.error(f"Webhook event {event_id} failed after {MAX_ATTEMPTS} attempts: {error}")
+
+
+def select_events(since=None, until=None, reference=None, statuses=None, event_ids=None):
+    """Stored events received in [since, until), optionally narrowed by reference, status or id"""
+    from .models import WebhookEvent
+
+    events = WebhookEvent.objects.filter(provider=PROVIDER)
+    if event_ids is not None:
+        events = events.filter(pk__in=event_ids)
+    if statuses:
+        events = events.filter(status__in=statuses)
+    if since is not None:
+        events = events.filter(received_at__gte=since)
+    if until is not None:
+        events = events.filter(received_at__lt=until)
+    if reference:
+        events = events.filter(reference=reference)
+    return events
+
+
+def replay(since=None, until=None, reference=None, statuses=None, event_ids=None):
+    """
+    Reprocess stored events received in a time range, oldest first.
+
+    Returns:
+        int: Number of events replayed
+    """
+    from .models import WebhookEvent
+
+    events = select_events(since, until, reference, statuses, event_ids)
+    replayed = 0
+    for event_id in list(events.order_by('pk').values_list('pk', flat=True)):
+        WebhookEvent.objects.filter(pk=event_id).update(status='RECEIVED', processed_at=None)
+        replayed += process_event(event_id)
+    return replayed
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings, loaded automatically when gunicorn starts in this directory
+
+    gunicorn somasave_backend.wsgi
+
+Every worker thread keeps one persistent database connection (CONN_MAX_AGE),
+so WEB_CONCURRENCY x GUNICORN_THREADS is the number of connections the web
+service holds open.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+# Recycle workers now and then; their connections are closed on exit
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+
+def worker_exit(server, worker):
+    """Close the worker's persistent connections instead of leaving them to time out"""
+    from django.db import connections
+
+    connections.close_all()
@@ -1,5 +1,7 @@
 from pathlib import Path
 import os
+import sys
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -42,9 +44,12 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'api.CustomUser'
 
 MIDDLEWARE = [
+    'api.middleware.RequestProfilingMiddleware',
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'api.middleware.SlidingSessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,19 +84,54 @@ WSGI_APPLICATION = 'somasave_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('DB_NAME'),
-        'USER': os.getenv('DB_USER'),
-        'PASSWORD': os.getenv('DB_PASSWORD'),
-        'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT', '5432'),
-        'OPTIONS': {
-            'sslmode': 'require',
-        },
+# PostgreSQL unless DB_ENGINE=sqlite asks for a local SQLite file (development).
+# A missing DB_NAME is an error rather than a silent switch to an empty SQLite
+# database. `manage.py test` and `benchmark_api` build a throwaway database, so
+# they default to SQLite when DB_NAME is unset.
+#
+# Connections are persistent: each gunicorn worker thread keeps one open for
+# DB_CONN_MAX_AGE seconds instead of paying a TCP + SSL handshake per request,
+# and checks it is still alive before reusing it. Size the server's
+# max_connections for WEB_CONCURRENCY x GUNICORN_THREADS plus the job worker
+# threads. Set DB_POOLER=pgbouncer when connecting through PgBouncer in
+# transaction mode (DB_HOST/DB_PORT pointing at the pooler).
+THROWAWAY_DATABASE_COMMANDS = ('test', 'benchmark_api')
+DB_ENGINE = os.getenv('DB_ENGINE') or (
+    'sqlite' if not os.getenv('DB_NAME') and sys.argv[1:2] and sys.argv[1] in THROWAWAY_DATABASE_COMMANDS
+    else 'postgresql'
+)
+if DB_ENGINE not in ('postgresql', 'sqlite'):
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'postgresql' or 'sqlite', not {DB_ENGINE!r}")
+if DB_ENGINE == 'postgresql' and not os.getenv('DB_NAME'):
+    raise ImproperlyConfigured('DB_NAME is not set; set DB_ENGINE=sqlite to use a local SQLite database')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME'),
+            'USER': os.getenv('DB_USER'),
+            'PASSWORD': os.getenv('DB_PASSWORD'),
+            'HOST': os.getenv('DB_HOST'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+            'OPTIONS': {
+                'sslmode': os.getenv('DB_SSLMODE', 'require'),
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+            },
+        }
+    }
+    if os.getenv('DB_POOLER') == 'pgbouncer':
+        # Server-side cursors do not survive transaction pooling
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
 
 
 # Password validation
@@ -183,6 +223,38 @@ CSRF_TRUSTED_ORIGINS = [
     "http://127.0.0.1:8000",
 ]
 
+# Cache settings
+# Defaults to an in-process cache; point CACHE_BACKEND/CACHE_LOCATION at a
+# file or Redis cache to share entries between gunicorn workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'somasave-default'),
+    },
+    # Session store in front of django_session (see SESSION_ENGINE). Only used when it is
+    # shared between web processes (Redis, memcached, ...): with a per-process cache a
+    # logout in one worker would not be seen by the others until the cached copy expired.
+    'sessions': {
+        'BACKEND': os.getenv('SESSION_CACHE_BACKEND', os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')),
+        'LOCATION': os.getenv('SESSION_CACHE_LOCATION', os.getenv('CACHE_LOCATION', 'somasave-sessions')),
+    },
+}
+
+# Caches that live inside one process; entries and deletes are invisible to other
+# gunicorn workers and to the job worker
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Dashboard payload cache
+# Deposits settle in the job worker, whose invalidation must reach every web worker,
+# so the cache is only used when its backend is shared (Redis, memcached, file).
+DASHBOARD_CACHE_ALIAS = os.getenv('DASHBOARD_CACHE_ALIAS', 'default')
+DASHBOARD_CACHE_SHARED = CACHES[DASHBOARD_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+DASHBOARD_CACHE_ENABLED = DASHBOARD_CACHE_SHARED and os.getenv('DASHBOARD_CACHE_ENABLED', 'True') == 'True'
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '60'))  # seconds
+
 # Session settings
 SESSION_COOKIE_SAMESITE = 'None'  # None required for cross-origin cookies
 SESSION_COOKIE_SECURE = True  # Must be True when SameSite=None
@@ -190,7 +262,21 @@ SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_COOKIE_DOMAIN = None  # Allow cookies for localhost
 SESSION_COOKIE_PATH = '/'
-SESSION_SAVE_EVERY_REQUEST = True
+# Reads are served from the 'sessions' cache and fall back to django_session; writes go to both.
+# Without a shared session cache, sessions are read from django_session only.
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_CACHE_SHARED = CACHES[SESSION_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SESSION_CACHE_SHARED else 'django.contrib.sessions.backends.db',
+)
+if not SESSION_CACHE_SHARED and SESSION_ENGINE in ('django.contrib.sessions.backends.cached_db',
+                                                   'django.contrib.sessions.backends.cache'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Sessions are only written when they change. SlidingSessionMiddleware extends the expiry
+# of active sessions, at most once every SESSION_REFRESH_INTERVAL seconds.
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = int(os.getenv('SESSION_REFRESH_INTERVAL', '900'))
 
 # CSRF settings
 CSRF_COOKIE_SAMESITE = 'None'  # None required for cross-origin cookies
@@ -203,6 +289,16 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
 
+# Profile images: the upload is spooled to a temp file, checked and downsized with Pillow
+# (long edge PROFILE_IMAGE_MAX_DIMENSION px), then uploaded to Cloudinary by a background job
+PROFILE_IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('PROFILE_IMAGE_MAX_UPLOAD_SIZE', '10485760'))  # 10MB
+PROFILE_IMAGE_MAX_DIMENSION = int(os.getenv('PROFILE_IMAGE_MAX_DIMENSION', '800'))
+PROFILE_IMAGE_MAX_PIXELS = int(os.getenv('PROFILE_IMAGE_MAX_PIXELS', '40000000'))  # Rejects decompression bombs
+
+# List endpoint page sizes (cursor pagination, ?page_size= up to the maximum)
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '50'))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '200'))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -219,6 +315,8 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.ModelOrderingCursorPagination',
+    'PAGE_SIZE': API_PAGE_SIZE,
 }
 
 # Email Configuration
@@ -247,6 +345,10 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'SomaSave SACCO <info@somas
 SERVER_EMAIL = os.getenv('SERVER_EMAIL', 'info@somasave.com')
 EMAIL_TIMEOUT = 30  # 30 seconds timeout for email operations
 
+# Job workers keep their SMTP connection / Resend session open between messages (api/mailer.py)
+EMAIL_CONNECTION_IDLE_TIMEOUT = int(os.getenv('EMAIL_CONNECTION_IDLE_TIMEOUT', '60'))  # Seconds before reconnecting
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '50'))  # Messages per Resend batch call
+
 # Frontend URL for password reset links
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'https://somasave.com')
 
@@ -284,6 +386,16 @@ RELWORX_ACCOUNT_NO = os.getenv('RELWORX_ACCOUNT_NO', 'RELEAE2072EE4')
 RELWORX_WEBHOOK_KEY = os.getenv('RELWORX_WEBHOOK_KEY', '191dc8aec53073d24fbd357368')
 RELWORX_API_URL = 'https://payments.relworx.com/api'
 
+# Relworx HTTP client: connect/read timeouts in seconds, keep-alive pool size,
+# retries for idempotent status lookups, and the circuit breaker that fails fast
+# after consecutive provider errors
+RELWORX_CONNECT_TIMEOUT = float(os.getenv('RELWORX_CONNECT_TIMEOUT', '3.05'))
+RELWORX_READ_TIMEOUT = float(os.getenv('RELWORX_READ_TIMEOUT', '20'))
+RELWORX_POOL_MAXSIZE = int(os.getenv('RELWORX_POOL_MAXSIZE', '10'))
+RELWORX_STATUS_RETRIES = int(os.getenv('RELWORX_STATUS_RETRIES', '2'))
+RELWORX_BREAKER_THRESHOLD = int(os.getenv('RELWORX_BREAKER_THRESHOLD', '5'))
+RELWORX_BREAKER_RESET = int(os.getenv('RELWORX_BREAKER_RESET', '30'))  # Seconds before a trial request
+
 logger.info("=" * 60)
 logger.info("RELWORX PAYMENT CONFIGURATION")
 logger.info(f"RELWORX_API_KEY configured: {bool(RELWORX_API_KEY)}")
@@ -296,6 +408,82 @@ VAPID_PUBLIC_KEY = os.getenv('VAPID_PUBLIC_KEY', '')
 VAPID_PRIVATE_KEY = os.getenv('VAPID_PRIVATE_KEY', '')
 VAPID_ADMIN_EMAIL = os.getenv('VAPID_ADMIN_EMAIL', 'info@somasave.com')
 
+# Request profiling (api/utils/profiling.py): per-view wall time, SQL and outbound HTTP
+# histograms, readable by staff at /api/profiling/stats/. Off by default.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+# Keep cProfile output for the N slowest sampled requests (0 disables cProfile)
+PROFILING_CPROFILE_TOP = int(os.getenv('PROFILING_CPROFILE_TOP', '0'))
+PROFILING_CPROFILE_SAMPLE_RATE = float(os.getenv('PROFILING_CPROFILE_SAMPLE_RATE', '0.1'))
+# Directory to write .prof files for the kept requests (optional)
+PROFILING_CPROFILE_DIR = os.getenv('PROFILING_CPROFILE_DIR', '')
+
+# Prometheus metrics at /metrics (api/utils/metrics.py)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Bearer token the scraper must send; without one only staff sessions can read /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Shared directory for per-process snapshots under gunicorn (empty it on deploy)
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Request tracing (api/utils/tracing.py): sample rates keyed by URL name or tracer name
+# ('auth', 'login', 'current-user', 'dashboard'), e.g. REQUEST_TRACE_SAMPLE_RATES=auth=0.01,dashboard-stats=0.1
+# Empty (the default) disables tracing. Traces are logged to api.trace.* as JSON lines.
+REQUEST_TRACE_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split('=', 1) for item in os.getenv('REQUEST_TRACE_SAMPLE_RATES', '').split(',') if '=' in item
+    )
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.trace': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Values each process reserves at once from non-PostgreSQL sequences (api/utils/sequences.py)
+SEQUENCE_BLOCK_SIZE = int(os.getenv('SEQUENCE_BLOCK_SIZE', '20'))
+
+# Background jobs (api/jobs.py): run `python manage.py run_worker` alongside the web process.
+# JOBS_EAGER runs jobs in-process right after the request commits (local development only).
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'False') == 'True'
+JOBS_WORKER_THREADS = int(os.getenv('JOBS_WORKER_THREADS', '4'))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '1.0'))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '5'))
+JOBS_VISIBILITY_TIMEOUT = int(os.getenv('JOBS_VISIBILITY_TIMEOUT', '300'))  # Seconds a claimed job stays leased
+JOBS_RETRY_BASE_DELAY = int(os.getenv('JOBS_RETRY_BASE_DELAY', '10'))
+JOBS_RETRY_MAX_DELAY = int(os.getenv('JOBS_RETRY_MAX_DELAY', '3600'))
+
+# Pending deposit reconciliation (api/deposits.py, `manage.py poll_pending_deposits --loop`).
+# Checks back off exponentially from DEPOSIT_POLL_BASE_DELAY to DEPOSIT_POLL_MAX_DELAY seconds;
+# VerifyDepositView only calls Relworx for deposits pending longer than DEPOSIT_VERIFY_REMOTE_AFTER.
+DEPOSIT_POLL_INTERVAL = float(os.getenv('DEPOSIT_POLL_INTERVAL', '10'))
+DEPOSIT_POLL_BATCH_SIZE = int(os.getenv('DEPOSIT_POLL_BATCH_SIZE', '200'))
+DEPOSIT_POLL_MAX_STATUS_CHECKS = int(os.getenv('DEPOSIT_POLL_MAX_STATUS_CHECKS', '20'))
+DEPOSIT_POLL_BASE_DELAY = int(os.getenv('DEPOSIT_POLL_BASE_DELAY', '15'))
+DEPOSIT_POLL_MAX_DELAY = int(os.getenv('DEPOSIT_POLL_MAX_DELAY', '1800'))
+DEPOSIT_POLL_MAX_AGE = int(os.getenv('DEPOSIT_POLL_MAX_AGE', '86400'))
+DEPOSIT_VERIFY_REMOTE_AFTER = int(os.getenv('DEPOSIT_VERIFY_REMOTE_AFTER', '120'))
+
+# Push fan-out: concurrent deliveries per broadcast (also the HTTP pool size),
+# per-request timeout in seconds, and how long push services should hold
+# undelivered messages
+PUSH_FANOUT_WORKERS = int(os.getenv('PUSH_FANOUT_WORKERS', '16'))
+PUSH_FANOUT_CHUNK_SIZE = int(os.getenv('PUSH_FANOUT_CHUNK_SIZE', '1000'))
+PUSH_TIMEOUT = float(os.getenv('PUSH_TIMEOUT', '10'))
+PUSH_TTL = int(os.getenv('PUSH_TTL', str(24 * 60 * 60)))
+
 logger.info("=" * 60)
 logger.info("PUSH NOTIFICATIONS CONFIGURATION")
 logger.info(f"VAPID_PUBLIC_KEY configured: {bool(VAPID_PUBLIC_KEY)}")
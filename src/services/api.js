@@ -240,7 +240,9 @@ const api = {
         throw new Error('Failed to fetch accounts');
       }
       
-      return response.json();
+      // List endpoints are cursor-paginated: { next, previous, results }
+      const data = await response.json();
+      return data.results ?? data;
     },
   },
 
@@ -255,7 +257,9 @@ const api = {
         throw new Error('Failed to fetch deposits');
       }
       
-      return response.json();
+      // List endpoints are cursor-paginated: { next, previous, results }
+      const data = await response.json();
+      return data.results ?? data;
     },
   },
 
@@ -270,7 +274,9 @@ const api = {
         throw new Error('Failed to fetch loans');
       }
       
-      return response.json();
+      // List endpoints are cursor-paginated: { next, previous, results }
+      const data = await response.json();
+      return data.results ?? data;
     },
 
     apply: async (loanData) => {